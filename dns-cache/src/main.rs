@@ -246,7 +246,8 @@ async fn handle_request(cache: Cache, request_message: dns_cache::Request, reque
                 let timer = QUERY_RESPONSE_TIME.with_label_values(&["query"]).start_timer();
                 let timer_axfr = QUERY_RESPONSE_TIME.with_label_values(&["axfr"]).start_timer();
 
-                if request_message.query.query_type() == trust_dns_proto::rr::record_type::RecordType::AXFR {
+                if request_message.query.query_type() == trust_dns_proto::rr::record_type::RecordType::AXFR
+                    || request_message.query.query_type() == trust_dns_proto::rr::record_type::RecordType::IXFR {
                     let mut client = cache.client.clone();
                     let raw_bytes = request_message.raw_bytes.clone();
                     let s = async_stream::stream! {
@@ -0,0 +1,35 @@
+from rest_framework import pagination
+from rest_framework.settings import api_settings
+from django.conf import settings
+
+
+class RecordPagination(pagination.CursorPagination):
+    """
+    Pages records by ID, so each page is an index range scan however deep into the list it is, and no
+    count of the whole table is needed. Opt in, only requests giving cursor or page_size are paged this way,
+    the rest get the API's default pages as they always have.
+    """
+    ordering = "id"
+    page_size = settings.API_RECORD_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_RECORD_MAX_PAGE_SIZE
+
+    def __init__(self):
+        self.default_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            self.default_pagination = api_settings.DEFAULT_PAGINATION_CLASS()
+            return self.default_pagination.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.default_pagination:
+            return self.default_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.default_pagination:
+            return self.default_pagination.to_html()
+        return super().to_html()
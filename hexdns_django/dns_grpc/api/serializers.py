@@ -3,6 +3,7 @@ from django.conf import settings
 import base64
 import ipaddress
 import collections
+import urllib.parse
 from .. import models, views, tasks
 
 
@@ -85,16 +86,57 @@ class PermissionPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
         return validators
 
 
+class TemplatedURLMixin:
+    """
+    Reverses each view once per serialisation with a placeholder key and fills every object's key into
+    that, rather than going through the URL resolver for every row of a list.
+    """
+    URL_PLACEHOLDER = "hexdns-url-key"
+
+    def get_url(self, obj, view_name, request, format):
+        if hasattr(obj, 'pk') and obj.pk in (None, ''):
+            return None
+
+        templates = self.context.setdefault('url_templates', {})
+        template = templates.get((view_name, format))
+        if template is None:
+            url = self.reverse(
+                view_name, kwargs={self.lookup_url_kwarg: self.URL_PLACEHOLDER}, request=request, format=format
+            )
+            template = url.rpartition(self.URL_PLACEHOLDER)
+            templates[(view_name, format)] = template
+
+        prefix, _, suffix = template
+        return prefix + urllib.parse.quote(str(getattr(obj, self.lookup_field)), safe="") + suffix
+
+
+class HyperlinkedRelatedField(TemplatedURLMixin, serializers.HyperlinkedRelatedField):
+    pass
+
+
+class HyperlinkedIdentityField(TemplatedURLMixin, serializers.HyperlinkedIdentityField):
+    pass
+
+
 class ZoneRecordSerializer(WriteOnceMixin, serializers.ModelSerializer):
-    zone_url = serializers.HyperlinkedRelatedField(
+    zone_url = HyperlinkedRelatedField(
         view_name='dnszone-detail',
         source='zone',
         read_only=True,
     )
 
+    def get_fields(self):
+        fields = super().get_fields()
+
+        # Bulk requests are made against one zone, whose permissions have already been checked
+        if self.context.get('bulk_zone') is not None and 'zone' in fields:
+            fields['zone'].read_only = True
+
+        return fields
+
 
 class AddressRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='addressrecord-detail',
         read_only=True,
     )
@@ -108,7 +150,7 @@ class AddressRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class DynamicRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='dynamicaddressrecord-detail',
         read_only=True,
     )
@@ -122,7 +164,7 @@ class DynamicRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class ANAMERecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='anamerecord-detail',
         read_only=True,
     )
@@ -136,7 +178,7 @@ class ANAMERecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class CNAMERecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='cnamerecord-detail',
         read_only=True,
     )
@@ -150,7 +192,7 @@ class CNAMERecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class MXRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='mxrecord-detail',
         read_only=True,
     )
@@ -164,7 +206,7 @@ class MXRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class NSRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='nsrecord-detail',
         read_only=True,
     )
@@ -178,7 +220,7 @@ class NSRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class TXTRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='txtrecord-detail',
         read_only=True,
     )
@@ -192,7 +234,7 @@ class TXTRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class SRVRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='srvrecord-detail',
         read_only=True,
     )
@@ -206,7 +248,7 @@ class SRVRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class CAARecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='caarecord-detail',
         read_only=True,
     )
@@ -220,7 +262,7 @@ class CAARecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class NAPTRRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='naptrrecord-detail',
         read_only=True,
     )
@@ -235,7 +277,7 @@ class NAPTRRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class SSHFPRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='sshfprecord-detail',
         read_only=True,
     )
@@ -249,7 +291,7 @@ class SSHFPRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class DSRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='dsrecord-detail',
         read_only=True,
     )
@@ -264,7 +306,7 @@ class DSRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class LOCRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='locrecord-detail',
         read_only=True,
     )
@@ -278,7 +320,7 @@ class LOCRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class HINFORecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='hinforecord-detail',
         read_only=True,
     )
@@ -292,7 +334,7 @@ class HINFORecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class RPRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='rprecord-detail',
         read_only=True,
     )
@@ -306,7 +348,7 @@ class RPRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class HTTPSRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='httpsrecord-detail',
         read_only=True,
     )
@@ -390,12 +432,12 @@ class DNSZoneSerializer(WriteOnceMixin, serializers.ModelSerializer):
 
 
 class PTRRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='reverse-ptrrecord-detail',
         read_only=True,
     )
     zone = PermissionPrimaryKeyRelatedField(model=models.ReverseDNSZone)
-    zone_url = serializers.HyperlinkedRelatedField(
+    zone_url = HyperlinkedRelatedField(
         source='zone',
         view_name='reversednszone-detail',
         read_only=True,
@@ -409,12 +451,12 @@ class PTRRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
 
 
 class ReverseNSRecordSerializer(ZoneRecordSerializer, WriteOnceMixin):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='reverse-nsrecord-detail',
         read_only=True,
     )
     zone = PermissionPrimaryKeyRelatedField(model=models.ReverseDNSZone)
-    zone_url = serializers.HyperlinkedRelatedField(
+    zone_url = HyperlinkedRelatedField(
         source='zone',
         view_name='reversednszone-detail',
         read_only=True,
@@ -466,12 +508,12 @@ class ReverseDNSZoneSerializer(WriteOnceMixin, serializers.ModelSerializer):
 
 
 class SecondaryDNSZoneRecordSerializer(ZoneRecordSerializer):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='secondary-record-detail',
         read_only=True,
     )
     zone = PermissionPrimaryKeyRelatedField(model=models.SecondaryDNSZone)
-    zone_url = serializers.HyperlinkedRelatedField(
+    zone_url = HyperlinkedRelatedField(
         source='zone',
         view_name='secondarydnszone-detail',
         read_only=True,
@@ -496,3 +538,63 @@ class SecondaryDNSZoneSerializer(WriteOnceMixin, serializers.ModelSerializer):
 class ImportZoneFileSerializer(serializers.Serializer):
     zone_file = serializers.CharField()
     overwrite = serializers.BooleanField(default=False, required=False)
+
+
+class ZoneImportJobSerializer(serializers.ModelSerializer):
+    url = HyperlinkedIdentityField(
+        view_name='zoneimportjob-detail',
+        read_only=True,
+    )
+    zone_url = HyperlinkedRelatedField(
+        view_name='dnszone-detail',
+        source='zone',
+        read_only=True,
+    )
+    progress = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = models.DNSZoneImportJob
+        fields = ('url', 'id', 'zone', 'zone_url', 'created', 'last_modified', 'state', 'overwrite', 'progress',
+                  'records_total', 'records_parsed', 'records_imported', 'records_skipped', 'errors',)
+        read_only_fields = fields
+
+
+# Record types of the bulk endpoint, named as in the zone_<type>_records URLs
+BULK_RECORD_TYPES = {
+    'address': AddressRecordSerializer,
+    'dynamic_address': DynamicRecordSerializer,
+    'aname': ANAMERecordSerializer,
+    'cname': CNAMERecordSerializer,
+    'mx': MXRecordSerializer,
+    'ns': NSRecordSerializer,
+    'txt': TXTRecordSerializer,
+    'srv': SRVRecordSerializer,
+    'caa': CAARecordSerializer,
+    'naptr': NAPTRRecordSerializer,
+    'sshfp': SSHFPRecordSerializer,
+    'ds': DSRecordSerializer,
+    'loc': LOCRecordSerializer,
+    'hinfo': HINFORecordSerializer,
+    'rp': RPRecordSerializer,
+    'https': HTTPSRecordSerializer,
+}
+
+
+class BulkRecordOperationSerializer(serializers.Serializer):
+    operation = serializers.ChoiceField(choices=('create', 'update', 'delete'))
+    type = serializers.ChoiceField(choices=list(BULK_RECORD_TYPES.keys()))
+    id = serializers.CharField(required=False)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs['operation'] != 'create' and not attrs.get('id'):
+            raise serializers.ValidationError({'id': 'This field is required to update or delete a record.'})
+        if attrs['operation'] != 'delete' and 'data' not in attrs:
+            raise serializers.ValidationError({'data': 'This field is required to create or update a record.'})
+        return attrs
+
+
+class BulkRecordsSerializer(serializers.Serializer):
+    operations = BulkRecordOperationSerializer(
+        many=True, allow_empty=False, max_length=settings.BULK_RECORD_MAX_OPERATIONS
+    )
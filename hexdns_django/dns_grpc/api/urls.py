@@ -26,6 +26,7 @@ router.register(r'zone_https_records', views.HTTPSRecordViewSet, basename='https
 router.register(r'reverse_zone_ptr_records', views.PTRRecordViewSet, basename='reverse-ptrrecord')
 router.register(r'reverse_zone_ns_records', views.ReverseNSRecordViewSet, basename='reverse-nsrecord')
 router.register(r'secondary_zone_records', views.SecondaryRecordViewSet, basename='secondary-record')
+router.register(r'zone_import_jobs', views.ZoneImportJobViewSet, basename='zoneimportjob')
 
 urlpatterns = [
     path('', include(router.urls)),
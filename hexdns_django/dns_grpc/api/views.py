@@ -1,7 +1,8 @@
 from rest_framework import viewsets, exceptions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied, ValidationError
+from django.db import transaction
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from cryptography.hazmat.backends import default_backend
@@ -9,9 +10,10 @@ from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat
 from as207960_utils.api import auth
 import as207960_utils.api.permissions
+import collections
 import secrets
-from . import serializers, permissions
-from .. import models, views, tasks
+from . import pagination, serializers, permissions
+from .. import keycloak_cache, models, snapshot, views, tasks, update, zone_export, zone_import
 
 
 class InvalidZone(exceptions.APIException):
@@ -38,6 +40,8 @@ class DNSZoneViewSet(viewsets.ModelViewSet):
         })
         if self.action == "import_zone_file":
             return serializers.ImportZoneFileSerializer(*args, **kwargs)
+        elif self.action == "bulk_records":
+            return serializers.BulkRecordsSerializer(*args, **kwargs)
         else:
             return serializers.DNSZoneSerializer(*args, **kwargs)
 
@@ -45,7 +49,7 @@ class DNSZoneViewSet(viewsets.ModelViewSet):
         if not isinstance(self.request.auth, auth.OAuthToken):
             raise PermissionDenied
 
-        return models.DNSZone.get_object_list(self.request.auth.token)
+        return snapshot.prefetch_zones(models.DNSZone.get_object_list(self.request.auth.token))
 
     def perform_create(self, serializer):
         zone_error = views.valid_zone(serializer.validated_data['zone_root'])
@@ -92,15 +96,131 @@ class DNSZoneViewSet(viewsets.ModelViewSet):
         serializer = serializers.ImportZoneFileSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        try:
-            zone_obj.import_zone_file(
-                serializer.validated_data['zone_file'],
-                overwrite=serializer.validated_data['overwrite']
+        job = zone_import.create_job(
+            zone_obj, serializer.validated_data['zone_file'], overwrite=serializer.validated_data['overwrite']
+        )
+        job_data = serializers.ZoneImportJobSerializer(job, context={
+            'request': request,
+            'format': self.format_kwarg,
+            'view': self,
+        }).data
+        return Response(job_data, status=status.HTTP_202_ACCEPTED, headers={'Location': job_data['url']})
+
+    @action(detail=True, methods=['get'])
+    def export_zone_file(self, request, pk=None):
+        if not isinstance(request.auth, auth.OAuthToken):
+            raise PermissionDenied
+
+        zone_obj = get_object_or_404(models.DNSZone, id=pk)
+        if not zone_obj.has_scope(request.auth.token, 'view'):
+            raise PermissionDenied
+
+        return zone_export.export_response(zone_obj, compress=request.query_params.get('compress') == 'gzip')
+
+    @action(detail=True, methods=['post'])
+    def bulk_records(self, request, pk=None):
+        """
+        Creates, updates and deletes records of any type in the zone. Every operation is validated before
+        any are applied, then they're written in one transaction with a single rebuild of the zone.
+        """
+        if not isinstance(request.auth, auth.OAuthToken):
+            raise PermissionDenied
+
+        zone_obj = get_object_or_404(models.DNSZone, id=pk)
+        if not zone_obj.has_scope(request.auth.token, 'edit'):
+            raise PermissionDenied
+
+        serializer = serializers.BulkRecordsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+
+        context = {
+            'request': request,
+            'format': self.format_kwarg,
+            'view': self,
+            'bulk_zone': zone_obj,
+        }
+        existing = self.bulk_existing_records(zone_obj, operations)
+        changes = update.RecordChanges(zone_obj)
+        errors = []
+        results = []
+        for operation in operations:
+            serializer_class = serializers.BULK_RECORD_TYPES[operation['type']]
+            model = serializer_class.Meta.model
+
+            record = None
+            if operation['operation'] != 'create':
+                record = existing[model].get(operation['id'])
+                if record is None:
+                    errors.append({'id': ['No record with this ID in the zone.']})
+                    results.append(None)
+                    continue
+
+            if operation['operation'] == 'delete':
+                changes.remove(record)
+                # Anything later in the request referring to it should fail, not bring it back
+                del existing[model][operation['id']]
+                errors.append({})
+                results.append({'id': operation['id'], 'deleted': True})
+                continue
+
+            record_serializer = serializer_class(
+                record, data=operation['data'], partial=record is not None, context=context
             )
-        except ValueError as e:
-            raise serializers.serializers.ValidationError({'zone_file': str(e)})
+            if not record_serializer.is_valid():
+                errors.append(record_serializer.errors)
+                results.append(None)
+                continue
+
+            if record is None:
+                record = model(zone=zone_obj, **record_serializer.validated_data)
+                if model == models.DynamicAddressRecord:
+                    record.password = secrets.token_hex(32)
+                changes.create(record)
+            else:
+                changes.modify(record)
+                for attr, value in record_serializer.validated_data.items():
+                    setattr(record, attr, value)
+            errors.append({})
+            results.append(record)
+
+        if any(errors):
+            raise serializers.serializers.ValidationError({'operations': errors})
+
+        with transaction.atomic():
+            if changes.commit():
+                models.DNSZone.objects.filter(id=zone_obj.id).update(last_modified=timezone.now())
+
+        return Response({
+            'results': [
+                result if isinstance(result, dict) else
+                serializers.BULK_RECORD_TYPES[operation['type']](result, context=context).data
+                for operation, result in zip(operations, results)
+            ]
+        })
 
-        return Response(status=status.HTTP_202_ACCEPTED)
+    @staticmethod
+    def bulk_existing_records(zone_obj: models.DNSZone, operations: list) -> dict:
+        # One query per record type for everything the request updates or deletes
+        ids = collections.defaultdict(set)
+        for operation in operations:
+            if operation['operation'] != 'create':
+                model = serializers.BULK_RECORD_TYPES[operation['type']].Meta.model
+                try:
+                    model._meta.pk.to_python(operation['id'])
+                except (ValidationError, ValueError):
+                    continue
+                ids[model].add(operation['id'])
+
+        existing = collections.defaultdict(dict)
+        for model, model_ids in ids.items():
+            records = {str(record.pk): record for record in model.objects.filter(zone=zone_obj, pk__in=model_ids)}
+            for record_id in model_ids:
+                record = records.get(str(model._meta.pk.to_python(record_id)))
+                if record:
+                    record.zone = zone_obj
+                    existing[model][record_id] = record
+        return existing
 
 
 class ReverseDNSZoneViewSet(viewsets.ModelViewSet):
@@ -112,7 +232,8 @@ class ReverseDNSZoneViewSet(viewsets.ModelViewSet):
         if not isinstance(self.request.auth, auth.OAuthToken):
             raise PermissionDenied
 
-        return models.ReverseDNSZone.get_object_list(self.request.auth.token)
+        return models.ReverseDNSZone.get_object_list(self.request.auth.token) \
+            .prefetch_related(*snapshot.REVERSE_ZONE_RECORD_SETS)
 
     def perform_create(self, serializer):
         status, extra = views.log_usage(self.request.user, extra=1, off_session=True)
@@ -184,9 +305,14 @@ class SecondaryDNSZoneViewSet(viewsets.ModelViewSet):
         tasks.update_catalog.delay()
 
 
-class DNSZoneRecordViewSet(viewsets.ModelViewSet):
+class RecordListMixin:
+    """
+    Record lists are paged by cursor over the records of the token's zones, loading only the columns the
+    serializer shows. The zone itself is only joined in for single records, where permissions need it.
+    """
     model_class: models.models.Model
-    permission_classes = [permissions.zone_keycloak()]
+    zone_model: models.models.Model
+    pagination_class = pagination.RecordPagination
 
     def get_queryset(self):
         return self.model_class.objects.all()
@@ -195,8 +321,28 @@ class DNSZoneRecordViewSet(viewsets.ModelViewSet):
         if not isinstance(self.request.auth, auth.OAuthToken):
             raise PermissionDenied
 
-        zones = models.DNSZone.get_object_list(self.request.auth.token)
-        return self.model_class.objects.filter(zone__in=zones)
+        zone_ids = keycloak_cache.object_list(self.zone_model, self.request.auth.token)
+        queryset = self.model_class.objects.filter(zone_id__in=zone_ids)
+        if self.action == 'list':
+            return queryset.only(*self.list_columns())
+        return queryset.select_related("zone")
+
+    def list_columns(self):
+        columns = []
+        for name in self.get_serializer_class().Meta.fields:
+            try:
+                field = self.model_class._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.many_to_many:
+                columns.append(name)
+        return columns
+
+
+class DNSZoneRecordViewSet(RecordListMixin, viewsets.ModelViewSet):
+    model_class: models.models.Model
+    zone_model = models.DNSZone
+    permission_classes = [permissions.zone_keycloak()]
 
     def perform_create(self, serializer):
         serializer.save()
@@ -210,20 +356,11 @@ class DNSZoneRecordViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
-class ReverseDNSZoneRecordViewSet(viewsets.ModelViewSet):
+class ReverseDNSZoneRecordViewSet(RecordListMixin, viewsets.ModelViewSet):
     model_class: models.models.Model
+    zone_model = models.ReverseDNSZone
     permission_classes = [permissions.zone_keycloak()]
 
-    def get_queryset(self):
-        return self.model_class.objects.all()
-
-    def filter_queryset(self, queryset):
-        if not isinstance(self.request.auth, auth.OAuthToken):
-            raise PermissionDenied
-
-        zones = models.ReverseDNSZone.get_object_list(self.request.auth.token)
-        return self.model_class.objects.filter(zone__in=zones)
-
     def perform_create(self, serializer):
         serializer.save()
 
@@ -329,14 +466,22 @@ class ReverseNSRecordViewSet(ReverseDNSZoneRecordViewSet):
     serializer_class = serializers.ReverseNSRecordSerializer
 
 
+class ZoneImportJobViewSet(RecordListMixin, viewsets.ReadOnlyModelViewSet):
+    model_class = models.DNSZoneImportJob
+    zone_model = models.DNSZone
+    serializer_class = serializers.ZoneImportJobSerializer
+    permission_classes = [permissions.zone_keycloak()]
+
+
 class SecondaryRecordViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.zone_keycloak()]
     queryset = models.SecondaryDNSZoneRecord.objects.all()
     serializer_class = serializers.SecondaryDNSZoneRecordSerializer
+    pagination_class = pagination.RecordPagination
 
     def filter_queryset(self, queryset):
         if not isinstance(self.request.auth, auth.OAuthToken):
             raise PermissionDenied
 
-        zones = models.SecondaryDNSZone.get_object_list(self.request.auth.token)
-        return models.SecondaryDNSZoneRecord.objects.filter(zone__in=zones)
+        zone_ids = keycloak_cache.object_list(models.SecondaryDNSZone, self.request.auth.token)
+        return models.SecondaryDNSZoneRecord.objects.filter(zone_id__in=zone_ids)
@@ -0,0 +1,247 @@
+import contextlib
+import datetime
+import ipaddress
+import json
+import platform
+import subprocess
+import time
+import typing
+from django.db import connection, transaction
+from django.utils import timezone
+from . import metrics, models
+
+BENCHMARK_SUFFIX = "hexdns-benchmark.invalid"
+# Reverse zones are carved out of here, and the synthetic AAAA records point into the first one
+BENCHMARK_PREFIX = "2001:db8:ffff:"
+SSH_HOST_KEY = "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIHikSjO71dW9R3uBFfPg6DwrNpEbZSojUZ7MaJhTMpSq benchmark"
+
+
+def svcb_fields(**kwargs) -> dict:
+    # The SVCB flags have no defaults, forms always fill them in
+    return dict({
+        "target_port_mandatory": False, "alpn_mandatory": False, "no_default_alpn": False,
+        "no_default_alpn_mandatory": False, "ech_mandatory": False, "ipv4_hints_mandatory": False,
+        "ipv6_hints_mandatory": False, "ipv4_hints": "", "ipv6_hints": "", "extra_params": "",
+    }, **kwargs)
+
+
+# Synthetic record for the i-th record of each type in a zone
+RECORD_FACTORIES = {
+    "A": lambda zone, i: models.AddressRecord(
+        zone=zone, record_name=f"host{i}", address=f"192.0.2.{i % 254 + 1}", auto_reverse=False
+    ),
+    "AAAA": lambda zone, i: models.AddressRecord(
+        zone=zone, record_name=f"host{i}", address=f"{BENCHMARK_PREFIX}:{i + 1:x}", auto_reverse=True
+    ),
+    "IDNA": lambda zone, i: models.AddressRecord(
+        zone=zone, record_name=f"bücher{i}", address=f"192.0.2.{i % 254 + 1}", auto_reverse=False
+    ),
+    "CNAME": lambda zone, i: models.CNAMERecord(
+        zone=zone, record_name=f"alias{i}", alias=f"host{i}.{zone.zone_root}"
+    ),
+    "MX": lambda zone, i: models.MXRecord(
+        zone=zone, record_name=f"mail{i}", exchange=f"host{i}.{zone.zone_root}", priority=10
+    ),
+    "NS": lambda zone, i: models.NSRecord(
+        zone=zone, record_name=f"delegated{i}", nameserver=f"ns{i}.example.net"
+    ),
+    "TXT": lambda zone, i: models.TXTRecord(
+        zone=zone, record_name=f"txt{i}", data=f"v=spf1 ip4:192.0.2.{i % 254 + 1} -all"
+    ),
+    "SRV": lambda zone, i: models.SRVRecord(
+        zone=zone, record_name=f"_sip._tcp.srv{i}", priority=10, weight=5, port=5060,
+        target=f"host{i}.{zone.zone_root}"
+    ),
+    "CAA": lambda zone, i: models.CAARecord(
+        zone=zone, record_name=f"caa{i}", flag=0, tag="issue", value="letsencrypt.org"
+    ),
+    "SSHFP": lambda zone, i: models.SSHFPRecord(
+        zone=zone, record_name=f"host{i}", host_key=SSH_HOST_KEY
+    ),
+    "HTTPS": lambda zone, i: models.HTTPSRecord(
+        zone=zone, record_name=f"web{i}", priority=1, target=".", alpns="h3", http2_support=True,
+        **svcb_fields(ipv4_hints=f"192.0.2.{i % 254 + 1}")
+    ),
+}
+DEFAULT_MIX = ("A", "AAAA", "IDNA", "CNAME", "MX", "NS", "TXT", "SRV", "CAA", "SSHFP", "HTTPS")
+
+
+def zone_root(n: int) -> str:
+    return f"zone{n}.{BENCHMARK_SUFFIX}"
+
+
+def seed_zones(zones: int, records: int, mix: typing.Iterable[str] = DEFAULT_MIX) -> list:
+    """
+    Creates synthetic zones under BENCHMARK_SUFFIX with the given number of records of each type. Rows
+    are bulk inserted, so nothing is synced to Keycloak and no zone builds are queued.
+    """
+    mix = list(mix)
+    unknown = [t for t in mix if t not in RECORD_FACTORIES]
+    if unknown:
+        raise ValueError(f"Unknown record types: {', '.join(unknown)}")
+
+    with transaction.atomic():
+        zone_objs = [
+            models.DNSZone(zone_root=zone_root(n), last_modified=timezone.now(), active=True, charged=False)
+            for n in range(zones)
+        ]
+        models.DNSZone.objects.bulk_create(zone_objs)
+
+        for record_type in mix:
+            record_objs = []
+            for zone in zone_objs:
+                for i in range(records):
+                    record = RECORD_FACTORIES[record_type](zone, i)
+                    record.normalise()
+                    record_objs.append(record)
+            if record_objs:
+                type(record_objs[0]).objects.bulk_create(record_objs, batch_size=1000)
+
+    return zone_objs
+
+
+def seed_reverse_zones(zones: int, records: int) -> list:
+    with transaction.atomic():
+        zone_objs = [
+            models.ReverseDNSZone(
+                zone_root_address=str(ipaddress.ip_address(f"{BENCHMARK_PREFIX}{n:x}::")), zone_root_prefix=64, last_modified=timezone.now(),
+                active=True, charged=False
+            ) for n in range(zones)
+        ]
+        models.ReverseDNSZone.objects.bulk_create(zone_objs)
+        models.PTRRecord.objects.bulk_create([
+            models.PTRRecord(
+                zone=zone, record_address=str(ipaddress.ip_address(f"{BENCHMARK_PREFIX}{n:x}::{i + 1:x}:0")),
+                pointer=f"ptr{i}.{zone_root(0)}"
+            ) for n, zone in enumerate(zone_objs) for i in range(records)
+        ], batch_size=1000)
+
+    return zone_objs
+
+
+def seed_secondary_zones(zones: int, records: int) -> list:
+    with transaction.atomic():
+        zone_objs = [
+            models.SecondaryDNSZone(
+                zone_root=f"secondary{n}.{BENCHMARK_SUFFIX}", primary="192.0.2.53", active=True, charged=False
+            ) for n in range(zones)
+        ]
+        models.SecondaryDNSZone.objects.bulk_create(zone_objs)
+        models.SecondaryDNSZoneRecord.objects.bulk_create([
+            models.SecondaryDNSZoneRecord(
+                zone=zone, record_text=f"host{i} 3600 IN A 192.0.2.{i % 254 + 1}"
+            ) for zone in zone_objs for i in range(records)
+        ], batch_size=1000)
+
+    return zone_objs
+
+
+def remove_seeded_zones():
+    # Queryset deletes, so Keycloak isn't asked about resources that were never synced
+    models.DNSZone.objects.filter(zone_root__endswith=f".{BENCHMARK_SUFFIX}").delete()
+    models.SecondaryDNSZone.objects.filter(zone_root__endswith=f".{BENCHMARK_SUFFIX}").delete()
+    models.ReverseDNSZone.objects.filter(zone_root_address__startswith=BENCHMARK_PREFIX).delete()
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def measure(fn: typing.Callable[[int], typing.Any], iterations: int, warmup: int = 10) -> dict:
+    """
+    Calls fn(i) for each iteration, reporting latency percentiles, throughput and queries per call.
+    """
+    for i in range(min(warmup, iterations)):
+        fn(i)
+
+    durations = []
+    counter = metrics.QueryCounter()
+    with connection.execute_wrapper(counter):
+        for i in range(iterations):
+            start = time.perf_counter()
+            fn(i)
+            durations.append(time.perf_counter() - start)
+
+    total = sum(durations)
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(durations, 50) * 1000,
+        "p99_ms": percentile(durations, 99) * 1000,
+        "mean_ms": total / iterations * 1000 if iterations else 0.0,
+        "throughput_per_s": iterations / total if total else 0.0,
+        "queries_per_call": counter.queries / iterations if iterations else 0.0,
+        "rows_per_call": counter.rows / iterations if iterations else 0.0,
+    }
+
+
+class StageTimer:
+    """
+    Wall time and queries per named stage, summed over every time the stage runs.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        counter = metrics.QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            yield
+        elapsed = time.perf_counter() - start
+
+        stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "queries": 0})
+        stage["calls"] += 1
+        stage["seconds"] += elapsed
+        stage["queries"] += counter.queries
+
+    def summary(self, records_per_call: typing.Optional[int] = None) -> dict:
+        out = {}
+        for name, stage in self.stages.items():
+            out[name] = dict(stage, mean_ms=stage["seconds"] / stage["calls"] * 1000)
+            if records_per_call:
+                out[name]["ms_per_1k_records"] = out[name]["mean_ms"] / records_per_call * 1000
+        return out
+
+
+def git_commit() -> typing.Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def results_document(benchmark: str, parameters: dict, results: dict) -> dict:
+    return {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "database": connection.vendor,
+        "parameters": parameters,
+        "results": results,
+    }
+
+
+def write_results(path: typing.Optional[str], document: dict):
+    data = json.dumps(document, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+
+
+def format_results(results: dict) -> str:
+    lines = [f"{'benchmark':<24} {'p50 ms':>9} {'p99 ms':>9} {'per s':>9} {'queries':>8}"]
+    for name, result in results.items():
+        lines.append(
+            f"{name:<24} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+            f"{result['throughput_per_s']:>9.1f} {result['queries_per_call']:>8.1f}"
+        )
+    return "\n".join(lines)
@@ -6,7 +6,6 @@ import dataclasses
 import dnslib
 import sentry_sdk
 import datetime
-import hmac
 import requests
 import sys
 import django.core.exceptions
@@ -19,7 +18,7 @@ from django.db.models.functions import Length
 from dnslib import CLASS, OPCODE, QTYPE, RCODE
 from dnslib.label import DNSLabel
 
-from . import models
+from . import models, snapshot, tasks, tsig_keys, update
 from .proto import dns_pb2, dns_pb2_grpc
 
 NAMESERVERS = ["ns1.as207960.net", "ns2.as207960.net", "ns3.as207960.net", "ns4.as207960.net"]
@@ -27,6 +26,7 @@ IP4_APRA = DNSLabel("in-addr.arpa.")
 IP6_APRA = DNSLabel("ip6.arpa.")
 IP_NETWORK = typing.Union[ipaddress.IPv6Network, ipaddress.IPv4Network]
 IP_ADDR = typing.Union[ipaddress.IPv6Address, ipaddress.IPv4Address]
+TRANSFER_MESSAGE_RRS = 100
 TSIG_BADSIG = 16
 TSIG_BADKEY = 17
 TSIG_BADTIME = 18
@@ -39,6 +39,11 @@ HMAC_NAMES = {
 }
 
 
+def serial_gte(serial_1: int, serial_2: int) -> bool:
+    # RFC 1982 serial number arithmetic, a serial is newer if it's less than half the number space ahead
+    return (serial_1 - serial_2) % (2 ** 32) < 2 ** 31
+
+
 @dataclasses.dataclass
 class TSIG:
     alg_name: DNSLabel
@@ -94,6 +99,38 @@ class TSIG:
             other_data=other_data
         )
 
+    @staticmethod
+    def signed_message(msg: bytes, original_id: int) -> list:
+        """
+        The parts of a received message covered by its MAC (RFC 2845 § 3.4.1), taken straight from the
+        wire: the message up to the TSIG RR, with the original ID and ARCOUNT less the TSIG.
+        """
+        msg = memoryview(msg)
+        qdcount, ancount, nscount, arcount = struct.unpack_from("!HHHH", msg, 4)
+        offset = 12
+        for _ in range(qdcount):
+            offset = skip_name(msg, offset) + 4
+        tsig_offset = offset
+        for _ in range(ancount + nscount + arcount):
+            tsig_offset = offset
+            offset = skip_name(msg, offset)
+            rdlength, = struct.unpack_from("!H", msg, offset + 8)
+            offset += 10 + rdlength
+
+        return [
+            struct.pack("!H", original_id), msg[2:10], struct.pack("!H", arcount - 1), msg[12:tsig_offset]
+        ]
+
+
+def skip_name(msg: memoryview, offset: int) -> int:
+    while True:
+        length = msg[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
 
 def grpc_hook(server):
     dns_pb2_grpc.add_DnsServiceServicer_to_server(DnsServiceServicer(), server)
@@ -123,17 +160,20 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
                 record_name = qname.stripSuffix(zone_root)
                 if len(record_name.label) == 0:
                     record_name = DNSLabel("@")
-                try:
-                    account = zone.get_user().account
-                    active = account.subscription_active
-                except requests.exceptions.RequestException:
-                    active = True
-                if active:
+                if DnsServiceServicer.zone_active(zone):
                     return zone, record_name
                 else:
                     return None, None
         return None, None
 
+    @staticmethod
+    def zone_active(zone: models.DNSZone) -> bool:
+        try:
+            account = zone.get_user().account
+            return account.subscription_active
+        except requests.exceptions.RequestException:
+            return True
+
     @staticmethod
     def find_records(
             model: typing.Type[models.DNSZoneRecord],
@@ -224,7 +264,11 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
         ).count():
             return True
 
-        port, scheme, new_record_name = self.parse_https_record_name(rname)
+        return self.any_https_records(rname, zone)
+
+    @classmethod
+    def any_https_records(cls, rname: DNSLabel, zone: models.DNSZone):
+        port, scheme, new_record_name = cls.parse_https_record_name(rname)
         labels = list(new_record_name.label)
         if len(labels):
             labels[0] = b"*"
@@ -723,6 +767,82 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
                 dns_res, record_name, zone, query_name, is_dnssec, self.lookup_dhcid
             )
 
+    @staticmethod
+    def make_transfer_soa(zone: models.DNSZone, serial: int):
+        return tasks.zone_soa_rr(zone, DNSLabel(zone.zone_root), serial)
+
+    def find_ixfr_rrs(self, dns_req: dnslib.DNSRecord, zone: models.DNSZone, serial: int):
+        # RFC 1995 § 3, the client's current SOA is in the authority section
+        client_soa = next((rr for rr in dns_req.auth if rr.rtype == QTYPE.SOA), None)
+        if not client_soa:
+            return None
+        client_serial = client_soa.rdata.times[0]
+
+        current_soa = self.make_transfer_soa(zone, serial)
+        if serial_gte(client_serial, serial):
+            return [current_soa]
+
+        # Serials wrap, so the versions are followed by their order in the journal rather than compared
+        versions = []
+        for entry in models.DNSZoneJournal.objects.filter(zone=zone, serial__isnull=False).order_by("id"):
+            if not versions or versions[-1][1] != entry.serial:
+                versions.append((entry.from_serial, entry.serial, []))
+            versions[-1][2].append(entry)
+
+        start = next((i for i in reversed(range(len(versions))) if versions[i][0] == client_serial), None)
+        if start is None:
+            return None
+        versions = versions[start:]
+        end = next((i for i, version in enumerate(versions) if version[1] == serial), None)
+        if end is None:
+            return None
+        versions = versions[:end + 1]
+
+        last_serial = client_serial
+        for from_serial, to_serial, entries in versions:
+            if from_serial != last_serial or not all(e.complete for e in entries):
+                return None
+            last_serial = to_serial
+
+        out = [current_soa]
+        for from_serial, to_serial, entries in versions:
+            removed = {}
+            added = {}
+            for entry in entries:
+                for rr in models.DNSZoneJournal.split_rrs(entry.removed):
+                    if rr in added:
+                        del added[rr]
+                    else:
+                        removed[rr] = None
+                for rr in models.DNSZoneJournal.split_rrs(entry.added):
+                    if rr in removed:
+                        del removed[rr]
+                    else:
+                        added[rr] = None
+
+            out.append(self.make_transfer_soa(zone, from_serial))
+            out.extend(map(models.DNSZoneJournal.parse_rr, removed))
+            out.append(self.make_transfer_soa(zone, to_serial))
+            out.extend(map(models.DNSZoneJournal.parse_rr, added))
+        out.append(current_soa)
+
+        return out
+
+    @staticmethod
+    def transfer_messages(dns_req: dnslib.DNSRecord, rrs: typing.Iterable[dnslib.RR]):
+        batch = []
+        for rr in rrs:
+            batch.append(rr)
+            if len(batch) >= TRANSFER_MESSAGE_RRS:
+                dns_res = dns_req.reply(ra=False)
+                dns_res.add_answer(*batch)
+                yield dns_res
+                batch = []
+        if batch:
+            dns_res = dns_req.reply(ra=False)
+            dns_res.add_answer(*batch)
+            yield dns_res
+
     def handle_axfr_query(self, dns_req: dnslib.DNSRecord):
         dns_res = dns_req.reply(ra=False)
 
@@ -747,33 +867,21 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
             yield dns_res
             return
 
-        soa_dns_res = dns_req.reply(ra=False)
-        soa_dns_res.add_answer(
-            dnslib.RR(
-                zone.zone_root,
-                QTYPE.SOA,
-                rdata=dnslib.SOA(
-                    NAMESERVERS[0],
-                    "noc.as207960.net",
-                    (
-                        int(zone.last_modified.timestamp()),
-                        86400,
-                        7200,
-                        3600000,
-                        172800,
-                    ),
-                ),
-                ttl=86400,
-            )
-        )
+        serial = zone.serial or int(zone.last_modified.timestamp())
+
+        if dns_req.q.qtype == QTYPE.IXFR:
+            ixfr_rrs = self.find_ixfr_rrs(dns_req, zone, serial)
+            if ixfr_rrs is not None:
+                yield from self.transfer_messages(dns_req, ixfr_rrs)
+                return
 
-        yield soa_dns_res
-        yield dns_res
-        yield soa_dns_res
+        # A full transfer, also the answer to an IXFR the journal can't bridge (RFC 1995 § 4)
+        zone = snapshot.load_zone(zone.id)
+        yield from self.transfer_messages(dns_req, tasks.fzone_transfer_rrs(zone, serial))
 
         # self.sign_rrset(soa_dns_res, zone, query_name, is_dnssec)
 
-    def handle_update_query(self, dns_req: dnslib.DNSRecord):
+    def handle_update_query(self, dns_req: dnslib.DNSRecord, msg: bytes):
         dns_res = dns_req.reply(ra=False)
 
         # RFC 2136 § 3.1
@@ -798,11 +906,11 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
             list(map(lambda n: n.decode().lower().encode(), zone_name.label))
         )
 
-        tsig_key = None  # type: typing.Optional[models.DNSZoneUpdateSecrets]
+        tsig_key = None  # type: typing.Optional[tsig_keys.TSIGKey]
         if req_tsig.rname.matchSuffix(zone_name):
             tsig_key_id = str(req_tsig.rname.stripSuffix(zone_name)).strip(".")
             try:
-                tsig_key = models.DNSZoneUpdateSecrets.objects.filter(id=str(tsig_key_id)).first()
+                tsig_key = tsig_keys.tsig_key_cache.lookup(str(tsig_key_id))
             except django.core.exceptions.ValidationError:
                 pass
 
@@ -834,83 +942,18 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
 
         # RFC 2845 § 4.5.3
         message_digest = HMAC_NAMES[tsig_alg_label]
-        incoming_hmac = hmac.new(bytes(tsig_key.secret), digestmod=message_digest)
-        incoming_hmac2 = hmac.new(bytes(tsig_key.secret), digestmod=message_digest)
-        dns_req.header.id = incoming_tsig.original_id
-
-        for r in dns_req.rr:
-            if r.rdata == '':
-                r.rdata = dnslib.RD(data=b'')
-        for r in dns_req.auth:
-            if r.rdata == '':
-                r.rdata = dnslib.RD(data=b'')
-        for r in dns_req.ar:
-            if r.rdata == '':
-                r.rdata = dnslib.RD(data=b'')
-
-        def pack_rr_canon(rd, buffer):
-            buffer.encode_name_nocompress(rd.rname)
-            buffer.pack("!HHI", rd.rtype, rd.rclass, rd.ttl)
-            rdlength_ptr = buffer.offset
-            buffer.pack("!H", 0)
-            start = buffer.offset
-            if rd.rtype == QTYPE.OPT:
-                for opt in rd.rdata:
-                    opt.pack(buffer)
-            elif isinstance(rd.rdata, dnslib.MX):
-                buffer.pack("!H", rd.rdata.preference)
-                buffer.encode_name_nocompress(rd.rdata.label)
-            elif isinstance(rd.rdata, dnslib.CNAME):
-                buffer.encode_name_nocompress(rd.rdata.label)
-            elif isinstance(rd.rdata, dnslib.SOA):
-                buffer.encode_name_nocompress(rd.rdata.mname)
-                buffer.encode_name_nocompress(rd.rdata.rname)
-                buffer.pack("!IIIII", *rd.rdata.times)
-            elif isinstance(rd.rdata, dnslib.SRV):
-                buffer.pack("!HHH", rd.rdata.priority, rd.rdata.weight, rd.rdata.port)
-                buffer.encode_name_nocompress(rd.rdata.target)
-            else:
-                rd.rdata.pack(buffer)
-            end = buffer.offset
-            buffer.update(rdlength_ptr, "!H", end-start)
-
-        d = dns_req.pack()
-        db = dnslib.DNSBuffer()
-        dns_req.header.pack(db)
-        for q in dns_req.questions:
-            db.encode_name(q.qname)
-            db.pack("!HH", q.qtype, q.qclass)
-        for rr in dns_req.rr:
-            pack_rr_canon(rr, db)
-        for auth in dns_req.auth:
-            pack_rr_canon(auth, db)
-        for ar in dns_req.ar:
-            pack_rr_canon(ar, db)
-        d2 = db.data
-
-        for r in dns_req.rr:
-            if type(r.rdata) == dnslib.RD and r.rdata.data == b'':
-                r.rdata = ''
-        for r in dns_req.auth:
-            if type(r.rdata) == dnslib.RD and r.rdata.data == b'':
-                r.rdata = ''
-        for r in dns_req.ar:
-            if type(r.rdata) == dnslib.RD and r.rdata.data == b'':
-                r.rdata = ''
+        incoming_hmac = tsig_key.hmac(message_digest)
+        for part in TSIG.signed_message(msg, incoming_tsig.original_id):
+            incoming_hmac.update(part)
 
         temp_buffer = dnslib.DNSBuffer()
         temp_buffer.encode_name_nocompress(req_tsig.rname)
         temp_buffer.pack("!HI", getattr(CLASS, "*"), 0)
-        d += temp_buffer.data
-        d2 += temp_buffer.data
-        d += incoming_tsig.make_variables()
-        d2 += incoming_tsig.make_variables()
-        incoming_hmac.update(d)
-        incoming_hmac2.update(d2)
+        incoming_hmac.update(temp_buffer.data)
+        incoming_hmac.update(incoming_tsig.make_variables())
         incoming_digest = incoming_hmac.digest()
-        incoming_digest2 = incoming_hmac2.digest()
 
-        if (incoming_digest != incoming_tsig.mac) and (incoming_digest2 != incoming_tsig.mac):
+        if incoming_digest != incoming_tsig.mac:
             tsig_unsigned_error(TSIG_BADSIG)
             return dns_res
 
@@ -932,7 +975,7 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
                 other_data=other_data
             )
 
-            outgoing_hmac = hmac.new(bytes(tsig_key.secret), digestmod=message_digest)
+            outgoing_hmac = tsig_key.hmac(message_digest)
             outgoing_hmac.update(struct.pack('!H', len(incoming_tsig.mac)))
             outgoing_hmac.update(incoming_tsig.mac)
             outgoing_hmac.update(dns_res.pack())
@@ -972,7 +1015,7 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
             sign_resp()
             return dns_res
 
-        if tsig_key.zone != zone:
+        if tsig_key.key.zone_id != zone.id:
             dns_res.header.rcode = RCODE.NOTAUTH
             sign_resp()
             return dns_res
@@ -1150,45 +1193,15 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
                 sign_resp()
                 return dns_res
 
-        def get_record_models(rrtype, record_name: dnslib.DNSLabel):
-            if rrtype in [QTYPE.A, QTYPE.AAAA]:
-                return self.find_records(models.AddressRecord, record_name, zone)
-            elif rrtype == QTYPE.MX:
-                return self.find_records(models.MXRecord, record_name, zone)
-            elif rrtype == QTYPE.NS:
-                return self.find_records(models.NSRecord, record_name, zone)
-            elif rrtype == QTYPE.TXT:
-                return self.find_records(models.TXTRecord, record_name, zone)
-            elif rrtype == QTYPE.SRV:
-                return self.find_records(models.SRVRecord, record_name, zone)
-            elif rrtype == QTYPE.CAA:
-                return self.find_records(models.CAARecord, record_name, zone)
-            elif rrtype == QTYPE.NAPTR:
-                return self.find_records(models.NAPTRRecord, record_name, zone)
-            elif rrtype == QTYPE.DS:
-                return self.find_records(models.DSRecord, record_name, zone)
-            elif rrtype == QTYPE.LOC:
-                return self.find_records(models.LOCRecord, record_name, zone)
-            elif rrtype == QTYPE.HINFO:
-                return self.find_records(models.HINFORecord, record_name, zone)
-            elif rrtype == QTYPE.RP:
-                return self.find_records(models.RPRecord, record_name, zone)
-            elif rrtype == QTYPE.DHCID:
-                return self.find_records(models.DHCIDRecord, record_name, zone)
-            elif rrtype == QTYPE.CNAME:
-                return self.find_records(models.CNAMERecord, record_name, zone)
-            else:
-                return None
-
         def can_manage(rrtype, record_name: dnslib.DNSLabel):
-            if tsig_key.restrict_to != "@":
-                restrict_suffix = dnslib.DNSLabel(tsig_key.restrict_to)
+            if tsig_key.key.restrict_to != "@":
+                restrict_suffix = dnslib.DNSLabel(tsig_key.key.restrict_to)
                 if not record_name.matchSuffix(restrict_suffix):
                     return False
 
-            if tsig_key.type == tsig_key.TYPE_UNLIMITED:
+            if tsig_key.key.type == tsig_key.key.TYPE_UNLIMITED:
                 return True
-            elif tsig_key.type == tsig_key.TYPE_ACME_DNS01:
+            elif tsig_key.key.type == tsig_key.key.TYPE_ACME_DNS01:
                 if record_name.label[0] == b"_acme-challenge" and rrtype == QTYPE.TXT:
                     return True
                 else:
@@ -1197,113 +1210,57 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
                 return False
 
         # RFC 2136 § 3.4.2
-        to_update = []
+        changes = update.ZoneUpdate(zone, [
+            models.DNSZoneRecord.dns_label_to_record_name(rr.rname, zone) for rr in upset
+        ])
         for rr in upset:
-            record_name = rr.rname.stripSuffix(zone_name)
+            record_name = models.DNSZoneRecord.dns_label_to_record_name(rr.rname, zone)
+            record_label = DNSLabel(record_name)
 
             # RFC 2136 § 3.4.2.2
             if rr.rclass == dns_req.q.qclass:
-                if not can_manage(rr.rtype, record_name):
+                if not can_manage(rr.rtype, record_label):
                     dns_res.header.rcode = RCODE.NOTAUTH
                     sign_resp()
                     return dns_res
 
-                def _try_update():
-                    if rr.rtype == QTYPE.CNAME:
-                        if self.any_records(record_name, zone, include_cname=False):
-                            return False
-                    elif self.any_record_type(record_name, zone, QTYPE.CNAME):
-                        return False
-
-                    records = get_record_models(rr.rtype, record_name)
-                    if records is None:
-                        return True
-
-                    for record in records:
-                        record_rr = record.to_rr(rr.rname)
-
-                        if rr.rdata == record_rr.rdata:
-                            record.update_from_rr(rr)
-                            record.save()
-                            return False
-
-                    return True
-
-                if rr.rtype in [QTYPE.A, QTYPE.AAAA]:
-                    new_record = models.AddressRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.MX:
-                    new_record = models.MXRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.NS:
-                    new_record = models.NSRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.TXT:
-                    new_record = models.TXTRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.SRV:
-                    new_record = models.SRVRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.CAA:
-                    new_record = models.CAARecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.NAPTR:
-                    new_record = models.NAPTRRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.DS:
-                    new_record = models.DSRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.LOC:
-                    new_record = models.LOCRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.HINFO:
-                    new_record = models.HINFORecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.RP:
-                    new_record = models.RPRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.DHCID:
-                    new_record = models.DHCIDRecord.from_rr(rr, zone)
-                elif rr.rtype == QTYPE.CNAME:
-                    new_record = models.CNAMERecord.from_rr(rr, zone)
-                else:
-                    continue
-
-                if _try_update():
-                    new_record.save()
+                changes.add(rr, record_name)
 
             # RFC 2136 § 3.4.2.3
             elif rr.rclass == getattr(CLASS, "*"):
                 if rr.rtype == QTYPE.ANY:
-                    for m in (
-                            models.AddressRecord, models.MXRecord, models.NSRecord, models.TXTRecord, models.SRVRecord,
-                            models.CAARecord, models.NAPTRRecord, models.DSRecord, models.LOCRecord, models.HINFORecord,
-                            models.RPRecord, models.CNAMERecord, models.DHCIDRecord
-                    ):
-                        for record in self.find_records(m, record_name, zone):
+                    for m in update.DELETE_ANY_MODELS:
+                        for record in changes.find(m, record_name):
                             record_rr = record.to_rr(rr.rname)
-                            if not can_manage(record_rr.rtype, record_name):
+                            if not can_manage(record_rr.rtype, record_label):
                                 dns_res.header.rcode = RCODE.NOTAUTH
                                 sign_resp()
                                 return dns_res
-                            record.delete()
+                            changes.remove(record)
                 else:
-                    records = get_record_models(rr.rtype, record_name)
-                    if not can_manage(rr.rtype, record_name):
+                    if not can_manage(rr.rtype, record_label):
                         dns_res.header.rcode = RCODE.NOTAUTH
                         sign_resp()
                         return dns_res
 
-                    if records is not None:
-                        for record in records:
-                            record_rr = record.to_rr(rr.rname)
-                            if record_rr.rtype == rr.rtype:
-                                record.delete()
+                    for record in changes.find(update.UPDATE_MODELS[rr.rtype], record_name):
+                        record_rr = record.to_rr(rr.rname)
+                        if record_rr.rtype == rr.rtype:
+                            changes.remove(record)
 
             # RFC 2136 § 3.4.2.4
             elif rr.rclass == getattr(CLASS, "None"):
-                records = get_record_models(rr.rtype, record_name)
-                if records is None:
-                    continue
-
-                if not can_manage(rr.rtype, record_name):
+                if not can_manage(rr.rtype, record_label):
                     dns_res.header.rcode = RCODE.NOTAUTH
                     sign_resp()
                     return dns_res
 
-                for record in records:
+                for record in changes.find(update.UPDATE_MODELS[rr.rtype], record_name):
                     record_rr = record.to_rr(rr.rname)
                     if rr.rdata == record_rr.rdata and record_rr.rtype == rr.rtype:
-                        record.delete()
+                        changes.remove(record)
+
+        changes.commit()
 
         sign_resp()
         return dns_res
@@ -1347,7 +1304,7 @@ class DnsServiceServicer(dns_pb2_grpc.DnsServiceServicer):
             return self.make_resp(dns_res)
 
         try:
-            dns_res = self.handle_update_query(dns_req)
+            dns_res = self.handle_update_query(dns_req, request.msg)
         except models.DNSError as e:
             print(e.message, flush=True)
             dns_res = dns_req.reply(ra=False)
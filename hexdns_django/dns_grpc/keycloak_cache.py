@@ -0,0 +1,124 @@
+import contextvars
+import hashlib
+import typing
+import as207960_utils.models
+import django_keycloak_auth.clients
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import metrics, ttl_cache
+
+# Answers already given in this request, so repeated checks agree and don't even need the lock
+request_memo = contextvars.ContextVar("keycloak_request_memo", default=None)
+
+
+def token_hash(access_token: str) -> str:
+    # Tokens are bearer credentials, so they aren't kept around as dictionary keys
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+# Keycloak permission answers by token hash, so checks repeated across requests in quick succession don't go
+# back to Keycloak. Zones being created or deleted in this process clears it, permission changes made in
+# Keycloak are picked up when entries expire.
+permission_cache = ttl_cache.TTLCache(
+    ttl=settings.KEYCLOAK_CACHE_TTL,
+    max_size=settings.KEYCLOAK_CACHE_SIZE,
+)
+
+
+def peek(key: tuple):
+    memo = request_memo.get()
+    if memo is not None and key in memo:
+        return memo[key]
+    return permission_cache.get(key)
+
+
+def cached(key: tuple, fetch: typing.Callable[[], typing.Any]):
+    memo = request_memo.get()
+    if memo is not None and key in memo:
+        return memo[key]
+    value = permission_cache.get(key)
+    metrics.record_cache(f"keycloak_{key[0]}", value is not None)
+    if value is None:
+        value = fetch()
+        permission_cache.put(key, value)
+    if memo is not None:
+        memo[key] = value
+    return value
+
+
+def get_object_ids(access_token: str, resource_type: str, action: str) -> typing.FrozenSet[str]:
+    return cached(
+        ("object_ids", token_hash(access_token), resource_type, action),
+        lambda: frozenset(
+            str(i) for i in as207960_utils.models.get_object_ids(access_token, resource_type, action)
+        )
+    )
+
+
+def eval_permission(access_token: str, resource_id, resource_type: str, action: str) -> bool:
+    token_key = token_hash(access_token)
+    # Anything in a list already fetched for this scope is known to be allowed
+    object_ids = peek(("object_ids", token_key, resource_type, action))
+    if object_ids is not None and str(resource_id) in object_ids:
+        return True
+    return cached(
+        ("permission", token_key, str(resource_id), f"{action}-{resource_type}"),
+        lambda: bool(as207960_utils.models.eval_permission(
+            access_token, resource_id, f"{action}-{resource_type}"
+        ))
+    )
+
+
+def eval_class_permission(access_token: str, resource_type: str, action: str) -> bool:
+    return cached(
+        ("class_permission", token_hash(access_token), resource_type, f"{action}-{resource_type}"),
+        lambda: bool(django_keycloak_auth.clients.get_authz_client().eval_permission(
+            access_token, resource_type, f"{action}-{resource_type}"
+        ))
+    )
+
+
+def object_list(model, access_token: str, action: str = 'view') -> list:
+    """
+    Primary keys of the objects of a zone model the token can act on, for filtering records by zone.
+    """
+    return cached(
+        ("object_list", token_hash(access_token), model._meta.label, action),
+        lambda: list(model.get_object_list(access_token, action).values_list("pk", flat=True))
+    )
+
+
+def clear():
+    permission_cache.clear()
+    memo = request_memo.get()
+    if memo is not None:
+        memo.clear()
+
+
+class RequestMemoMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request_memo.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            request_memo.reset(token)
+
+
+@receiver(post_save, sender="dns_grpc.DNSZone")
+@receiver(post_save, sender="dns_grpc.ReverseDNSZone")
+@receiver(post_save, sender="dns_grpc.SecondaryDNSZone")
+def invalidate_permission_cache_on_create(sender, created, **kwargs):
+    # Other saves don't change who can see the zone
+    if created:
+        clear()
+
+
+@receiver(post_delete, sender="dns_grpc.DNSZone")
+@receiver(post_delete, sender="dns_grpc.ReverseDNSZone")
+@receiver(post_delete, sender="dns_grpc.SecondaryDNSZone")
+def invalidate_permission_cache(sender, **kwargs):
+    clear()
@@ -0,0 +1,53 @@
+import typing
+from django.core.management.base import BaseCommand
+from django.db.models import QuerySet
+
+
+class BackfillCommand(BaseCommand):
+    """
+    Base for commands filling in a stored field computed from each record, in batches. By default only
+    records still missing it are done, --all does every record.
+    """
+    # What --all recomputes, for its help text
+    missing = "the stored value"
+    # Errors a record is skipped and reported for, anything else stops the command
+    skip_errors = ()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help=f"Recompute every record, not just ones missing {self.missing}"
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def backfill(
+            self, records: QuerySet, missing_filter: dict, fields: typing.Iterable[str],
+            compute: typing.Callable[[typing.Any], None], options: dict
+    ):
+        model = records.model
+        fields = list(fields)
+        if not options["all"]:
+            records = records.filter(**missing_filter)
+
+        count = 0
+        failed = 0
+        batch = []
+        for record in records.iterator():
+            try:
+                compute(record)
+            except self.skip_errors as e:
+                self.stderr.write(f"{record.id}: skipped: {e}")
+                failed += 1
+                continue
+            batch.append(record)
+            if len(batch) >= options["batch_size"]:
+                model.objects.bulk_update(batch, fields)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, fields)
+            count += len(batch)
+
+        summary = f"{model._meta.verbose_name_plural}: updated {count}"
+        if self.skip_errors:
+            summary += f", failed {failed}"
+        self.stdout.write(summary)
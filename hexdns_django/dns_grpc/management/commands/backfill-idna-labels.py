@@ -0,0 +1,25 @@
+from dns_grpc import models
+from dns_grpc.management import backfill
+
+
+def record_models(base=models.DNSZoneRecord):
+    for subclass in base.__subclasses__():
+        if not subclass._meta.abstract:
+            yield subclass
+        yield from record_models(subclass)
+
+
+def compute_idna_label(record):
+    record.record_idna = models.make_idna_label(record.record_name) or ""
+
+
+class Command(backfill.BackfillCommand):
+    help = "Compute the stored IDNA form of record names"
+    missing = "a label"
+
+    def handle(self, *args, **options):
+        for record_model in record_models():
+            self.backfill(
+                record_model.objects.only("id", "record_name"), {"record_idna__isnull": True}, ["record_idna"],
+                compute_idna_label, options
+            )
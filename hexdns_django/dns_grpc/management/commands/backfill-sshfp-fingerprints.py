@@ -0,0 +1,13 @@
+from dns_grpc import models
+from dns_grpc.management import backfill
+
+
+class Command(backfill.BackfillCommand):
+    help = "Compute the stored algorithm and fingerprints of SSHFP host keys"
+    missing = "fingerprints"
+
+    def handle(self, *args, **options):
+        self.backfill(
+            models.SSHFPRecord.objects.only("id", "host_key"), {"key_algorithm__isnull": True},
+            models.SSHFPRecord.FINGERPRINT_FIELDS, models.SSHFPRecord.compute_fingerprints, options
+        )
@@ -0,0 +1,18 @@
+from dns_grpc import models
+from dns_grpc.management import backfill
+
+
+def compute_svcb_rdata(record: models.HTTPSRecord):
+    record.svcb_rdata = record.pack_svcb_record()
+
+
+class Command(backfill.BackfillCommand):
+    help = "Compute the stored wire format rdata of HTTPS records"
+    missing = "rdata"
+    skip_errors = (Exception,)
+
+    def handle(self, *args, **options):
+        self.backfill(
+            models.HTTPSRecord.objects.all(), {"svcb_rdata__isnull": True}, ["svcb_rdata"], compute_svcb_rdata,
+            options
+        )
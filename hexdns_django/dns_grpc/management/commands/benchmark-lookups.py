@@ -0,0 +1,153 @@
+import contextlib
+import datetime
+import hmac
+import unittest.mock
+import dnslib
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from dnslib import CLASS, OPCODE, QTYPE, RCODE
+from dns_grpc import benchmark, grpc, models
+
+
+def signed_update(key: models.DNSZoneUpdateSecrets, zone_root: str, i: int) -> bytes:
+    dns_req = dnslib.DNSRecord(dnslib.DNSHeader(id=i % 65536, opcode=OPCODE.UPDATE))
+    dns_req.add_question(dnslib.DNSQuestion(zone_root, QTYPE.SOA))
+    dns_req.add_auth(dnslib.RR(
+        f"_acme-challenge.bench{i}.{zone_root}", QTYPE.TXT, rdata=dnslib.TXT(f"token-{i}"), ttl=60
+    ))
+    msg = dns_req.pack()
+
+    key_name = dnslib.DNSLabel(f"{key.id}.{zone_root}")
+    tsig = grpc.TSIG(
+        alg_name=dnslib.DNSLabel("hmac-sha256"),
+        time_signed=datetime.datetime.utcnow(),
+        fudge=300,
+        mac=b"",
+        original_id=dns_req.header.id,
+        error=0,
+        other_data=b"",
+    )
+    key_buffer = dnslib.DNSBuffer()
+    key_buffer.encode_name_nocompress(key_name)
+    key_buffer.pack("!HI", getattr(CLASS, "*"), 0)
+    tsig.mac = hmac.new(
+        bytes(key.secret), msg + key_buffer.data + tsig.make_variables(), digestmod="sha256"
+    ).digest()
+
+    dns_req.add_ar(dnslib.RR(key_name, QTYPE.TSIG, getattr(CLASS, "*"), 0, dnslib.RD(tsig.make_tsig())))
+    return dns_req.pack()
+
+
+class Command(BaseCommand):
+    help = "Benchmark the authoritative lookup paths against synthetic zones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--zones", type=int, default=10)
+        parser.add_argument("--records", type=int, default=100, help="Records of each type per zone")
+        parser.add_argument(
+            "--mix", type=str, default=",".join(benchmark.DEFAULT_MIX),
+            help="Comma separated record types to seed"
+        )
+        parser.add_argument("--iterations", type=int, default=500)
+        parser.add_argument("--output", type=str, help="Write JSON results here instead of stdout")
+        parser.add_argument("--keep", action="store_true", help="Leave the synthetic zones in the database")
+        parser.add_argument(
+            "--check-accounts", action="store_true",
+            help="Look up zone owners' subscriptions in find_zone, this goes to Keycloak"
+        )
+
+    def handle(self, *args, **options):
+        if options["zones"] < 1 or options["records"] < 1 or options["iterations"] < 1:
+            raise CommandError("--zones, --records and --iterations must be positive")
+        mix = [t.strip().upper() for t in options["mix"].split(",") if t.strip()]
+
+        benchmark.remove_seeded_zones()
+        try:
+            zones = benchmark.seed_zones(options["zones"], options["records"], mix)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        try:
+            with contextlib.ExitStack() as stack:
+                if not options["check_accounts"]:
+                    stack.enter_context(unittest.mock.patch.object(
+                        grpc.DnsServiceServicer, "zone_active", staticmethod(lambda zone: True)
+                    ))
+                results = self.run_benchmarks(zones, options)
+        finally:
+            if not options["keep"]:
+                benchmark.remove_seeded_zones()
+
+        self.stderr.write(benchmark.format_results(results))
+        benchmark.write_results(options["output"], benchmark.results_document("lookups", {
+            "zones": options["zones"],
+            "records": options["records"],
+            "mix": mix,
+            "iterations": options["iterations"],
+            "check_accounts": options["check_accounts"],
+        }, results))
+
+    def run_benchmarks(self, zones: list, options) -> dict:
+        servicer = grpc.DnsServiceServicer()
+        records = options["records"]
+        iterations = options["iterations"]
+
+        def zone(i):
+            return zones[i % len(zones)]
+
+        def record_label(i):
+            return dnslib.DNSLabel(f"host{i % records}")
+
+        def lookup_referral(i):
+            dns_res = dnslib.DNSRecord()
+            servicer.lookup_referral(dns_res, record_label(i), zone(i), False)
+
+        results = {
+            "find_zone": benchmark.measure(
+                lambda i: servicer.find_zone(dnslib.DNSLabel(f"host{i % records}.{zone(i).zone_root}")),
+                iterations
+            ),
+            "find_zone_miss": benchmark.measure(
+                lambda i: servicer.find_zone(dnslib.DNSLabel(f"host{i}.example.invalid")), iterations
+            ),
+            "find_records": benchmark.measure(
+                lambda i: list(servicer.find_records(models.AddressRecord, record_label(i), zone(i))), iterations
+            ),
+            "find_records_wildcard": benchmark.measure(
+                lambda i: list(servicer.find_records(
+                    models.AddressRecord, dnslib.DNSLabel(f"missing{i}"), zone(i)
+                )), iterations
+            ),
+            "any_records": benchmark.measure(
+                lambda i: servicer.any_records(record_label(i), zone(i)), iterations
+            ),
+            "any_records_miss": benchmark.measure(
+                lambda i: servicer.any_records(dnslib.DNSLabel(f"missing{i}"), zone(i)), iterations
+            ),
+            "lookup_referral": benchmark.measure(lookup_referral, iterations),
+        }
+
+        keys = {}
+        for z in zones:
+            keys[z.id] = models.DNSZoneUpdateSecrets.objects.create(
+                zone=z, name="benchmark", type=models.DNSZoneUpdateSecrets.TYPE_ACME_DNS01
+            )
+
+        def update(i):
+            msg = signed_update(keys[zone(i).id], zone(i).zone_root, i)
+            # Rolled back so every run sees the same zone and no rebuilds are queued
+            with transaction.atomic():
+                dns_res = servicer.handle_update_query(dnslib.DNSRecord.parse(msg), msg)
+                transaction.set_rollback(True)
+            if dns_res.header.rcode != RCODE.NOERROR:
+                raise CommandError(f"Update refused with {RCODE.get(dns_res.header.rcode)}")
+
+        results["handle_update_query"] = benchmark.measure(update, iterations)
+
+        def axfr(i):
+            dns_req = dnslib.DNSRecord.question(zone(i).zone_root, "AXFR")
+            for _ in servicer.handle_axfr_query(dns_req):
+                pass
+
+        results["handle_axfr_query"] = benchmark.measure(axfr, iterations)
+        return results
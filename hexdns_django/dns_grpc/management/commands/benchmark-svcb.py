@@ -0,0 +1,247 @@
+import base64
+import os
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from dns_grpc import benchmark, svcb
+from dns_grpc.svcb import OctetParamData, SVCBParam, SVCBParamList
+
+ECH_CONFIG = base64.b64encode(os.urandom(320)).decode()
+ESCAPED_BLOB = "".join(f"\\{b:03d}" for b in os.urandom(256))
+
+# Values as they're typed into the extra parameters and list fields
+PARAM_LISTS = {
+    "params_short": "alpn=h3,h2 ipv4hint=192.0.2.1,192.0.2.2",
+    "params_typical": "alpn=h3,h2,http/1.1 no-default-alpn port=8443 ipv4hint=192.0.2.1,192.0.2.2 "
+                      "ipv6hint=2001:db8::1,2001:db8::2 key65000=hello",
+    "params_ech": f"alpn=h3,h2 ech=\"{ECH_CONFIG}\"",
+    "params_escaped": f"key65001=\"{ESCAPED_BLOB}\"",
+}
+LISTS = {
+    "list_alpn": "h3,h2,http/1.1",
+    "list_alpn_escaped": "\"h2\\,x,h3\\\\,http/1.1\"",
+    "list_ipv6": ",".join(f"2001:db8::{i:x}" for i in range(1, 33)),
+}
+
+
+# The original SVCB presentation format decoders, working a byte at a time off the front of a bytearray,
+# kept here as the reference the new parser's results and timings are checked against.
+
+
+def is_item_allowed_char(char: int):
+    if 0x00 <= char <= 0x2b or 0x2d <= char <= 0x5b or 0x5d <= char <= 0xff:
+        return True
+    else:
+        return False
+
+
+def is_non_special_char(char: int):
+    if char == 0x21 or 0x23 <= char <= 0x27 or 0x2a <= char <= 0x3a or 0x3c <= char <= 0x5b or 0x5d <= char <= 0x7e:
+        return True
+    else:
+        return False
+
+
+def is_non_digit_char(char: int):
+    if 0x21 <= char <= 0x2f or 0x3a <= char <= 0x7e:
+        return True
+    else:
+        return False
+
+
+def is_digit_char(char: int):
+    if 0x30 <= char <= 0x39:
+        return True
+    else:
+        return False
+
+
+def is_wsp(char: int):
+    # Space and tab
+    if char == 32 or char == 9:
+        return True
+    else:
+        return False
+
+
+def decode_escaped(data: bytearray):
+    try:
+        f = data.pop(0)
+        if is_non_digit_char(f):
+            return f
+        else:
+            d2 = data.pop(0)
+            d3 = data.pop(0)
+            if not (is_digit_char(f) and is_digit_char(d2) and is_digit_char(d3)):
+                raise ValidationError(f"Invalid escape value")
+            val = (f-0x30) * 100 + (d2 - 0x30) * 10 + (d3 - 0x30)
+            if val > 255:
+                raise ValidationError(f"Escaped byte {val} too large")
+            return val
+    except IndexError:
+        raise ValidationError("Unterminated escape sequence")
+
+
+def decode_contiguous_str(data: bytearray, allow_space=False):
+    out = bytearray()
+    try:
+        while True:
+            c = data.pop(0)
+            if c == 92:
+                out.append(decode_escaped(data))
+            elif is_non_special_char(c) or (c == 32 and allow_space):
+                out.append(c)
+            else:
+                data.insert(0, c)
+                return out
+    except IndexError:
+        return out
+
+
+def decode_char_str(data: bytearray):
+    if data[0] == 34:
+        data.pop(0)
+        out = decode_contiguous_str(data, allow_space=True)
+        if not len(data) or data.pop(0) != 34:
+            raise ValidationError("Unterminated quoted string")
+        return out
+    else:
+        return decode_contiguous_str(data)
+
+
+def decode_svcb_param_key(data: bytearray):
+    out = []
+    try:
+        while True:
+            c = data.pop(0)
+            # - char
+            if 0x61 <= c <= 0x7a or is_digit_char(c) or c == 45:
+                out.append(c)
+            else:
+                data.insert(0, c)
+                return out
+    except IndexError:
+        return out
+
+
+def decode_escaped_item(data: bytearray):
+    out = bytearray()
+    try:
+        while True:
+            c = data.pop(0)
+            if is_item_allowed_char(c):
+                out.append(c)
+            elif c == 92:
+                try:
+                    c = data.pop(0)
+                except IndexError:
+                    raise ValidationError("Unterminated escape sequence")
+                if c in (92, 44):
+                    out.append(c)
+                else:
+                    raise ValidationError(f"Invalid escape character: {chr(c)}")
+            else:
+                data.insert(0, c)
+                break
+    except IndexError:
+        pass
+    return bytes(out)
+
+
+def decode_svcb_comma_list(data: bytearray):
+    out = []
+    while True:
+        out.append(decode_escaped_item(data))
+
+        try:
+            c = data.pop(0)
+        except IndexError:
+            break
+
+        if c != 44:
+            raise ValidationError(f"Invalid list character: {chr(c)}")
+
+    return out
+
+
+def bytewise_decode_svcb_param_list(value: str):
+    params = {}
+    data = bytearray(value.encode("utf8"))
+    while True:
+        while is_wsp(data[0]):
+            data.pop(0)
+        key = bytes(decode_svcb_param_key(data)).decode("ascii")
+        if not len(data):
+            params[key] = bytearray()
+            break
+        c = data.pop(0)
+        # = char
+        if c == 61:
+            params[key] = decode_char_str(data)
+        # space char
+        elif is_wsp(c):
+            params[key] = bytearray()
+        else:
+            raise ValidationError("Invalid parameter separation")
+        if not len(data):
+            break
+
+    out = []
+    for key, data in params.items():
+        try:
+            out.append(SVCBParam(key, OctetParamData(data)))
+        except ValueError as e:
+            raise ValidationError(f"Invalid SVCB parameter: {e}")
+    return SVCBParamList(out)
+
+
+def bytewise_decode_list(value: str, name: str):
+    data = bytearray(value.encode("utf8"))
+    value = decode_char_str(data)
+    if len(data):
+        raise ValidationError(f"Left over data after decoding {name} list")
+    return decode_svcb_comma_list(value)
+
+
+def decoded(fn, *args):
+    try:
+        result = fn(*args)
+    except ValidationError as e:
+        return "error", e.messages
+    if isinstance(result, svcb.SVCBParamList):
+        return "ok", [(p.key, bytes(p.data.data)) for p in result.params]
+    return "ok", [bytes(v) for v in result]
+
+
+class Command(BaseCommand):
+    help = "Compare the SVCB presentation format parser with the original byte at a time decoders"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+        parser.add_argument("--output", type=str, help="Write JSON results here instead of stdout")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be positive")
+
+        cases = {}
+        for name, value in PARAM_LISTS.items():
+            cases[name] = (value, svcb.decode_svcb_param_list, bytewise_decode_svcb_param_list, ())
+        for name, value in LISTS.items():
+            cases[name] = (value, svcb.decode_list, bytewise_decode_list, ("list",))
+
+        results = {}
+        for name, (value, new, old, extra) in cases.items():
+            if decoded(new, value, *extra) != decoded(old, value, *extra):
+                raise CommandError(f"{name}: parsers disagree on {value!r}")
+
+            results[f"{name}_bytewise"] = benchmark.measure(lambda i: old(value, *extra), options["iterations"])
+            results[name] = benchmark.measure(lambda i: new(value, *extra), options["iterations"])
+            results[name]["speedup"] = results[f"{name}_bytewise"]["mean_ms"] / results[name]["mean_ms"]
+
+        self.stderr.write(benchmark.format_results(results))
+        for name in cases:
+            self.stderr.write(f"{name:<24} {results[name]['speedup']:>8.1f}x")
+        benchmark.write_results(options["output"], benchmark.results_document("svcb", {
+            "iterations": options["iterations"],
+            "inputs": {name: len(value) for name, (value, *_) in cases.items()},
+        }, results))
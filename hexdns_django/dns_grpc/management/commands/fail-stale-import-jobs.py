@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from dns_grpc import zone_import
+
+
+class Command(BaseCommand):
+    help = "Fails zone file imports left running by a worker that died"
+
+    def handle(self, *args, **options):
+        count = zone_import.fail_stale_jobs()
+        self.stdout.write(f"Failed {count} stale import jobs")
@@ -0,0 +1,244 @@
+import contextlib
+import cProfile
+import io
+import ipaddress
+import pstats
+import tempfile
+import types
+import unittest.mock
+import dnslib
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from dns_grpc import benchmark, models, snapshot, tasks
+
+GENERATORS = ("fzone", "rzone", "szone", "catalog", "signal")
+
+
+class LocalZoneStorage(FileSystemStorage):
+    """
+    Stands in for the S3 zone bucket, so upload times measure writing the file rather than the network.
+    """
+    storage_dir = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(location=self.storage_dir)
+
+    def get_available_name(self, name, max_length=None):
+        if self.exists(name):
+            self.delete(name)
+        return name
+
+
+class Command(BaseCommand):
+    help = "Time and profile zone file generation against synthetic zones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--zones", type=int, default=5)
+        parser.add_argument("--records", type=int, default=200, help="Records of each type per zone")
+        parser.add_argument(
+            "--mix", type=str, default=",".join(benchmark.DEFAULT_MIX),
+            help="Comma separated record types to seed"
+        )
+        parser.add_argument("--reverse-zones", type=int, default=1)
+        parser.add_argument("--secondary-zones", type=int, default=1)
+        parser.add_argument("--repeat", type=int, default=3, help="Builds of every zone to time")
+        parser.add_argument(
+            "--generators", type=str, default=",".join(GENERATORS),
+            help=f"Comma separated generators to run, out of {', '.join(GENERATORS)}"
+        )
+        parser.add_argument("--profile", choices=("cprofile", "pyinstrument"))
+        parser.add_argument("--profile-output", type=str, help="Where to save the profile")
+        parser.add_argument("--output", type=str, help="Write JSON results here instead of stdout")
+        parser.add_argument("--keep", action="store_true", help="Leave the synthetic zones in the database")
+        parser.add_argument(
+            "--check-accounts", action="store_true",
+            help="Look up zone owners in Keycloak rather than treating every zone as active"
+        )
+
+    def handle(self, *args, **options):
+        if options["zones"] < 1 or options["records"] < 1 or options["repeat"] < 1:
+            raise CommandError("--zones, --records and --repeat must be positive")
+        mix = [t.strip().upper() for t in options["mix"].split(",") if t.strip()]
+        generators = [g.strip() for g in options["generators"].split(",") if g.strip()]
+        unknown = [g for g in generators if g not in GENERATORS]
+        if unknown:
+            raise CommandError(f"Unknown generators: {', '.join(unknown)}")
+
+        profiler = self.make_profiler(options["profile"])
+
+        benchmark.remove_seeded_zones()
+        try:
+            zones = benchmark.seed_zones(options["zones"], options["records"], mix)
+        except ValueError as e:
+            raise CommandError(str(e))
+        reverse_zones = benchmark.seed_reverse_zones(options["reverse_zones"], options["records"])
+        secondary_zones = benchmark.seed_secondary_zones(options["secondary_zones"], options["records"])
+
+        try:
+            with tempfile.TemporaryDirectory() as storage_dir, self.isolate(storage_dir, options["check_accounts"]):
+                timers = {generator: benchmark.StageTimer() for generator in generators}
+                with profiler:
+                    for _ in range(options["repeat"]):
+                        # Rolled back so every run reserves a serial the same way and nothing is published
+                        with transaction.atomic():
+                            self.run_builds(generators, timers, zones, reverse_zones, secondary_zones)
+                            transaction.set_rollback(True)
+        finally:
+            if not options["keep"]:
+                benchmark.remove_seeded_zones()
+
+        records_per_zone = {
+            "fzone": options["records"] * len(mix),
+            "rzone": options["records"],
+            "szone": options["records"],
+        }
+        results = {
+            generator: timer.summary(records_per_zone.get(generator)) for generator, timer in timers.items()
+        }
+
+        for generator, stages in results.items():
+            for stage, result in stages.items():
+                line = f"{generator:<8} {stage:<8} {result['mean_ms']:>10.3f} ms {result['queries']:>7} queries"
+                if "ms_per_1k_records" in result:
+                    line += f" {result['ms_per_1k_records']:>10.3f} ms/1k records"
+                self.stderr.write(line)
+
+        profiler.report(self.stderr, options["profile_output"])
+        benchmark.write_results(options["output"], benchmark.results_document("zone-builds", {
+            "zones": options["zones"],
+            "records": options["records"],
+            "mix": mix,
+            "reverse_zones": options["reverse_zones"],
+            "secondary_zones": options["secondary_zones"],
+            "repeat": options["repeat"],
+            "check_accounts": options["check_accounts"],
+        }, results))
+
+    @staticmethod
+    @contextlib.contextmanager
+    def isolate(storage_dir: str, check_accounts: bool):
+        """
+        Keeps builds off S3, RabbitMQ and Celery, and unless asked treats every zone as owned by an active
+        account so Keycloak isn't hit per zone.
+        """
+        user = types.SimpleNamespace(
+            username="benchmark", account=types.SimpleNamespace(id=0, subscription_active=True)
+        )
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(unittest.mock.patch.object(LocalZoneStorage, "storage_dir", storage_dir))
+            stack.enter_context(unittest.mock.patch.object(tasks, "ZoneStorage", LocalZoneStorage))
+            stack.enter_context(unittest.mock.patch.object(tasks, "send_reload_message", lambda label: None))
+            stack.enter_context(unittest.mock.patch.object(tasks.update_rzone, "delay", lambda zone_id: None))
+            stack.enter_context(unittest.mock.patch.object(tasks.update_signal_zones, "delay", lambda: None))
+            stack.enter_context(unittest.mock.patch.object(tasks.sync_netnod_zones, "delay", lambda *a: None))
+            if not check_accounts:
+                for model in (models.DNSZone, models.ReverseDNSZone, models.SecondaryDNSZone):
+                    stack.enter_context(unittest.mock.patch.object(model, "get_user", lambda self: user))
+            yield
+
+    @staticmethod
+    def run_builds(generators, timers, zones, reverse_zones, secondary_zones):
+        if "fzone" in generators:
+            timer = timers["fzone"]
+            for zone in zones:
+                with timer.stage("query"):
+                    zone = snapshot.load_zone(zone.id)
+                with timer.stage("render"):
+                    zone_file = tasks.generate_fzone(zone)
+                with timer.stage("upload"):
+                    tasks.write_zone_file(zone_file, str(dnslib.DNSLabel(zone.zone_root)))
+
+        if "rzone" in generators:
+            timer = timers["rzone"]
+            for zone in reverse_zones:
+                with timer.stage("query"):
+                    zone = snapshot.load_reverse_zone(zone.id)
+                with timer.stage("render"):
+                    zone_file = tasks.generate_rzone(zone)
+                with timer.stage("upload"):
+                    zone_root = tasks.network_to_apra(
+                        ipaddress.ip_network((zone.zone_root_address, zone.zone_root_prefix))
+                    )
+                    tasks.write_zone_file(zone_file, str(zone_root))
+
+        if "szone" in generators:
+            timer = timers["szone"]
+            for zone in secondary_zones:
+                with timer.stage("query"):
+                    zone = models.SecondaryDNSZone.objects.get(id=zone.id)
+                with timer.stage("render"):
+                    zone_file = tasks.generate_szone(zone)
+                with timer.stage("upload"):
+                    tasks.write_zone_file(zone_file, str(dnslib.DNSLabel(zone.zone_root)))
+
+        # These two cover every zone in the database and upload as they go, so they're timed whole
+        if "catalog" in generators:
+            with timers["catalog"].stage("total"):
+                tasks.update_catalog()
+
+        if "signal" in generators:
+            with timers["signal"].stage("total"):
+                tasks.update_signal_zones()
+
+    @staticmethod
+    def make_profiler(kind):
+        if kind == "cprofile":
+            return CProfiler()
+        elif kind == "pyinstrument":
+            try:
+                import pyinstrument
+            except ImportError:
+                raise CommandError("pyinstrument isn't installed")
+            return PyinstrumentProfiler(pyinstrument.Profiler())
+        return NullProfiler()
+
+
+class NullProfiler:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def report(self, out, path):
+        pass
+
+
+class CProfiler(NullProfiler):
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.profile.disable()
+        return False
+
+    def report(self, out, path):
+        if path:
+            self.profile.dump_stats(path)
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats("cumulative").print_stats(30)
+        out.write(stream.getvalue())
+
+
+class PyinstrumentProfiler(NullProfiler):
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        self.profiler.start()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.stop()
+        return False
+
+    def report(self, out, path):
+        if path:
+            with open(path, "w") as f:
+                f.write(self.profiler.output_html())
+        out.write(self.profiler.output_text(unicode=True))
@@ -49,6 +49,7 @@ class Command(BaseCommand):
                     updated = True
 
             if updated:
+                models.DNSZoneJournal.invalidate(zone)
                 tasks.update_fzone.delay(zone.id)
 
         tasks.update_catalog.delay()
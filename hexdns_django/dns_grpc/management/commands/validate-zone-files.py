@@ -0,0 +1,145 @@
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import time
+import dnslib
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from dns_grpc import models, snapshot, tasks, zone_check
+
+# What DNSZone.export_zone_file writes, the rest are only in the served zone
+EXPORTED_RECORD_SETS = (
+    "dynamicaddressrecord_set", "addressrecord_set", "cnamerecord_set", "mxrecord_set", "nsrecord_set",
+    "txtrecord_set", "srvrecord_set", "caarecord_set", "naptrrecord_set", "dsrecord_set", "locrecord_set",
+    "hinforecord_set", "rprecord_set", "httpsrecord_set", "sshfprecord_set", "githubpagesrecord_set",
+)
+
+
+def zone_check_args(zone: models.DNSZone):
+    """
+    Everything a worker needs to check the zone, worked out here as it needs the database. The zone file
+    is rendered with the current serial rather than finalised, so checking never bumps a serial.
+    """
+    zone_root = dnslib.DNSLabel(zone.zone_root)
+    zone_body, _ = tasks.render_fzone(zone, zone_root)
+    generated = tasks.generate_zone_soa(zone, zone_root, zone.serial) + zone_body
+
+    expected = []
+    expected_export = []
+    skip_names = set()
+    zone_has_anames = bool(zone.anamerecord_set.all())
+    for record_set in (*snapshot.ZONE_RECORD_SETS, "anamerecord_set"):
+        for record in getattr(zone, record_set).all():
+            rrs = record.journal_rrs(zone_has_anames)
+            if rrs is None:
+                # Depends on more than this record, so whatever the zone file says at this name is left be
+                skip_names.add(str(record.dns_label).lower())
+                continue
+            expected.extend(rrs)
+            if record_set in EXPORTED_RECORD_SETS:
+                expected_export.extend(rrs)
+
+    return (
+        str(zone_root), generated, zone.export_zone_file(), zone_check.rrsets_from_rrs(expected),
+        zone_check.rrsets_from_rrs(expected_export), skip_names,
+    )
+
+
+class Command(BaseCommand):
+    help = "Check generated zone files and exports parse, hold the records in the database, and that exports " \
+           "import back to the same records"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--zone", type=str, action="append", help="Only check this zone, may be repeated")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parser processes")
+        parser.add_argument("--chunk-size", type=int, default=100, help="Zones loaded per database round")
+        parser.add_argument("--limit", type=int, default=10, help="Problems of each kind to print per zone")
+        parser.add_argument("--output", type=str, help="Write the zones with problems here as JSON")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be positive")
+
+        zones = snapshot.prefetch_zones(models.DNSZone.objects.order_by("id"))
+        if options["zone"]:
+            zones = zones.filter(zone_root__in=[z.lower().rstrip(".") for z in options["zone"]])
+
+        start = time.perf_counter()
+        checked = 0
+        totals = collections.Counter()
+        problems = []
+
+        def collect(future):
+            nonlocal checked
+            result = future.result()
+            checked += 1
+            if zone_check.has_problems(result):
+                problems.append(result)
+                self.report_zone(result, options["limit"])
+                for kind, value in result.items():
+                    if isinstance(value, list):
+                        totals[kind] += len(value)
+
+        # Workers are forked before the parent touches the database, so none of them share its connection
+        connections.close_all()
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=options["workers"], mp_context=multiprocessing.get_context("fork")
+        ) as pool:
+            pool.submit(int).result()
+
+            pending = set()
+            for zone in zones.iterator(chunk_size=options["chunk_size"]):
+                try:
+                    check_args = zone_check_args(zone)
+                except Exception as e:
+                    checked += 1
+                    result = {"zone": zone.zone_root, "render_errors": [f"{type(e).__name__}: {e}"]}
+                    problems.append(result)
+                    totals["render_errors"] += 1
+                    self.report_zone(result, options["limit"])
+                    continue
+
+                pending.add(pool.submit(zone_check.check_zone, *check_args))
+                # Rendering is usually the slower side, but don't let parsed files pile up if it isn't
+                if len(pending) >= options["workers"] * 4:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        collect(future)
+
+            for future in concurrent.futures.as_completed(pending):
+                collect(future)
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write(
+            f"Checked {checked} zones in {elapsed:.1f}s, {len(problems)} with problems"
+        )
+        for kind, count in sorted(totals.items()):
+            self.stderr.write(f"  {kind}: {count}")
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({
+                    "checked": checked,
+                    "seconds": elapsed,
+                    "totals": dict(totals),
+                    "zones": problems,
+                }, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+        if problems:
+            raise CommandError(f"{len(problems)} zones have problems")
+
+    def report_zone(self, result: dict, limit: int):
+        self.stdout.write(f"{result['zone']}:")
+        for kind, value in result.items():
+            if not isinstance(value, list) or not value:
+                continue
+            self.stdout.write(f"  {kind} ({len(value)}):")
+            for item in value[:limit]:
+                self.stdout.write(f"    {item}")
+            if len(value) > limit:
+                self.stdout.write(f"    ... and {len(value) - limit} more")
@@ -0,0 +1,129 @@
+import threading
+import time
+import grpc
+import prometheus_client
+from django.conf import settings
+from django.db import connection
+
+RPC_DURATION = prometheus_client.Histogram(
+    "hexdns_grpc_rpc_duration_seconds", "Time taken to handle a gRPC call", ["method"],
+)
+RPCS = prometheus_client.Counter(
+    "hexdns_grpc_rpcs", "gRPC calls handled", ["method", "outcome"],
+)
+RPC_QUERIES = prometheus_client.Histogram(
+    "hexdns_grpc_rpc_db_queries", "Database queries made by a gRPC call", ["method"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000),
+)
+RPC_ROWS = prometheus_client.Histogram(
+    "hexdns_grpc_rpc_db_rows", "Database rows fetched or changed by a gRPC call", ["method"],
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000),
+)
+CACHE_REQUESTS = prometheus_client.Counter(
+    "hexdns_cache_requests", "Lookups in in-process caches", ["cache", "result"],
+)
+
+_server_lock = threading.Lock()
+_server_started = False
+
+
+def start_metrics_server():
+    global _server_started
+    with _server_lock:
+        if _server_started or not settings.GRPC_METRICS_PORT:
+            return
+        prometheus_client.start_http_server(settings.GRPC_METRICS_PORT)
+        _server_started = True
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+class QueryCounter:
+    """
+    Django execute wrapper counting the queries and rows of whatever runs inside it on this thread.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        result = execute(sql, params, many, context)
+        rowcount = getattr(context["cursor"], "rowcount", -1)
+        if rowcount and rowcount > 0:
+            self.rows += rowcount
+        return result
+
+
+class RPCStats:
+    def __init__(self, method: str):
+        self.method = method
+        self.counter = QueryCounter()
+        self.start = time.perf_counter()
+
+    def finish(self, context, error: bool = False):
+        if error:
+            outcome = "exception"
+        else:
+            code = context.code() if hasattr(context, "code") else None
+            outcome = "ok" if code in (None, grpc.StatusCode.OK) else code.name.lower()
+
+        RPC_DURATION.labels(method=self.method).observe(time.perf_counter() - self.start)
+        RPCS.labels(method=self.method, outcome=outcome).inc()
+        RPC_QUERIES.labels(method=self.method).observe(self.counter.queries)
+        RPC_ROWS.labels(method=self.method).observe(self.counter.rows)
+
+
+def instrument_unary(behaviour, method: str):
+    def wrapper(request, context):
+        stats = RPCStats(method)
+        try:
+            with connection.execute_wrapper(stats.counter):
+                response = behaviour(request, context)
+        except BaseException:
+            stats.finish(context, error=True)
+            raise
+        stats.finish(context)
+        return response
+
+    return wrapper
+
+
+def instrument_stream(behaviour, method: str):
+    def wrapper(request, context):
+        stats = RPCStats(method)
+        try:
+            with connection.execute_wrapper(stats.counter):
+                # Time the whole stream, the servicer does its work while it's being consumed
+                yield from behaviour(request, context)
+        except BaseException:
+            stats.finish(context, error=True)
+            raise
+        stats.finish(context)
+
+    return wrapper
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """
+    Per-RPC latency, database query and row counts, exported for Prometheus. Enabled by listing it in
+    GRPCSERVER["interceptors"], which also starts the metrics endpoint on GRPC_METRICS_PORT.
+    """
+
+    def __init__(self):
+        start_metrics_server()
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        method = handler_call_details.method
+        if handler.unary_unary:
+            return handler._replace(unary_unary=instrument_unary(handler.unary_unary, method))
+        elif handler.unary_stream:
+            return handler._replace(unary_stream=instrument_stream(handler.unary_stream, method))
+        return handler
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.5 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+def backfill_serials(apps, schema_editor):
+    DNSZone = apps.get_model("dns_grpc", "DNSZone")
+    ReverseDNSZone = apps.get_model("dns_grpc", "ReverseDNSZone")
+
+    for zone_model in (DNSZone, ReverseDNSZone):
+        for zone in zone_model.objects.all():
+            zone_model.objects.filter(id=zone.id).update(serial=int(zone.last_modified.timestamp()))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0029_dnskeyrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dnszone",
+            name="serial",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dnszone",
+            name="zone_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="reversednszone",
+            name="serial",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="reversednszone",
+            name="zone_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_serials, migrations.RunPython.noop),
+    ]
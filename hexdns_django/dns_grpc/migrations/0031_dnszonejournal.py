@@ -0,0 +1,49 @@
+# Generated by Django 4.2.5 on 2026-10-19 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0030_dnszone_serial_dnszone_zone_hash_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DNSZoneJournal",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("timestamp", models.DateTimeField(auto_now_add=True)),
+                ("from_serial", models.PositiveIntegerField(blank=True, null=True)),
+                ("serial", models.PositiveIntegerField(blank=True, null=True)),
+                ("complete", models.BooleanField(default=True)),
+                ("removed", models.BinaryField(default=b"")),
+                ("added", models.BinaryField(default=b"")),
+                (
+                    "zone",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="journal",
+                        to="dns_grpc.dnszone",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["zone", "serial"], name="dns_grpc_dn_zone_id_f2ff59_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,148 @@
+# Generated by Django 4.2.5 on 2026-10-19 13:05
+
+from django.db import migrations, models
+import idna
+import string
+
+RECORD_MODELS = (
+    "addressrecord", "anamerecord", "caarecord", "cnamerecord", "dhcidrecord", "dnskeyrecord", "dsrecord",
+    "dynamicaddressrecord", "githubpagesrecord", "hinforecord", "httpsrecord", "locrecord", "mxrecord",
+    "naptrrecord", "nsrecord", "redirectrecord", "rprecord", "srvrecord", "sshfprecord", "txtrecord",
+)
+
+
+def make_idna_label(record_name):
+    if record_name.strip() == "@" or record_name.strip() == "":
+        return "@"
+    try:
+        return idna.encode(record_name, uts46=True).decode()
+    except idna.IDNAError:
+        allowed_chars = string.ascii_letters + string.digits + "-_ *."
+        if all(c in allowed_chars for c in record_name):
+            return record_name.replace(" ", "\\040")
+
+        return None
+
+
+def backfill_record_idna(apps, schema_editor):
+    for model_name in RECORD_MODELS:
+        record_model = apps.get_model("dns_grpc", model_name)
+        batch = []
+        for record in record_model.objects.only("id", "record_name").iterator():
+            record.record_idna = make_idna_label(record.record_name) or ""
+            batch.append(record)
+            if len(batch) >= 500:
+                record_model.objects.bulk_update(batch, ["record_idna"])
+                batch = []
+        if batch:
+            record_model.objects.bulk_update(batch, ["record_idna"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0031_dnszonejournal"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="addressrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="anamerecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="caarecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="cnamerecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="dhcidrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="dnskeyrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="dsrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="dynamicaddressrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="githubpagesrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="hinforecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="httpsrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="locrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="mxrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="naptrrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="nsrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="redirectrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="rprecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="srvrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="sshfprecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="txtrecord",
+            name="record_idna",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(backfill_record_idna, migrations.RunPython.noop),
+    ]
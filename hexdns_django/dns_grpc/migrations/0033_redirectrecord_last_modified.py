@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0032_addressrecord_record_idna_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="redirectrecord",
+            name="last_modified",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0033_redirectrecord_last_modified"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dnszone",
+            name="rebuild_scheduled",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
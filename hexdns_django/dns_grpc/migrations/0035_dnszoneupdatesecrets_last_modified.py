@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0034_dnszone_rebuild_scheduled"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dnszoneupdatesecrets",
+            name="last_modified",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0035_dnszoneupdatesecrets_last_modified"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sshfprecord",
+            name="key_algorithm",
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="sshfprecord",
+            name="fingerprint_sha1",
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="sshfprecord",
+            name="fingerprint_sha256",
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
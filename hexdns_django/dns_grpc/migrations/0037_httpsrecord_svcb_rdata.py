@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0036_sshfprecord_fingerprints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="httpsrecord",
+            name="svcb_rdata",
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
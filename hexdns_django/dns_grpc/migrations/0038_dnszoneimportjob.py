@@ -0,0 +1,58 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:20
+
+import as207960_utils.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0037_httpsrecord_svcb_rdata"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DNSZoneImportJob",
+            fields=[
+                (
+                    "id",
+                    as207960_utils.models.TypedUUIDField(
+                        data_type="hexdns_zoneimportjob", primary_key=True, serialize=False
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("last_modified", models.DateTimeField(auto_now=True)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("complete", "Complete"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("overwrite", models.BooleanField(default=False)),
+                ("zone_data", models.TextField(blank=True)),
+                ("records_total", models.PositiveIntegerField(blank=True, null=True)),
+                ("records_parsed", models.PositiveIntegerField(default=0)),
+                ("records_imported", models.PositiveIntegerField(default=0)),
+                ("records_skipped", models.PositiveIntegerField(default=0)),
+                ("errors", models.JSONField(blank=True, default=list)),
+                (
+                    "zone",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="import_jobs",
+                        to="dns_grpc.dnszone",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created"],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-19 18:05
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0038_dnszoneimportjob"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="dnszone",
+            index=models.Index(
+                django.db.models.functions.text.Reverse("zone_root"),
+                name="dnszone_zone_root_reversed",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="secondarydnszone",
+            index=models.Index(
+                django.db.models.functions.text.Reverse("zone_root"),
+                name="szone_zone_root_reversed",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-19 19:10
+
+import dns_grpc.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0039_zone_root_reversed_index"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="dnszoneimportjob",
+            name="zone_data",
+        ),
+        migrations.AddField(
+            model_name="dnszoneimportjob",
+            name="zone_file",
+            field=models.FileField(
+                blank=True,
+                storage=dns_grpc.models.zone_import_storage,
+                upload_to=dns_grpc.models.zone_import_path,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-19 19:40
+
+from django.db import migrations
+from django.db.models import Q
+
+
+def normalise_zone_roots(apps, schema_editor):
+    DNSZone = apps.get_model("dns_grpc", "DNSZone")
+    SecondaryDNSZone = apps.get_model("dns_grpc", "SecondaryDNSZone")
+
+    for zone_model in (DNSZone, SecondaryDNSZone):
+        for zone in zone_model.objects.filter(Q(zone_root__endswith=".") | Q(zone_root__regex="[A-Z]")):
+            zone_model.objects.filter(id=zone.id).update(zone_root=zone.zone_root.rstrip(".").lower())
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0040_dnszoneimportjob_zone_file"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalise_zone_roots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.5 on 2026-10-19 20:05
+
+from django.db import migrations, models
+
+
+def create_counters(apps, schema_editor):
+    ChangeCounter = apps.get_model("dns_grpc", "ChangeCounter")
+    ChangeCounter.objects.get_or_create(name="redirects")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0041_normalise_zone_roots"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeCounter",
+            fields=[
+                ("name", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("value", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.5 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dns_grpc", "0042_changecounter"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="dnszone",
+            name="serial",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="reversednszone",
+            name="serial",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="dnszonejournal",
+            name="from_serial",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="dnszonejournal",
+            name="serial",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
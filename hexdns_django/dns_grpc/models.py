@@ -5,8 +5,9 @@ import struct
 import math
 import secrets
 import hashlib
+import functools
+import typing
 import idna
-import django_keycloak_auth.clients
 import dnslib
 import codecs
 import sshpubkeys
@@ -17,10 +18,10 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models, transaction
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 import as207960_utils.models
-from . import svcb, tasks
+from . import keycloak_cache, snapshot, svcb, tasks
 
 if settings.KUBE_IN_CLUSTER:
     kubernetes.config.load_incluster_config()
@@ -36,15 +37,61 @@ class DNSError(Exception):
         super().__init__(message)
 
 
+ZONE_BUILDER_FIELDS = ("serial", "zone_hash", "rebuild_scheduled")
+
+
+def normalise_zone_root(zone_root: str) -> str:
+    # Stored without the trailing dot and in lower case, overlap checks compare the stored names directly
+    return zone_root.rstrip(".").lower()
+
+
+def zone_save_kwargs(zone, kwargs):
+    # The SOA serial and rebuild state are only ever changed by the zone builder, make sure a stale instance
+    # saved from a view can't roll them back.
+    if not zone._state.adding and "update_fields" not in kwargs:
+        kwargs["update_fields"] = [
+            f.name for f in zone._meta.concrete_fields if not f.primary_key and f.name not in ZONE_BUILDER_FIELDS
+        ]
+    return kwargs
+
+
 class Account(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     subscription_id = models.CharField(max_length=255, blank=True, null=True)
     subscription_active = models.BooleanField(default=False)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_subscription_active = instance.__dict__.get("subscription_active")
+        return instance
+
     def __str__(self):
         return str(self.user)
 
 
+class ChangeCounter(models.Model):
+    """
+    Bumped in the same transaction as every change to some set of data, so processes caching it can tell
+    with one read whether it's still current. Unlike timestamps, a change committing late still moves it.
+    """
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    REDIRECTS = "redirects"
+
+    @classmethod
+    def bump(cls, name: str):
+        if not cls.objects.filter(name=name).update(value=models.F("value") + 1):
+            _, created = cls.objects.get_or_create(name=name, defaults={"value": 1})
+            if not created:
+                cls.objects.filter(name=name).update(value=models.F("value") + 1)
+
+    @classmethod
+    def read(cls, name: str) -> int:
+        return cls.objects.filter(name=name).values_list("value", flat=True).first() or 0
+
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_profile(sender, instance, created, **kwargs):
     if created or not hasattr(instance, "account"):
@@ -62,6 +109,9 @@ class DNSZone(models.Model):
     num_check_fails = models.PositiveIntegerField(default=0)
     resource_id = models.UUIDField(null=True, db_index=True)
     cds_disable = models.BooleanField(default=False, blank=True)
+    serial = models.PositiveBigIntegerField(default=0)
+    zone_hash = models.CharField(max_length=64, blank=True, null=True)
+    rebuild_scheduled = models.DateTimeField(blank=True, null=True)
 
     def __init__(self, *args, user=None, **kwargs):
         self.user = user
@@ -69,20 +119,18 @@ class DNSZone(models.Model):
 
     @classmethod
     def get_object_list(cls, access_token: str, action='view'):
-        return cls.objects.filter(resource_id__in=as207960_utils.models.get_object_ids(access_token, 'zone', action))
+        return cls.objects.filter(
+            resource_id__in=keycloak_cache.get_object_ids(access_token, 'zone', action))
 
     @classmethod
     def has_class_scope(cls, access_token: str, action='view'):
-        scope_name = f"{action}-zone"
-        return django_keycloak_auth.clients.get_authz_client() \
-            .eval_permission(access_token, f"zone", scope_name)
+        return keycloak_cache.eval_class_permission(access_token, 'zone', action)
 
     def has_scope(self, access_token: str, action='view'):
-        scope_name = f"{action}-zone"
-        return as207960_utils.models.eval_permission(access_token, self.resource_id, scope_name)
+        return keycloak_cache.eval_permission(access_token, self.resource_id, 'zone', action)
 
     def save(self, *args, **kwargs):
-        self.zone_root = self.zone_root.lower()
+        self.zone_root = normalise_zone_root(self.zone_root)
         as207960_utils.models.sync_resource_to_keycloak(
             self,
             display_name="Zone", scopes=[
@@ -91,7 +139,7 @@ class DNSZone(models.Model):
                 'delete-zone',
             ],
             urn="urn:as207960:hexdns:zone", super_save=super().save, view_name='edit_zone',
-            args=args, kwargs=kwargs
+            args=args, kwargs=zone_save_kwargs(self, kwargs)
         )
 
     def delete(self, *args, **kwargs):
@@ -104,6 +152,7 @@ class DNSZone(models.Model):
     class Meta:
         verbose_name = "DNS Zone"
         verbose_name_plural = "DNS Zones"
+        indexes = [models.Index(models.functions.Reverse("zone_root"), name="dnszone_zone_root_reversed")]
 
     def __str__(self):
         return self.zone_root
@@ -134,80 +183,66 @@ class DNSZone(models.Model):
             data="v=DMARC1;p=reject;sp=reject;adkim=s;aspf=s",
         ).save()
 
-    def import_zone_file(self, zone_data, overwrite=False):
-        suffix = dnslib.DNSLabel(self.zone_root)
-        p = dnslib.ZoneParser(zone_data, origin=suffix)
-        try:
-            records = list(p)
-        except (dnslib.DNSError, ValueError, IndexError) as e:
-            raise ValueError(f"Invalid zone file: {str(e)}")
-        else:
-            with transaction.atomic():
-                if overwrite:
-                    self.addressrecord_set.all().delete()
-                    self.cnamerecord_set.all().delete()
-                    self.mxrecord_set.all().delete()
-                    self.nsrecord_set.all().delete()
-                    self.txtrecord_set.all().delete()
-                    self.srvrecord_set.all().delete()
-                    self.caarecord_set.all().delete()
-                    self.naptrrecord_set.all().delete()
-                    self.dnskeyrecord_set.all().delete()
-
-                for record in records:
-                    if record.rclass != dnslib.CLASS.IN:
-                        continue
-                    if record.rtype == dnslib.QTYPE.A:
-                        r = AddressRecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.AAAA:
-                        r = AddressRecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.CNAME:
-                        r = CNAMERecord.from_rr(record, self)
-                        self.cnamerecord_set.filter(record_name=r.record_name).delete()
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.MX:
-                        r = MXRecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.NS:
-                        r = NSRecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.TXT:
-                        r = TXTRecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.SRV:
-                        r = SRVRecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.CAA:
-                        r = CAARecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.NAPTR:
-                        r = NAPTRRecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
-                    elif record.rtype == dnslib.QTYPE.DNSKEY:
-                        r = DNSKEYRecord.from_rr(record, self)
-                        if r.ttl <= 1:
-                            r.ttl = 3600
-                        r.save()
+    def export_zone_file(self) -> str:
+        return "\n".join(self.export_lines())
+
+    def export_records(self, record_set: str, batch_size: typing.Optional[int] = None):
+        records = getattr(self, record_set)
+        if batch_size is None or snapshot.is_prefetched(self, record_set):
+            return records.all()
+        return iter_batches(records.all(), batch_size)
+
+    def export_lines(self, batch_size: typing.Optional[int] = None) -> typing.Iterator[str]:
+        """
+        The zone file lines of the records users can export. With a batch size, record sets that aren't
+        prefetched are read that many rows at a time, so a zone of any size is exported in bounded memory.
+        """
+        yield f"$ORIGIN {self.zone_root}"
+
+        for ns in self.custom_ns.all():
+            yield dnslib.RR("@", dnslib.QTYPE.NS, rdata=dnslib.NS(ns.nameserver), ttl=86400).toZone()
+
+        for record in self.export_records("dynamicaddressrecord_set", batch_size):
+            v4_rr = record.to_rr_v4(record.dns_label)
+            v6_rr = record.to_rr_v6(record.dns_label)
+            if v4_rr:
+                yield v4_rr.toZone()
+            if v6_rr:
+                yield v6_rr.toZone()
+
+        for record_set in (
+                "addressrecord_set", "cnamerecord_set", "mxrecord_set", "nsrecord_set", "txtrecord_set",
+                "srvrecord_set", "caarecord_set", "naptrrecord_set", "dsrecord_set", "locrecord_set",
+                "hinforecord_set", "rprecord_set", "httpsrecord_set",
+        ):
+            for record in self.export_records(record_set, batch_size):
+                yield record.to_rr(record.dns_label).toZone()
+
+        for record in self.export_records("sshfprecord_set", batch_size):
+            for rr in record.to_rrs(record.dns_label):
+                yield rr.toZone()
+
+        for record in self.export_records("githubpagesrecord_set", batch_size):
+            for rr in record.to_rrs_v4(record.dns_label):
+                yield rr.toZone()
+            for rr in record.to_rrs_v6(record.dns_label):
+                yield rr.toZone()
+
+
+def iter_batches(queryset, batch_size: int):
+    """
+    Rows of the queryset in primary key order, fetched batch_size at a time by key rather than through a
+    server side cursor, so nothing is held open on the database between batches.
+    """
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1].pk
 
 
 def hex_validator(value):
@@ -234,10 +269,12 @@ class DNSZoneAdditionalCDS(models.Model):
 
     def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.dns_zone.id)
+        DNSZoneJournal.invalidate(self.dns_zone)
         return super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         tasks.update_fzone.delay(self.dns_zone.id)
+        DNSZoneJournal.invalidate(self.dns_zone)
         return super().delete(*args, **kwargs)
 
 
@@ -251,10 +288,12 @@ class DNSZoneAdditionalCDNSKEY(models.Model):
 
     def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.dns_zone.id)
+        DNSZoneJournal.invalidate(self.dns_zone)
         return super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         tasks.update_fzone.delay(self.dns_zone.id)
+        DNSZoneJournal.invalidate(self.dns_zone)
         return super().delete(*args, **kwargs)
 
 
@@ -266,13 +305,155 @@ class DNSZoneCustomNS(models.Model):
     def save(self, *args, **kwargs):
         self.nameserver = self.nameserver.lower()
         tasks.update_fzone.delay(self.dns_zone.id)
+        DNSZoneJournal.invalidate(self.dns_zone)
         return super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         tasks.update_fzone.delay(self.dns_zone.id)
+        DNSZoneJournal.invalidate(self.dns_zone)
         return super().delete(*args, **kwargs)
 
 
+class DNSZoneJournal(models.Model):
+    zone = models.ForeignKey(DNSZone, on_delete=models.CASCADE, related_name='journal')
+    timestamp = models.DateTimeField(auto_now_add=True)
+    # Both serials are filled in by the zone builder once the change is published
+    from_serial = models.PositiveBigIntegerField(blank=True, null=True)
+    serial = models.PositiveBigIntegerField(blank=True, null=True)
+    # An incomplete entry is a change that can't be expressed as RRs, IXFR has to fall back to AXFR over it
+    complete = models.BooleanField(default=True)
+    removed = models.BinaryField(default=b"")
+    added = models.BinaryField(default=b"")
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['zone', 'serial'])]
+
+    def __str__(self):
+        return f"{self.zone} {self.from_serial} -> {self.serial}"
+
+    @staticmethod
+    def pack_rrs(rrs) -> bytes:
+        out = b""
+        for rr in rrs:
+            buffer = dnslib.DNSBuffer()
+            rr.pack(buffer)
+            out += struct.pack("!H", len(buffer.data)) + buffer.data
+        return out
+
+    @staticmethod
+    def split_rrs(data) -> list:
+        data = bytes(data)
+        out = []
+        offset = 0
+        while offset < len(data):
+            rr_len, = struct.unpack("!H", data[offset:offset + 2])
+            out.append(data[offset + 2:offset + 2 + rr_len])
+            offset += 2 + rr_len
+        return out
+
+    @staticmethod
+    def parse_rr(rr_data: bytes):
+        return dnslib.RR.parse(dnslib.DNSBuffer(rr_data))
+
+    @classmethod
+    def invalidate(cls, zone):
+        cls.objects.create(zone=zone, complete=False)
+
+    @classmethod
+    def record_change(cls, zone, old_record, new_record):
+        cls.record_changes(zone, [(old_record, new_record)])
+
+    @classmethod
+    def record_changes(cls, zone, changes):
+        """
+        Journals a list of (old record, new record) pairs as one entry, either side may be None.
+        """
+        # Only address records care, so the zone is asked at most once per entry and only when there's one
+        zone_has_anames = any(
+            isinstance(record, AddressRecord) for change in changes for record in change
+        ) and zone.anamerecord_set.exists()
+
+        removed = []
+        added = []
+        try:
+            for old_record, new_record in changes:
+                old_rrs = old_record.journal_rrs(zone_has_anames) if old_record else []
+                new_rrs = new_record.journal_rrs(zone_has_anames) if new_record else []
+                if old_rrs is None or new_rrs is None:
+                    removed = added = None
+                    break
+                removed.extend(old_rrs)
+                added.extend(new_rrs)
+            if removed is not None:
+                removed = cls.pack_rrs(removed)
+                added = cls.pack_rrs(added)
+        except (dnslib.DNSError, ValueError, struct.error):
+            # Never fail a record save over RRs that won't pack, just make IXFR fall back to AXFR
+            removed = added = None
+
+        if removed is None or added is None:
+            cls.invalidate(zone)
+            return
+
+        if removed != added:
+            cls.objects.create(zone=zone, removed=removed, added=added)
+
+
+def zone_import_storage():
+    return tasks.ZoneImportStorage()
+
+
+def zone_import_path(instance, _filename):
+    return f"{instance.zone_id}/{uuid.uuid4()}.zone"
+
+
+class DNSZoneImportJob(models.Model):
+    STATE_PENDING = "pending"
+    STATE_RUNNING = "running"
+    STATE_COMPLETE = "complete"
+    STATE_FAILED = "failed"
+
+    STATES = (
+        (STATE_PENDING, "Pending"),
+        (STATE_RUNNING, "Running"),
+        (STATE_COMPLETE, "Complete"),
+        (STATE_FAILED, "Failed"),
+    )
+
+    id = as207960_utils.models.TypedUUIDField("hexdns_zoneimportjob", primary_key=True)
+    zone = models.ForeignKey(DNSZone, on_delete=models.CASCADE, related_name='import_jobs')
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    state = models.CharField(max_length=16, choices=STATES, default=STATE_PENDING)
+    overwrite = models.BooleanField(default=False)
+    # The uploaded file, deleted once the import has finished with it
+    zone_file = models.FileField(storage=zone_import_storage, upload_to=zone_import_path, blank=True)
+    records_total = models.PositiveIntegerField(blank=True, null=True)
+    records_parsed = models.PositiveIntegerField(default=0)
+    records_imported = models.PositiveIntegerField(default=0)
+    records_skipped = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f"{self.zone} import {self.created} ({self.state})"
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (self.STATE_COMPLETE, self.STATE_FAILED)
+
+    @property
+    def progress(self) -> typing.Optional[float]:
+        if self.state == self.STATE_COMPLETE:
+            return 1.0
+        if not self.records_total:
+            return None
+        return (self.records_imported + self.records_skipped) / self.records_total
+
+
 def make_update_secret():
     return secrets.token_bytes(64)
 
@@ -295,6 +476,7 @@ class DNSZoneUpdateSecrets(models.Model):
     )
     secret = models.BinaryField(default=make_update_secret)
     last_used = models.DateTimeField(null=True, blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name} ({self.id}.{self.zone.zone_root})"
@@ -368,6 +550,8 @@ class ReverseDNSZone(models.Model):
     num_check_fails = models.PositiveIntegerField(default=0)
     resource_id = models.UUIDField(null=True, db_index=True)
     cds_disable = models.BooleanField(default=False, blank=True)
+    serial = models.PositiveBigIntegerField(default=0)
+    zone_hash = models.CharField(max_length=64, blank=True, null=True)
 
     def __init__(self, *args, user=None, **kwargs):
         self.user = user
@@ -376,17 +560,14 @@ class ReverseDNSZone(models.Model):
     @classmethod
     def get_object_list(cls, access_token: str, action='view'):
         return cls.objects.filter(
-            resource_id__in=as207960_utils.models.get_object_ids(access_token, 'reverse-zone', action))
+            resource_id__in=keycloak_cache.get_object_ids(access_token, 'reverse-zone', action))
 
     @classmethod
     def has_class_scope(cls, access_token: str, action='view'):
-        scope_name = f"{action}-reverse-zone"
-        return django_keycloak_auth.clients.get_authz_client() \
-            .eval_permission(access_token, f"reverse-zone", scope_name)
+        return keycloak_cache.eval_class_permission(access_token, 'reverse-zone', action)
 
     def has_scope(self, access_token: str, action='view'):
-        scope_name = f"{action}-reverse-zone"
-        return as207960_utils.models.eval_permission(access_token, self.resource_id, scope_name)
+        return keycloak_cache.eval_permission(access_token, self.resource_id, 'reverse-zone', action)
 
     def save(self, *args, **kwargs):
         as207960_utils.models.sync_resource_to_keycloak(
@@ -397,7 +578,7 @@ class ReverseDNSZone(models.Model):
                 'delete-reverse-zone',
             ],
             urn="urn:as207960:hexdns:reverse_zone", super_save=super().save, view_name='edit_rzone',
-            args=args, kwargs=kwargs
+            args=args, kwargs=zone_save_kwargs(self, kwargs)
         )
 
     def delete(self, *args, **kwargs):
@@ -552,20 +733,17 @@ class SecondaryDNSZone(models.Model):
     @classmethod
     def get_object_list(cls, access_token: str, action='view'):
         return cls.objects.filter(
-            resource_id__in=as207960_utils.models.get_object_ids(access_token, 'secondary-zone', action))
+            resource_id__in=keycloak_cache.get_object_ids(access_token, 'secondary-zone', action))
 
     @classmethod
     def has_class_scope(cls, access_token: str, action='view'):
-        scope_name = f"{action}-secondary-zone"
-        return django_keycloak_auth.clients.get_authz_client() \
-            .eval_permission(access_token, f"secondary-zone", scope_name)
+        return keycloak_cache.eval_class_permission(access_token, 'secondary-zone', action)
 
     def has_scope(self, access_token: str, action='view'):
-        scope_name = f"{action}-secondary-zone"
-        return as207960_utils.models.eval_permission(access_token, self.resource_id, scope_name)
+        return keycloak_cache.eval_permission(access_token, self.resource_id, 'secondary-zone', action)
 
     def save(self, *args, **kwargs):
-        self.zone_root = self.zone_root.lower()
+        self.zone_root = normalise_zone_root(self.zone_root)
         as207960_utils.models.sync_resource_to_keycloak(
             self,
             display_name="Secondary zone", scopes=[
@@ -587,6 +765,7 @@ class SecondaryDNSZone(models.Model):
     class Meta:
         verbose_name = "Secondary DNS Zone"
         verbose_name_plural = "Secondary DNS Zones"
+        indexes = [models.Index(models.functions.Reverse("zone_root"), name="szone_zone_root_reversed")]
 
     def __str__(self):
         return self.zone_root
@@ -605,21 +784,107 @@ class SecondaryDNSZoneRecord(models.Model):
         return self.record_text
 
 
+@functools.lru_cache(maxsize=65536)
+def make_idna_label(record_name: str):
+    if record_name.strip() == "@" or record_name.strip() == '':
+        return "@"
+    try:
+        return idna.encode(record_name, uts46=True).decode()
+    except idna.IDNAError:
+        allowed_chars = string.ascii_letters + string.digits + "-_ *."
+        if all(c in allowed_chars for c in record_name):
+            return record_name.replace(" ", "\\040")
+
+        return None
+
+
 class DNSZoneRecord(models.Model):
     zone = models.ForeignKey(DNSZone, on_delete=models.CASCADE)
     record_name = models.CharField(
         max_length=255, default="@", verbose_name="Record name (@ for zone root)"
     )
+    # IDNA form of record_name, worked out on save. Empty if it has none, NULL if not yet computed.
+    record_idna = models.CharField(max_length=255, blank=True, null=True, editable=False)
     ttl = models.PositiveIntegerField(verbose_name="Time to Live (seconds)", default=3600)
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        record_idna = instance.__dict__.get("record_idna")
+        if record_idna is not None and "record_name" in instance.__dict__:
+            instance._idna_label_cache = (instance.record_name, record_idna or None)
+        # What's in the database, so a save can journal what it replaced without reading it back
+        instance._loaded_state = (db, field_names, values)
+        return instance
+
+    def loaded_record(self):
+        """
+        A copy of the record as it was loaded or last saved, None if that isn't known for every field.
+        """
+        loaded_state = self.__dict__.get("_loaded_state")
+        if not loaded_state:
+            return None
+        db, field_names, values = loaded_state
+        if len(field_names) != len(self._meta.concrete_fields):
+            return None
+        return type(self).from_db(db, field_names, values)
+
+    def remember_saved_state(self):
+        field_names = [f.attname for f in self._meta.concrete_fields if f.attname in self.__dict__]
+        self._loaded_state = (self._state.db, field_names, [self.__dict__[name] for name in field_names])
+
+    def normalise(self):
+        """
+        Canonical forms of the record's fields, as stored. Bulk writes that skip save() must call this.
+        """
         self.record_name = self.record_name.lower()
-        return super().save(*args, **kwargs)
+        self.record_idna = self.idna_label or ""
+
+    def save(self, *args, **kwargs):
+        self.normalise()
+        if "update_fields" in kwargs and "record_name" in kwargs["update_fields"]:
+            kwargs["update_fields"] = list(kwargs["update_fields"]) + ["record_idna"]
+        old_record = None
+        if not self._state.adding:
+            old_record = self.loaded_record() or type(self).objects.filter(pk=self.pk).first()
+            if old_record and old_record.zone_id == self.zone_id:
+                old_record.zone = self.zone
+        with transaction.atomic():
+            ret = super().save(*args, **kwargs)
+            if old_record and old_record.zone_id != self.zone_id:
+                # Moved between zones, gone from the one and new in the other
+                DNSZoneJournal.record_change(old_record.zone, old_record, None)
+                DNSZoneJournal.record_change(self.zone, None, self)
+            else:
+                DNSZoneJournal.record_change(self.zone, old_record, self)
+        self.remember_saved_state()
+        return ret
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            DNSZoneJournal.record_change(self.zone, self, None)
+            return super().delete(*args, **kwargs)
 
     class Meta:
         abstract = True
         ordering = ['record_name']
 
+    def zone_rrs(self):
+        """
+        The RRs this record puts in the zone, as served by AXFR.
+        """
+        if not self.idna_label:
+            return []
+        rr = self.to_rr(self.dns_label)
+        return [rr] if rr else []
+
+    def journal_rrs(self, zone_has_anames: bool):
+        """
+        The RRs this record puts in the zone, for the IXFR journal.
+        None means they can't be worked out from this record alone.
+        """
+        return self.zone_rrs()
+
     @property
     def dns_label(self):
         if self.record_name == "@":
@@ -633,16 +898,13 @@ class DNSZoneRecord(models.Model):
 
     @property
     def idna_label(self):
-        if self.record_name.strip() == "@" or self.record_name.strip() == '':
-            return "@"
-        try:
-            return idna.encode(self.record_name, uts46=True).decode()
-        except idna.IDNAError:
-            allowed_chars = string.ascii_letters + string.digits + "-_ *."
-            if all(c in allowed_chars for c in self.record_name):
-                return self.record_name.replace(" ", "\\040")
-
-            return None
+        # Keyed on the name so an edit to record_name on this instance is still seen
+        cached = self.__dict__.get("_idna_label_cache")
+        if cached and cached[0] == self.record_name:
+            return cached[1]
+        label = make_idna_label(self.record_name)
+        self._idna_label_cache = (self.record_name, label)
+        return label
 
     @classmethod
     def dns_label_to_record_name(cls, rname, zone):
@@ -720,6 +982,12 @@ class AddressRecord(DNSZoneRecord):
         self.ttl = rr.ttl
         self.address = str(rr.rdata)
 
+    def journal_rrs(self, zone_has_anames: bool):
+        # ANAMEs pointing into the zone copy address records, so a change here can change them too
+        if zone_has_anames:
+            return None
+        return super().journal_rrs(zone_has_anames)
+
     def to_rr(self, query_name):
         address = ipaddress.ip_address(self.address)
         if type(address) == ipaddress.IPv4Address:
@@ -777,6 +1045,12 @@ class DynamicAddressRecord(DNSZoneRecord):
             ttl=self.ttl,
         )
 
+    def zone_rrs(self):
+        if not self.idna_label:
+            return []
+        query_name = self.dns_label
+        return list(filter(None, [self.to_rr_v4(query_name), self.to_rr_v6(query_name)]))
+
     def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.zone.id)
         return super().save(*args, **kwargs)
@@ -790,8 +1064,11 @@ class ANAMERecord(DNSZoneRecord):
     id = as207960_utils.models.TypedUUIDField(f"hexdns_zoneanamerecord", primary_key=True)
     alias = models.CharField(max_length=255)
 
-    def save(self, *args, **kwargs):
+    def normalise(self):
+        super().normalise()
         self.alias = self.alias.lower()
+
+    def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.zone.id)
         return super().save(*args, **kwargs)
 
@@ -808,7 +1085,10 @@ class ANAMERecord(DNSZoneRecord):
         if alias_label.matchSuffix(zone_label):
             own_record_name = alias_label.stripSuffix(zone_label)
             search_name = ".".join(map(lambda n: n.decode(), own_record_name.label))
-            own_records = self.zone.addressrecord_set.filter(record_name=search_name)
+            if snapshot.is_prefetched(self.zone, "addressrecord_set"):
+                own_records = [r for r in self.zone.addressrecord_set.all() if r.record_name == search_name]
+            else:
+                own_records = self.zone.addressrecord_set.filter(record_name=search_name)
             for r in own_records:
                 address = ipaddress.ip_address(r.address)
                 if type(address) == ipaddress.IPv4Address and qtype == dnslib.QTYPE.A:
@@ -851,6 +1131,16 @@ class ANAMERecord(DNSZoneRecord):
     def to_rrs_v6(self, query_name):
         return self.to_rrs(dnslib.QTYPE.AAAA, query_name)
 
+    def zone_rrs(self):
+        if not self.idna_label:
+            return []
+        query_name = self.dns_label
+        return self.to_rrs_v4(query_name) + self.to_rrs_v6(query_name)
+
+    def journal_rrs(self, zone_has_anames: bool):
+        # Depends on the resolver cache and other records, not just this one
+        return None
+
     class Meta(DNSZoneRecord.Meta):
         verbose_name = "ANAME record"
         verbose_name_plural = "ANAME records"
@@ -893,8 +1183,11 @@ class CNAMERecord(DNSZoneRecord):
 
         super().clean_fields(exclude=exclude)
 
-    def save(self, *args, **kwargs):
+    def normalise(self):
+        super().normalise()
         self.alias = self.alias.lower()
+
+    def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.zone.id)
         return super().save(*args, **kwargs)
 
@@ -954,6 +1247,7 @@ class RedirectRecord(DNSZoneRecord):
     id = as207960_utils.models.TypedUUIDField(f"hexdns_zoneredirectrecord", primary_key=True)
     target = models.URLField()
     include_path = models.BooleanField(blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.zone.id)
@@ -1041,6 +1335,12 @@ class RedirectRecord(DNSZoneRecord):
             ttl=self.ttl,
         )
 
+    def zone_rrs(self):
+        if not self.idna_label:
+            return []
+        query_name = self.dns_label
+        return [self.to_rr_v4(query_name), self.to_rr_v6(query_name), self.to_rr_caa(query_name)]
+
     class Meta(DNSZoneRecord.Meta):
         verbose_name = "Redirect record"
         verbose_name_plural = "Redirect records"
@@ -1070,9 +1370,12 @@ class MXRecord(DNSZoneRecord):
         self.exchange = str(rr.rdata.label)
         self.priority = rr.rdata.preference
 
+    def normalise(self):
+        super().normalise()
+        self.exchange = self.exchange.lower()
+
     def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.zone.id)
-        self.exchange = self.exchange.lower()
         return super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
@@ -1113,9 +1416,12 @@ class NSRecord(DNSZoneRecord):
         self.ttl = rr.ttl
         self.nameserver = str(rr.rdata.label)
 
+    def normalise(self):
+        super().normalise()
+        self.nameserver = self.nameserver.lower()
+
     def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.zone.id)
-        self.nameserver = self.nameserver.lower()
         return super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
@@ -1369,26 +1675,40 @@ class SSHFP(dnslib.RD):
 class SSHFPRecord(DNSZoneRecord):
     id = as207960_utils.models.TypedUUIDField(f"hexdns_zonesshfprecord", primary_key=True)
     host_key = models.TextField(verbose_name="Host key (from /etc/ssh/ssh_host_ed25519_key.pub etc.)")
+    # Worked out from host_key on save. 0 if the key has no SSHFP algorithm, NULL if not yet computed.
+    key_algorithm = models.PositiveSmallIntegerField(blank=True, null=True, editable=False)
+    fingerprint_sha1 = models.BinaryField(blank=True, null=True, editable=False)
+    fingerprint_sha256 = models.BinaryField(blank=True, null=True, editable=False)
+
+    FINGERPRINT_FIELDS = ("key_algorithm", "fingerprint_sha1", "fingerprint_sha256")
 
     @property
     def key(self):
+        cached = self.__dict__.get("_key_cache")
+        if cached and cached[0] == self.host_key:
+            return cached[1]
         key = sshpubkeys.SSHKey(self.host_key, strict=False)
         key.parse()
+        self._key_cache = (self.host_key, key)
         return key
 
     def clean(self):
-        key = sshpubkeys.SSHKey(self.host_key, strict=False)
         try:
-            key.parse()
+            self.key
         except sshpubkeys.InvalidKeyError as e:
             raise ValidationError({"host_key": f"Invalid key: {e}"})
         except NotImplementedError as e:
             raise ValidationError({"host_key": f"Invalid key type: {e}"})
 
-    def to_rrs(self, query_name):
-        out = []
-        pubkey = self.key
-        if pubkey.key_type == b"ssh-rsa":
+    def compute_fingerprints(self):
+        try:
+            pubkey = self.key
+        except (sshpubkeys.InvalidKeyError, NotImplementedError):
+            pubkey = None
+
+        if pubkey is None:
+            algo_num = 0
+        elif pubkey.key_type == b"ssh-rsa":
             algo_num = 1
         elif pubkey.key_type == b"ssh-dsa":
             algo_num = 2
@@ -1397,26 +1717,47 @@ class SSHFPRecord(DNSZoneRecord):
         elif pubkey.key_type == b"ssh-ed25519":
             algo_num = 4
         else:
-            return []
-        out.append(
-            dnslib.RR(
-                query_name, dnslib.QTYPE.SSHFP, rdata=SSHFP(
-                    algo_num,
-                    1,
-                    hashlib.sha1(pubkey._decoded_key).digest()
-                ), ttl=self.ttl,
-            )
-        )
-        out.append(
+            algo_num = 0
+
+        self.key_algorithm = algo_num
+        if algo_num:
+            self.fingerprint_sha1 = hashlib.sha1(pubkey._decoded_key).digest()
+            self.fingerprint_sha256 = hashlib.sha256(pubkey._decoded_key).digest()
+        else:
+            self.fingerprint_sha1 = None
+            self.fingerprint_sha256 = None
+
+    def normalise(self):
+        super().normalise()
+        self.compute_fingerprints()
+
+    @property
+    def fingerprints(self):
+        """
+        (algorithm, [(fingerprint type, fingerprint)]) for the zone, empty for keys SSHFP can't describe.
+        Rows from before the fingerprints were stored are worked out on the fly.
+        """
+        if self.key_algorithm is None:
+            self.compute_fingerprints()
+        if not self.key_algorithm:
+            return self.key_algorithm, []
+        return self.key_algorithm, [
+            (1, bytes(self.fingerprint_sha1)),
+            (2, bytes(self.fingerprint_sha256)),
+        ]
+
+    def to_rrs(self, query_name):
+        algo_num, fingerprints = self.fingerprints
+        return [
             dnslib.RR(
-                query_name, dnslib.QTYPE.SSHFP, rdata=SSHFP(
-                    algo_num,
-                    2,
-                    hashlib.sha256(pubkey._decoded_key).digest()
-                ), ttl=self.ttl,
-            )
-        )
-        return out
+                query_name, dnslib.QTYPE.SSHFP, rdata=SSHFP(algo_num, fingerprint_type, fingerprint), ttl=self.ttl,
+            ) for fingerprint_type, fingerprint in fingerprints
+        ]
+
+    def zone_rrs(self):
+        if not self.idna_label:
+            return []
+        return self.to_rrs(self.dns_label)
 
     class Meta(DNSZoneRecord.Meta):
         verbose_name = "SSHFP record"
@@ -1424,6 +1765,8 @@ class SSHFPRecord(DNSZoneRecord):
         indexes = [models.Index(fields=['record_name', 'zone'])]
 
     def save(self, *args, **kwargs):
+        if "update_fields" in kwargs and "host_key" in kwargs["update_fields"]:
+            kwargs["update_fields"] = list(kwargs["update_fields"]) + list(self.FINGERPRINT_FIELDS)
         tasks.update_fzone.delay(self.zone.id)
         return super().save(*args, **kwargs)
 
@@ -1818,9 +2161,12 @@ class RPRecord(DNSZoneRecord):
     mailbox = models.CharField(max_length=255)
     txt = models.CharField(max_length=255)
 
-    def save(self, *args, **kwargs):
+    def normalise(self):
+        super().normalise()
         self.mailbox = self.mailbox.lower()
         self.txt = self.txt.lower()
+
+    def save(self, *args, **kwargs):
         tasks.update_fzone.delay(self.zone.id)
         return super().save(*args, **kwargs)
 
@@ -1933,6 +2279,8 @@ class SVCBBaseRecord(DNSZoneRecord):
         blank=True, help_text="Extra SVCB parameters not otherwise broken out into individual fields",
         verbose_name="Extra parameters"
     )
+    # Packed rdata, worked out from the fields above on save. NULL if not yet computed.
+    svcb_rdata = models.BinaryField(blank=True, null=True, editable=False)
 
     def __init__(self, *args, **kwargs):
         self.__alpn_cache = None
@@ -2091,10 +2439,34 @@ class SVCBBaseRecord(DNSZoneRecord):
                 "port": "Port must be set when a scheme is"
             })
 
-    def save(self, *args, **kwargs):
+    def pack_svcb_record(self) -> bytes:
+        buf = dnslib.DNSBuffer()
+        self.svcb_record.pack(buf)
+        return bytes(buf.data)
+
+    def normalise(self):
+        super().normalise()
         self.target = self.target.lower()
+        try:
+            self.svcb_rdata = self.pack_svcb_record()
+        except (ValidationError, ValueError, binascii.Error):
+            # Left for the zone build to report, as it did before the rdata was stored
+            self.svcb_rdata = None
+
+    def save(self, *args, **kwargs):
+        if "update_fields" in kwargs:
+            kwargs["update_fields"] = list(kwargs["update_fields"]) + ["target", "svcb_rdata"]
         return super().save(*args, **kwargs)
 
+    @property
+    def svcb_wire(self) -> bytes:
+        """
+        The packed rdata, as stored. Rows from before it was stored are packed on the fly.
+        """
+        if self.svcb_rdata is None:
+            return self.pack_svcb_record()
+        return bytes(self.svcb_rdata)
+
     @property
     def svcb_record_name(self):
         if not self.port and not self.scheme:
@@ -2175,7 +2547,8 @@ class HTTPSRecord(SVCBBaseRecord):
         if self.http2_support:
             v = data["alpn"]
             if v:
-                v.data.alpns.append(b"h2")
+                # Replaced rather than appended to, the parsed ALPNs are cached on the instance
+                data.params[data.params.index(v)] = svcb.SVCBParam("alpn", svcb.ALPNData(v.data.alpns + [b"h2"]))
             if not v:
                 data.params.append(svcb.SVCBParam("alpn", svcb.ALPNData([b"h2"])))
         return data, mandatory
@@ -2231,7 +2604,7 @@ class HTTPSRecord(SVCBBaseRecord):
         return dnslib.RR(
             query_name,
             dnslib.QTYPE.HTTPS,
-            rdata=self.svcb_record,
+            rdata=dnslib.RD(self.svcb_wire),
             ttl=self.ttl
         )
 
@@ -2415,6 +2788,12 @@ class GitHubPagesRecord(DNSZoneRecord):
     def to_rrs_v6(self, _query_name):
         return []
 
+    def zone_rrs(self):
+        if not self.idna_label:
+            return []
+        query_name = self.dns_label
+        return self.to_rrs_v4(query_name) + self.to_rrs_v6(query_name)
+
     class Meta:
         verbose_name = "GitHub Pages record"
         verbose_name_plural = "GitHub Pages records"
@@ -2427,3 +2806,27 @@ class GitHubPagesRecord(DNSZoneRecord):
     def delete(self, *args, **kwargs):
         tasks.update_fzone.delay(self.zone.id)
         return super().delete(*args, **kwargs)
+
+
+# Everything the redirect servers' host maps depend on: the redirects themselves, which zones exist and so
+# own which names, and whether the owning account's subscription is active. Queryset deletes still send
+# post_delete per object.
+@receiver(post_save, sender=RedirectRecord)
+@receiver(post_delete, sender=RedirectRecord)
+@receiver(post_delete, sender=DNSZone)
+def bump_redirect_counter(sender, **kwargs):
+    ChangeCounter.bump(ChangeCounter.REDIRECTS)
+
+
+@receiver(post_save, sender=Account)
+def bump_redirect_counter_subscription(sender, instance, **kwargs):
+    # Accounts are saved on every login, only a subscription change matters here
+    if instance.subscription_active != instance.__dict__.get("_saved_subscription_active"):
+        instance._saved_subscription_active = instance.subscription_active
+        ChangeCounter.bump(ChangeCounter.REDIRECTS)
+
+
+@receiver(post_save, sender=DNSZone)
+def bump_redirect_counter_zone_created(sender, instance, created, **kwargs):
+    if created:
+        ChangeCounter.bump(ChangeCounter.REDIRECTS)
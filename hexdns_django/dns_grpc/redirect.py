@@ -1,10 +1,29 @@
-import dnslib
+import asyncio
 import datetime
 import django
+from asgiref.sync import sync_to_async
 
 django.setup()
 
-from . import models, grpc
+from django.conf import settings
+from . import redirect_cache
+
+host_map = redirect_cache.RedirectHostMap(ttl=settings.REDIRECT_CACHE_TTL)
+host_map_task = None
+
+
+def redirect_headers(target: redirect_cache.RedirectTarget, path: str):
+    location = target.target
+    if target.include_path:
+        location += path
+
+    now = datetime.datetime.utcnow()
+    expiry = now + datetime.timedelta(seconds=target.ttl)
+    return [
+        ("Location", location),
+        ("Date", now.strftime("%a, %d %b %Y %H:%M:%S GMT")),
+        ("Expires", expiry.strftime("%a, %d %b %Y %H:%M:%S GMT")),
+    ]
 
 
 def application(environ: dict, start_response):
@@ -18,29 +37,78 @@ def application(environ: dict, start_response):
         start_response("404 Not Found", headers)
         return []
 
-    host_parts = host.split(":", 1)
-    host_dns_label = dnslib.DNSLabel(host_parts[0])
-    zone, record_name = grpc.DnsServiceServicer.find_zone(host_dns_label)
-
-    if not zone:
+    redirect_target = redirect_cache.redirect_cache.lookup(host)
+    if not redirect_target:
         start_response("404 Not Found", headers)
         return []
 
-    redirect_record = grpc.DnsServiceServicer.find_records(models.RedirectRecord, record_name, zone).first()
-    if not redirect_record:
-        start_response("404 Not Found", headers)
-        return []
+    headers.extend(redirect_headers(redirect_target, environ.get("PATH_INFO", "")))
 
-    target = redirect_record.target
-    if redirect_record.include_path:
-        target += environ.get("PATH_INFO", "")
+    start_response("308 Permanent Redirect", headers)
+    return []
 
-    headers.append(("Location", target))
 
-    now = datetime.datetime.utcnow()
-    expiry = now + datetime.timedelta(seconds=redirect_record.ttl)
-    headers.append(("Date", now.strftime("%a, %d %b %Y %H:%M:%S GMT")))
-    headers.append(("Expires", expiry.strftime("%a, %d %b %Y %H:%M:%S GMT")))
+async def refresh_host_map():
+    while True:
+        try:
+            marker = await sync_to_async(redirect_cache.redirect_marker, thread_sensitive=False)()
+            if host_map.needs_refresh(marker):
+                await sync_to_async(host_map.refresh, thread_sensitive=False)(marker)
+        except Exception as e:
+            # Keep serving the last good map, misses still go to the database
+            print(f"Failed to refresh redirect map: {e}", flush=True)
+        await asyncio.sleep(settings.REDIRECT_CACHE_CHECK_INTERVAL)
 
-    start_response("308 Permanent Redirect", headers)
-    return []
+
+def start_host_map_refresh():
+    global host_map_task
+    if not host_map_task or host_map_task.done():
+        host_map_task = asyncio.get_running_loop().create_task(refresh_host_map())
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_host_map_refresh()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if host_map_task:
+                host_map_task.cancel()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def asgi_application(scope: dict, receive, send):
+    if scope["type"] == "lifespan":
+        await handle_lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    # Servers without lifespan support get the refresh started on the first request instead
+    start_host_map_refresh()
+
+    headers = [
+        (b"server", b"HexDNS Redirect Server")
+    ]
+
+    host = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"host"), None)
+    redirect_target = None
+    if host:
+        hit, redirect_target = host_map.get(host)
+        if not hit:
+            redirect_target = await sync_to_async(
+                redirect_cache.redirect_cache.lookup, thread_sensitive=False
+            )(host)
+
+    if not redirect_target:
+        status = 404
+    else:
+        status = 308
+        headers.extend(
+            (k.lower().encode(), v.encode()) for k, v in redirect_headers(redirect_target, scope.get("path", ""))
+        )
+
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": b""})
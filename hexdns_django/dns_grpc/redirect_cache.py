@@ -0,0 +1,167 @@
+import collections
+import time
+import typing
+import dnslib
+from django.conf import settings
+from . import models, grpc, keycloak_cache, ttl_cache
+
+RedirectTarget = collections.namedtuple("RedirectTarget", ("target", "include_path", "ttl"))
+# Cached unknown hosts are stored as None, so misses need telling apart from them
+MISSING = object()
+
+
+def normalise_host(host: str) -> str:
+    return host.split(":", 1)[0].rstrip(".").lower()
+
+
+def load_redirect(host: str) -> typing.Optional[RedirectTarget]:
+    zone, record_name = grpc.DnsServiceServicer.find_zone(dnslib.DNSLabel(host))
+    if not zone:
+        return None
+
+    redirect_record = grpc.DnsServiceServicer.find_records(models.RedirectRecord, record_name, zone).first()
+    if not redirect_record:
+        return None
+
+    return RedirectTarget(redirect_record.target, redirect_record.include_path, redirect_record.ttl)
+
+
+def redirect_marker():
+    # Bumped by every redirect change, zone creation or deletion and subscription change, whichever process
+    # makes it, see models.bump_redirect_counter
+    return models.ChangeCounter.read(models.ChangeCounter.REDIRECTS)
+
+
+class RedirectCache(ttl_cache.TTLCache):
+    """
+    Host to redirect target map for the redirect servers. Unknown hosts are cached as well so random
+    hostnames pointed at us don't reach the database on every request. Changes are noticed by polling the
+    redirect change counter every few seconds, the processes making them are never the redirect servers.
+    """
+
+    def __init__(self, ttl: int, negative_ttl: int, max_size: int, check_interval: int):
+        super().__init__(ttl=ttl, max_size=max_size, marker=redirect_marker, check_interval=check_interval)
+        self.negative_ttl = negative_ttl
+
+    def lookup(self, host: str) -> typing.Optional[RedirectTarget]:
+        host = normalise_host(host)
+        self.check_stale()
+        value = self.get(host, MISSING)
+        if value is not MISSING:
+            return value
+        value = load_redirect(host)
+        self.put(host, value, ttl=None if value else self.negative_ttl)
+        return value
+
+
+def label_name(labels) -> str:
+    return ".".join(l.decode().lower() for l in labels)
+
+
+def zone_owner_id(zone: models.DNSZone):
+    # Owners only change when a zone changes hands, so the Keycloak lookup goes through the permission
+    # cache instead of being made for every zone on every rebuild
+    def fetch():
+        user = zone.get_user()
+        return user.pk if user else None
+
+    return keycloak_cache.cached(("zone_owner", str(zone.resource_id)), fetch)
+
+
+def load_active_zones(zones: typing.Iterable[models.DNSZone], previous: dict) -> dict:
+    """
+    Whether each zone's owner has an active subscription, by zone ID. Owners are asked of Keycloak one
+    zone at a time, a zone whose owner can't be found keeps its state from the previous load, and is
+    served if it has none.
+    """
+    owners = {}
+    active_zones = {}
+    for zone in zones:
+        try:
+            owners[zone.id] = zone_owner_id(zone)
+        except Exception as e:
+            print(f"Failed to find owner of zone {zone.zone_root}: {e}", flush=True)
+            active_zones[zone.id] = previous.get(zone.id, True)
+
+    active_owners = set(models.Account.objects.filter(
+        user_id__in=set(owners.values()), subscription_active=True
+    ).values_list("user_id", flat=True))
+    for zone_id, owner_id in owners.items():
+        active_zones[zone_id] = owner_id in active_owners
+
+    return active_zones
+
+
+def load_redirect_map(previous_active_zones: typing.Optional[dict] = None) -> (dict, set, dict):
+    """
+    Every redirect whose zone would actually be picked by find_zone for its host, keyed by host. Names
+    shadowed by a longer zone are left out, so they're looked up from the database like any other miss.
+    """
+    zone_roots = set(
+        label_name(dnslib.DNSLabel(zone_root).label)
+        for zone_root in models.DNSZone.objects.values_list("zone_root", flat=True)
+    )
+    records = list(models.RedirectRecord.objects.select_related("zone"))
+    active_zones = load_active_zones(
+        {record.zone_id: record.zone for record in records}.values(), previous_active_zones or {}
+    )
+    hosts = {}
+
+    for record in records:
+        if not active_zones[record.zone_id] or not record.idna_label:
+            continue
+
+        labels = record.dns_label.label
+        zone_labels = dnslib.DNSLabel(record.zone.zone_root).label
+        if any(label_name(labels[i:]) in zone_roots for i in range(len(labels) - len(zone_labels))):
+            continue
+
+        hosts.setdefault(label_name(labels), RedirectTarget(record.target, record.include_path, record.ttl))
+
+    return hosts, zone_roots, active_zones
+
+
+class RedirectHostMap:
+    """
+    Preloaded copy of every redirect, for the async redirect server. Rebuilt in the background whenever
+    the change counter moves, and at least once per cache TTL for owners Keycloak couldn't be asked about.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.hosts = {}
+        self.zone_roots = set()
+        self.active_zones = {}
+        self.marker = None
+        self.loaded_at = None
+
+    def get(self, host: str):
+        host = normalise_host(host)
+        value = self.hosts.get(host)
+        if value:
+            return True, value
+
+        labels = host.split(".")
+        if len(labels) > 1 and host not in self.zone_roots:
+            value = self.hosts.get(".".join(["*"] + labels[1:]))
+            if value:
+                return True, value
+
+        return False, None
+
+    def needs_refresh(self, marker) -> bool:
+        return self.loaded_at is None or marker != self.marker or time.monotonic() - self.loaded_at > self.ttl
+
+    def refresh(self, marker):
+        hosts, zone_roots, active_zones = load_redirect_map(self.active_zones)
+        self.hosts, self.zone_roots, self.active_zones = hosts, zone_roots, active_zones
+        self.marker = marker
+        self.loaded_at = time.monotonic()
+
+
+redirect_cache = RedirectCache(
+    ttl=settings.REDIRECT_CACHE_TTL,
+    negative_ttl=settings.REDIRECT_CACHE_NEGATIVE_TTL,
+    max_size=settings.REDIRECT_CACHE_SIZE,
+    check_interval=settings.REDIRECT_CACHE_CHECK_INTERVAL,
+)
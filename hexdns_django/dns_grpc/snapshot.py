@@ -0,0 +1,54 @@
+from django.db.models import Prefetch, prefetch_related_objects
+from . import models
+
+ZONE_RECORD_SETS = (
+    "addressrecord_set", "dynamicaddressrecord_set", "cnamerecord_set", "redirectrecord_set", "mxrecord_set",
+    "nsrecord_set", "txtrecord_set", "srvrecord_set", "caarecord_set", "naptrrecord_set", "sshfprecord_set",
+    "dsrecord_set", "dnskeyrecord_set", "locrecord_set", "hinforecord_set", "rprecord_set", "httpsrecord_set",
+    "dhcidrecord_set", "githubpagesrecord_set",
+)
+REVERSE_ZONE_RECORD_SETS = (
+    "ptrrecord_set", "reversensrecord_set",
+)
+
+
+def zone_prefetches() -> list:
+    return [
+        *ZONE_RECORD_SETS,
+        Prefetch("anamerecord_set", queryset=models.ANAMERecord.objects.prefetch_related("cached")),
+        Prefetch("custom_ns", queryset=models.DNSZoneCustomNS.objects.order_by("pk")),
+        "additional_cds", "additional_cdnskey",
+    ]
+
+
+def reverse_zone_prefetches() -> list:
+    return [
+        *REVERSE_ZONE_RECORD_SETS,
+        Prefetch("custom_ns", queryset=models.ReverseDNSZoneCustomNS.objects.order_by("pk")),
+        "additional_cds", "additional_cdnskey",
+    ]
+
+
+def prefetch_zones(queryset):
+    """
+    Pulls in every record set of the zones in the queryset with one query per record type, so renderers
+    walking zone.<type>_set.all() and record.zone don't go back to the database per record.
+    """
+    return queryset.prefetch_related(*zone_prefetches())
+
+
+def fill_zone(zone: "models.DNSZone") -> "models.DNSZone":
+    prefetch_related_objects([zone], *zone_prefetches())
+    return zone
+
+
+def load_zone(zone_id) -> "models.DNSZone":
+    return prefetch_zones(models.DNSZone.objects.all()).get(id=zone_id)
+
+
+def load_reverse_zone(zone_id) -> "models.ReverseDNSZone":
+    return models.ReverseDNSZone.objects.prefetch_related(*reverse_zone_prefetches()).get(id=zone_id)
+
+
+def is_prefetched(instance, name: str) -> bool:
+    return name in getattr(instance, "_prefetched_objects_cache", {})
@@ -1,5 +1,6 @@
 import typing
 import ipaddress
+import re
 import dnslib
 import struct
 from django.core.exceptions import ValidationError
@@ -17,162 +18,146 @@ def svcb_fetch_port_blocking(port: int):
         return False
 
 
-def is_item_allowed_char(char: int):
-    if 0x00 <= char <= 0x2b or 0x2d <= char <= 0x5b or 0x5d <= char <= 0xff:
-        return True
-    else:
-        return False
-
-
-def is_non_special_char(char: int):
-    if char == 0x21 or 0x23 <= char <= 0x27 or 0x2a <= char <= 0x3a or 0x3c <= char <= 0x5b or 0x5d <= char <= 0x7e:
-        return True
-    else:
-        return False
-
-
-def is_non_digit_char(char: int):
-    if 0x21 <= char <= 0x2f or 0x3a <= char <= 0x7e:
-        return True
-    else:
-        return False
-
-
-def is_digit_char(char: int):
-    if 0x30 <= char <= 0x39:
-        return True
-    else:
-        return False
-
-
-def is_wsp(char: int):
-    # Space and tab
-    if char == 32 or char == 9:
-        return True
-    else:
-        return False
-
-
-def decode_escaped(data: bytearray):
-    try:
-        f = data.pop(0)
-        if is_non_digit_char(f):
-            return f
-        else:
-            d2 = data.pop(0)
-            d3 = data.pop(0)
-            if not (is_digit_char(f) and is_digit_char(d2) and is_digit_char(d3)):
-                raise ValidationError(f"Invalid escape value")
-            val = (f-0x30) * 100 + (d2 - 0x30) * 10 + (d3 - 0x30)
-            if val > 255:
-                raise ValidationError(f"Escaped byte {val} too large")
-            return val
-    except IndexError:
+# Character classes of the RFC 9460 presentation format, as regex sets over bytes
+NON_SPECIAL = rb"\x21\x23-\x27\x2a-\x3a\x3c-\x5b\x5d-\x7e"
+ESCAPE = rb"\\(?:[0-9]{3}|[\x21-\x2f\x3a-\x7e])"
+CONTIGUOUS_STR = re.compile(rb"(?:[" + NON_SPECIAL + rb"]+|" + ESCAPE + rb")*")
+QUOTED_STR = re.compile(rb"(?:[\x20" + NON_SPECIAL + rb"]+|" + ESCAPE + rb")*")
+ESCAPE_SEQUENCE = re.compile(rb"(" + ESCAPE + rb")")
+PARAM_KEY = re.compile(rb"[a-z0-9-]*")
+WSP_RUN = re.compile(rb"[ \t]*")
+LIST_ITEM_RUN = re.compile(rb"[^,\\]*")
+# Bytes that stand for themselves after a backslash, anything else has to be a three digit decimal
+ESCAPE_LITERAL = bytes(0x21 <= c <= 0x2f or 0x3a <= c <= 0x7e for c in range(256))
+
+
+def decode_escaped(data: memoryview, pos: int) -> typing.Tuple[int, int]:
+    """
+    Decodes the escape after a backslash at pos, returning the byte and where decoding got to.
+    """
+    if pos >= len(data):
+        raise ValidationError("Unterminated escape sequence")
+    f = data[pos]
+    if ESCAPE_LITERAL[f]:
+        return f, pos + 1
+    if pos + 3 > len(data):
         raise ValidationError("Unterminated escape sequence")
+    digits = bytes(data[pos:pos + 3])
+    if not digits.isdigit():
+        raise ValidationError(f"Invalid escape value")
+    val = int(digits)
+    if val > 255:
+        raise ValidationError(f"Escaped byte {val} too large")
+    return val, pos + 3
 
 
-def decode_contiguous_str(data: bytearray, allow_space=False):
-    out = bytearray()
-    try:
-        while True:
-            c = data.pop(0)
-            if c == 92:
-                out.append(decode_escaped(data))
-            elif is_non_special_char(c) or (c == 32 and allow_space):
-                out.append(c)
-            else:
-                data.insert(0, c)
-                return out
-    except IndexError:
-        return out
+# Every well formed escape sequence and the byte it stands for
+UNESCAPED = {
+    **{b"\\" + bytes((c,)): bytes((c,)) for c in range(256) if ESCAPE_LITERAL[c]},
+    **{b"\\%03d" % c: bytes((c,)) for c in range(256)},
+}
 
 
-def decode_char_str(data: bytearray):
-    if data[0] == 34:
-        data.pop(0)
-        out = decode_contiguous_str(data, allow_space=True)
-        if not len(data) or data.pop(0) != 34:
+def unescape(data: bytes) -> bytes:
+    # Splitting on the escapes leaves them at the odd indices
+    parts = ESCAPE_SEQUENCE.split(data)
+    try:
+        parts[1::2] = [UNESCAPED[p] for p in parts[1::2]]
+    except KeyError as e:
+        raise ValidationError(f"Escaped byte {int(e.args[0][1:])} too large")
+    return b"".join(parts)
+
+
+def decode_contiguous_str(data: memoryview, pos: int, allow_space=False) -> typing.Tuple[bytes, int]:
+    m = (QUOTED_STR if allow_space else CONTIGUOUS_STR).match(data, pos)
+    out = bytes(m.group())
+    pos = m.end()
+    if 0x5c in out:
+        out = unescape(out)
+    if pos < len(data) and data[pos] == 0x5c:
+        # The regex takes every well formed escape, so this raises the error for the one that isn't
+        decode_escaped(data, pos + 1)
+    return out, pos
+
+
+def decode_char_str(data: memoryview, pos: int = 0) -> typing.Tuple[bytes, int]:
+    if pos < len(data) and data[pos] == 0x22:
+        out, pos = decode_contiguous_str(data, pos + 1, allow_space=True)
+        if pos >= len(data) or data[pos] != 0x22:
             raise ValidationError("Unterminated quoted string")
-        return out
+        return out, pos + 1
     else:
-        return decode_contiguous_str(data)
+        return decode_contiguous_str(data, pos)
 
 
-def decode_svcb_param_key(data: bytearray):
-    out = []
-    try:
-        while True:
-            c = data.pop(0)
-            # - char
-            if 0x61 <= c <= 0x7a or is_digit_char(c) or c == 45:
-                out.append(c)
-            else:
-                data.insert(0, c)
-                return out
-    except IndexError:
-        return out
-
+def decode_svcb_comma_list(data: bytes) -> typing.List[bytes]:
+    if 0x5c not in data:
+        return data.split(b",")
 
-def decode_escaped_item(data: bytearray):
-    out = bytearray()
-    try:
-        while True:
-            c = data.pop(0)
-            if is_item_allowed_char(c):
-                out.append(c)
-            elif c == 92:
-                try:
-                    c = data.pop(0)
-                except IndexError:
-                    raise ValidationError("Unterminated escape sequence")
-                if c in (92, 44):
-                    out.append(c)
-                else:
-                    raise ValidationError(f"Invalid escape character: {chr(c)}")
-            else:
-                data.insert(0, c)
-                break
-    except IndexError:
-        pass
-    return bytes(out)
-
-
-def decode_svcb_comma_list(data: bytearray):
     out = []
+    item = bytearray()
+    pos = 0
     while True:
-        out.append(decode_escaped_item(data))
-
-        try:
-            c = data.pop(0)
-        except IndexError:
-            break
+        m = LIST_ITEM_RUN.match(data, pos)
+        item += m.group()
+        pos = m.end()
+        if pos >= len(data):
+            out.append(bytes(item))
+            return out
+        if data[pos] == 0x5c:
+            if pos + 1 >= len(data):
+                raise ValidationError("Unterminated escape sequence")
+            c = data[pos + 1]
+            if c not in (92, 44):
+                raise ValidationError(f"Invalid escape character: {chr(c)}")
+            item.append(c)
+            pos += 2
+        else:
+            out.append(bytes(item))
+            item = bytearray()
+            pos += 1
 
-        if c != 44:
-            raise ValidationError(f"Invalid list character: {chr(c)}")
 
-    return out
+def decode_list(value: str, name: str) -> typing.List[bytes]:
+    """
+    A comma separated list value, quoted or not, as for alpn and the address hints.
+    """
+    data = memoryview(value.encode("utf8"))
+    out, pos = decode_char_str(data)
+    if pos < len(data):
+        raise ValidationError(f"Left over data after decoding {name} list")
+    return decode_svcb_comma_list(out)
 
 
 def decode_svcb_param_list(value: str):
+    """
+    Parses key=value parameters in one pass, runs of plain characters are matched by regex and only
+    escapes are handled a byte at a time.
+    """
     params = {}
-    data = bytearray(value.encode("utf8"))
+    data = memoryview(value.encode("utf8"))
+    pos = 0
     while True:
-        while is_wsp(data[0]):
-            data.pop(0)
-        key = bytes(decode_svcb_param_key(data)).decode("ascii")
-        if not len(data):
-            params[key] = bytearray()
+        pos = WSP_RUN.match(data, pos).end()
+        if pos >= len(data):
+            break
+        m = PARAM_KEY.match(data, pos)
+        key = bytes(m.group()).decode("ascii")
+        pos = m.end()
+        if pos >= len(data):
+            params[key] = b""
             break
-        c = data.pop(0)
+        c = data[pos]
+        pos += 1
         # = char
         if c == 61:
-            params[key] = decode_char_str(data)
-        # space char
-        elif is_wsp(c):
-            params[key] = bytearray()
+            params[key], pos = decode_char_str(data, pos)
+        # space and tab
+        elif c == 32 or c == 9:
+            params[key] = b""
         else:
             raise ValidationError("Invalid parameter separation")
-        if not len(data):
+        if pos >= len(data):
             break
 
     out = []
@@ -336,13 +321,7 @@ class ALPNData:
 
     @classmethod
     def from_str(cls, data: str):
-        data = bytearray(data.encode("utf8"))
-        value = decode_char_str(data)
-        if len(data):
-            raise ValidationError("Left over data after decoding ALPN list")
-
-        elms = decode_svcb_comma_list(value)
-        return cls(elms)
+        return cls(decode_list(data, "ALPN"))
 
     def pack(self, buf: dnslib.DNSBuffer):
         for p in self.alpns:
@@ -359,14 +338,8 @@ class IPv4Data:
 
     @classmethod
     def from_str(cls, data: str):
-        data = bytearray(data.encode("utf8"))
-        value = decode_char_str(data)
-        if len(data):
-            raise ValidationError("Left over data after decoding IPv4 list")
-
-        elms = decode_svcb_comma_list(value)
         addrs = []
-        for v in elms:
+        for v in decode_list(data, "IPv4"):
             try:
                 v_str = v.decode("utf8")
             except UnicodeDecodeError:
@@ -392,14 +365,8 @@ class IPv6Data:
 
     @classmethod
     def from_str(cls, data: str):
-        data = bytearray(data.encode("utf8"))
-        value = decode_char_str(data)
-        if len(data):
-            raise ValidationError("Left over data after decoding IPv4 list")
-
-        elms = decode_svcb_comma_list(value)
         addrs = []
-        for v in elms:
+        for v in decode_list(data, "IPv6"):
             try:
                 v_str = v.decode("utf8")
             except UnicodeDecodeError:
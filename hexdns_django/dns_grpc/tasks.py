@@ -1,6 +1,9 @@
 from celery import shared_task
 from django.conf import settings
-from . import models, apps, utils, netnod
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import models, apps, utils, netnod, snapshot
 import dnslib
 import base64
 import ipaddress
@@ -30,6 +33,10 @@ class ZoneStorage(storages.backends.s3boto3.S3Boto3Storage):
     bucket_name = settings.ZONE_STORAGE_BUCKET
 
 
+class ZoneImportStorage(storages.backends.s3boto3.S3Boto3Storage):
+    bucket_name = settings.ZONE_IMPORT_STORAGE_BUCKET
+
+
 def network_to_apra(network: IP_NETWORK) -> dnslib.DNSLabel:
     if type(network) == ipaddress.IPv6Network:
         return dnslib.DNSLabel(
@@ -65,6 +72,40 @@ def network_to_apra(network: IP_NETWORK) -> dnslib.DNSLabel:
         )
 
 
+class NetworkIndex:
+    """
+    Maps IP networks to values, finding the networks containing an address with one dict lookup per
+    prefix length in use rather than a scan over every network.
+    """
+
+    def __init__(self):
+        self.networks = {}
+
+    def add(self, network: IP_NETWORK, value):
+        self.networks.setdefault((network.version, network.prefixlen), {}) \
+            .setdefault(int(network.network_address), []).append(value)
+
+    def containing(self, address: IP_ADDR) -> list:
+        out = []
+        for (version, prefixlen), networks in self.networks.items():
+            if version != address.version:
+                continue
+            host_bits = address.max_prefixlen - prefixlen
+            out.extend(networks.get((int(address) >> host_bits) << host_bits, []))
+        return out
+
+
+def reverse_zone_index() -> NetworkIndex:
+    index = NetworkIndex()
+    for rzone in models.ReverseDNSZone.objects.only("id", "zone_root_address", "zone_root_prefix"):
+        try:
+            network = ipaddress.ip_network((rzone.zone_root_address, rzone.zone_root_prefix), strict=False)
+        except ValueError:
+            continue
+        index.add(network, rzone.id)
+    return index
+
+
 def address_to_apra(address: IP_ADDR) -> dnslib.DNSLabel:
     if type(address) == ipaddress.IPv6Address:
         return dnslib.DNSLabel(
@@ -117,18 +158,97 @@ def dd_to_dms(dd: float) -> typing.Tuple[int, int, float]:
     return abs(d1), abs(m1), s1
 
 
-def generate_zone_header(zone, zone_root):
-    if hasattr(zone, "custom_ns") and zone.custom_ns.count():
-        primary_ns = dnslib.DNSLabel(zone.custom_ns.first().nameserver)
+def next_zone_serial(serial: int) -> int:
+    # Never go backwards from the timestamp based serials secondaries have already seen
+    return max(serial + 1, int(time.time())) % (2 ** 32)
+
+
+def reserve_zone_serial(zone, zone_hash: str) -> int:
+    zone_model = type(zone)
+    with transaction.atomic():
+        serial, last_hash = zone_model.objects.select_for_update() \
+            .filter(id=zone.id).values_list("serial", "zone_hash").get()
+        zone.last_zone_hash = last_hash
+        if not serial or last_hash != zone_hash:
+            new_serial = next_zone_serial(serial)
+            zone_model.objects.filter(id=zone.id).update(serial=new_serial)
+            if zone_model == models.DNSZone:
+                claim_zone_journal(zone, serial, new_serial)
+            serial = new_serial
+
+    zone.serial = serial
+    zone.zone_hash = zone_hash
+    return serial
+
+
+def claim_zone_journal(zone, from_serial: int, serial: int):
+    # Changes made since the last build all went into this serial, if there are none the change came from
+    # somewhere the journal doesn't see so IXFR can't bridge it
+    claimed = models.DNSZoneJournal.objects.filter(zone_id=zone.id, serial__isnull=True) \
+        .update(from_serial=from_serial, serial=serial)
+    if not claimed:
+        models.DNSZoneJournal.objects.create(zone_id=zone.id, from_serial=from_serial, serial=serial, complete=False)
+
+
+def compact_zone_journal(zone):
+    models.DNSZoneJournal.objects.filter(
+        zone_id=zone.id, serial__isnull=False,
+        timestamp__lt=timezone.now() - settings.ZONE_JOURNAL_MAX_AGE
+    ).delete()
+
+    serials = list(
+        models.DNSZoneJournal.objects.filter(zone_id=zone.id, serial__isnull=False)
+        .order_by("-serial").values_list("serial", flat=True).distinct()[:settings.ZONE_JOURNAL_MAX_VERSIONS + 1]
+    )
+    if len(serials) > settings.ZONE_JOURNAL_MAX_VERSIONS:
+        models.DNSZoneJournal.objects.filter(zone_id=zone.id, serial__lte=serials[-1]).delete()
+
+
+def zone_changed(zone) -> bool:
+    return zone.last_zone_hash != zone.zone_hash
+
+
+def mark_zone_published(zone):
+    type(zone).objects.filter(id=zone.id, serial=zone.serial).update(zone_hash=zone.zone_hash)
+
+
+def zone_primary_ns(zone) -> dnslib.DNSLabel:
+    custom_ns = list(zone.custom_ns.all()) if hasattr(zone, "custom_ns") else []
+    if custom_ns:
+        return dnslib.DNSLabel(custom_ns[0].nameserver)
     else:
-        primary_ns = NAMESERVERS[0]
+        return dnslib.DNSLabel(NAMESERVERS[0])
+
 
+def generate_zone_soa(zone, zone_root, serial: int):
     zone_file = f"$ORIGIN {zone_root}\n"
-    zone_file += f"@ 86400 IN SOA {primary_ns} noc.as207960.net. {int(time.time())} " \
+    zone_file += f"@ 86400 IN SOA {zone_primary_ns(zone)} noc.as207960.net. {serial} " \
                  f"86400 3600 86400 3600\n"
+    return zone_file
+
+
+def zone_soa_rr(zone, zone_root, serial: int) -> dnslib.RR:
+    # The same SOA generate_zone_soa writes to the zone file
+    return dnslib.RR(
+        zone_root,
+        dnslib.QTYPE.SOA,
+        rdata=dnslib.SOA(zone_primary_ns(zone), "noc.as207960.net.", (serial, 86400, 3600, 86400, 3600)),
+        ttl=86400,
+    )
+
+
+def finalise_zone_file(zone, zone_root, zone_body: str) -> str:
+    zone_hash = hashlib.sha256(zone_body.encode()).hexdigest()
+    serial = reserve_zone_serial(zone, zone_hash)
+    return generate_zone_soa(zone, zone_root, serial) + zone_body
+
+
+def generate_zone_header(zone, zone_root):
+    zone_file = ""
 
-    if hasattr(zone, "custom_ns") and zone.custom_ns.count():
-        for ns in zone.custom_ns.all():
+    custom_ns = list(zone.custom_ns.all()) if hasattr(zone, "custom_ns") else []
+    if custom_ns:
+        for ns in custom_ns:
             zone_file += f"@ 86400 IN NS {dnslib.DNSLabel(ns.nameserver)}\n"
     else:
         for ns in NAMESERVERS:
@@ -157,12 +277,73 @@ def generate_zone_header(zone, zone_root):
     return zone_file
 
 
-def generate_fzone(zone: "models.DNSZone"):
+def zone_header_rrs(zone, zone_root) -> list:
+    """
+    The RRs generate_zone_header writes, for zone transfers.
+    """
+    out = []
+
+    custom_ns = list(zone.custom_ns.all()) if hasattr(zone, "custom_ns") else []
+    if custom_ns:
+        nameservers = [ns.nameserver for ns in custom_ns]
+    else:
+        nameservers = NAMESERVERS
+    for ns in nameservers:
+        out.append(dnslib.RR(zone_root, dnslib.QTYPE.NS, rdata=dnslib.NS(dnslib.DNSLabel(ns)), ttl=86400))
+
+    # dnslib has no CDS or CDNSKEY types, their rdata is laid out as DS and DNSKEY
+    if zone.cds_disable:
+        out.append(dnslib.RR(zone_root, dnslib.QTYPE.CDS, rdata=dnslib.DS(0, 0, 0, b"\x00"), ttl=86400))
+        out.append(dnslib.RR(zone_root, dnslib.QTYPE.CDNSKEY, rdata=dnslib.DNSKEY(0, 3, 0, b"\x00"), ttl=86400))
+    else:
+        digest, tag = utils.make_zone_digest(zone_root)
+        out.append(dnslib.RR(
+            zone_root, dnslib.QTYPE.CDS, rdata=dnslib.DS(tag, 13, 2, bytes.fromhex(digest)), ttl=86400
+        ))
+        for cds in zone.additional_cds.all():
+            out.append(dnslib.RR(
+                zone_root, dnslib.QTYPE.CDS,
+                rdata=dnslib.DS(cds.key_tag, cds.algorithm, cds.digest_type, bytes.fromhex(cds.digest)), ttl=86400
+            ))
+
+        out.append(dnslib.RR(zone_root, dnslib.QTYPE.CDNSKEY, rdata=utils.get_dnskey(), ttl=86400))
+        for cdnskey in zone.additional_cdnskey.all():
+            out.append(dnslib.RR(
+                zone_root, dnslib.QTYPE.CDNSKEY,
+                rdata=dnslib.DNSKEY(
+                    cdnskey.flags, cdnskey.protocol, cdnskey.algorithm, base64.b64decode(cdnskey.public_key)
+                ), ttl=86400
+            ))
+
+    return out
+
+
+def fzone_transfer_rrs(zone: "models.DNSZone", serial: int) -> typing.Iterator[dnslib.RR]:
+    """
+    The zone's RRs for AXFR, built from the records' own RRs, the same ones the IXFR journal holds, rather
+    than the text of the zone file. Starts and ends with the SOA.
+    """
     zone_root = dnslib.DNSLabel(zone.zone_root)
+    soa = zone_soa_rr(zone, zone_root, serial)
+    yield soa
+    yield from zone_header_rrs(zone, zone_root)
+    for record_set in (*snapshot.ZONE_RECORD_SETS, "anamerecord_set"):
+        for record in getattr(zone, record_set).all():
+            yield from record.zone_rrs()
+    yield soa
+
+
+def render_fzone(zone: "models.DNSZone", zone_root: dnslib.DNSLabel):
+    """
+    Renders everything after the SOA, along with the addresses wanting reverse records. Nothing is written,
+    so this is safe to call for checks that mustn't move the serial.
+    """
     zone_file = generate_zone_header(zone, zone_root)
 
-    rzones = set()
+    auto_reverse_addresses = set()
+    address_records = {}
     for record in zone.addressrecord_set.all():
+        address_records.setdefault(record.record_name, []).append(record)
         record_name = record.idna_label
         if record_name:
             zone_file += f"; Address record {record.id}\n"
@@ -173,17 +354,7 @@ def generate_fzone(zone: "models.DNSZone"):
                 zone_file += f"{record_name} {record.ttl} IN AAAA {address}\n"
 
             if record.auto_reverse:
-                for rzone in models.ReverseDNSZone.objects.raw(
-                    "SELECT * FROM dns_grpc_reversednszone WHERE ("
-                    "inet %s << CAST("
-                    "(string_to_array(zone_root_address::string, '/')[1] || '/'"
-                    " || zone_root_prefix) AS inet))",
-                    [str(address)]
-                ):
-                    rzones.add(rzone.id)
-
-    for rzone in rzones:
-        update_rzone.delay(rzone)
+                auto_reverse_addresses.add(address)
 
     for record in zone.dynamicaddressrecord_set.all():
         record_name = record.idna_label
@@ -203,8 +374,7 @@ def generate_fzone(zone: "models.DNSZone"):
             if alias_label.matchSuffix(zone_root):
                 own_record_name = alias_label.stripSuffix(zone_root)
                 search_name = ".".join(map(lambda n: n.decode(), own_record_name.label))
-                own_records = zone.addressrecord_set.filter(record_name=search_name)
-                for r in own_records:
+                for r in address_records.get(search_name, []):
                     address = ipaddress.ip_address(r.address)
                     if type(address) == ipaddress.IPv4Address:
                         zone_file += f"{record_name} {record.ttl} IN A {address}\n"
@@ -302,23 +472,14 @@ def generate_fzone(zone: "models.DNSZone"):
     for record in zone.sshfprecord_set.all():
         record_name = record.idna_label
         if record_name:
-            pubkey = record.key
-            if pubkey.key_type == b"ssh-rsa":
-                algo_num = 1
-            elif pubkey.key_type == b"ssh-dsa":
-                algo_num = 2
-            elif pubkey.key_type.startswith(b"ecdsa-sha"):
-                algo_num = 3
-            elif pubkey.key_type == b"ssh-ed25519":
-                algo_num = 4
-            else:
+            algo_num, fingerprints = record.fingerprints
+            if not fingerprints:
                 continue
 
             zone_file += f"; SSHFP record {record.id}\n"
-            zone_file += f"{record_name} {record.ttl} IN SSHFP {algo_num} 1 " \
-                         f"{hashlib.sha1(pubkey._decoded_key).hexdigest()}\n"
-            zone_file += f"{record_name} {record.ttl} IN SSHFP {algo_num} 2 " \
-                         f"{hashlib.sha256(pubkey._decoded_key).hexdigest()}\n"
+            for fingerprint_type, fingerprint in fingerprints:
+                zone_file += f"{record_name} {record.ttl} IN SSHFP {algo_num} {fingerprint_type} " \
+                             f"{fingerprint.hex()}\n"
 
     for record in zone.dsrecord_set.all():
         record_name = record.idna_label
@@ -361,10 +522,7 @@ def generate_fzone(zone: "models.DNSZone"):
                          f"{dnslib.DNSLabel(record.txt)}\n"
 
     for record in zone.httpsrecord_set.all():
-        svcb_record = record.svcb_record
-        buf = dnslib.DNSBuffer()
-        svcb_record.pack(buf)
-        data = bytes(buf.data)
+        data = record.svcb_wire
         zone_file += f"; HTTPS record {record.id}\n"
         zone_file += f"{record.svcb_record_name} {record.ttl} IN TYPE65 \# {len(data)} {data.hex()}\n"
 
@@ -374,7 +532,22 @@ def generate_fzone(zone: "models.DNSZone"):
             zone_file += f"; DHCID record {record.id}\n"
             zone_file += f"{record_name} {record.ttl} IN DHCID {base64.b64encode(record.data).decode()}\n"
 
-    return zone_file
+    return zone_file, auto_reverse_addresses
+
+
+def generate_fzone(zone: "models.DNSZone"):
+    zone_root = dnslib.DNSLabel(zone.zone_root)
+    zone_file, auto_reverse_addresses = render_fzone(zone, zone_root)
+
+    if auto_reverse_addresses:
+        rzone_index = reverse_zone_index()
+        rzones = set()
+        for address in auto_reverse_addresses:
+            rzones.update(rzone_index.containing(address))
+        for rzone in rzones:
+            update_rzone.delay(rzone)
+
+    return finalise_zone_file(zone, zone_root, zone_file)
 
 
 def generate_rzone(zone: "models.ReverseDNSZone"):
@@ -383,7 +556,6 @@ def generate_rzone(zone: "models.ReverseDNSZone"):
     )
     zone_root = network_to_apra(zone_network)
     zone_file = generate_zone_header(zone, zone_root)
-    account = zone.get_user().account.id
 
     for record in zone.ptrrecord_set.all():
         if record.pointer == "@":
@@ -399,25 +571,24 @@ def generate_rzone(zone: "models.ReverseDNSZone"):
         zone_file += f"{record.record_prefix}.{zone_root} {record.ttl} IN NS " \
                      f"{dnslib.DNSLabel(record.nameserver)}\n"
 
-    zones = {}
-    for record in models.AddressRecord.objects.raw(
-            "SELECT * FROM dns_grpc_addressrecord WHERE (auto_reverse AND address << inet %s)",
-            [str(zone_network)]
-    ):
-        if record.zone.id in zones:
-            account2 = zones[record.zone.id]
+    # Only the owner's forward zones can put records here, so they're found by resource in the database and
+    # the few auto-reverse records among them checked against the network, not every record in every zone
+    owned_resources = utils.get_owned_resources(zone.get_user())
+    records = models.AddressRecord.objects.filter(
+        auto_reverse=True, zone__resource_id__in=owned_resources
+    ).select_related("zone").only("id", "zone", "record_name", "address", "ttl", "zone__zone_root")
+    for record in records:
+        address = ipaddress.ip_address(record.address)
+        if address not in zone_network:
+            continue
+        if record.record_name == "@":
+            zone_ptr = dnslib.DNSLabel(f"{record.zone.zone_root}")
         else:
-            account2 = record.zone.get_user().account.id
-            zones[record.zone.id] = account2
-        if account2 == account:
-            if record.record_name == "@":
-                zone_ptr = dnslib.DNSLabel(f"{record.zone.zone_root}")
-            else:
-                zone_ptr = dnslib.DNSLabel(f"{record.record_name}.{record.zone.zone_root}")
-            zone_file += f"; Address record {record.id}\n"
-            zone_file += f"{address_to_apra(ipaddress.ip_address(record.address))} {record.ttl} IN PTR {zone_ptr}\n"
+            zone_ptr = dnslib.DNSLabel(f"{record.record_name}.{record.zone.zone_root}")
+        zone_file += f"; Address record {record.id}\n"
+        zone_file += f"{address_to_apra(address)} {record.ttl} IN PTR {zone_ptr}\n"
 
-    return zone_file
+    return finalise_zone_file(zone, zone_root, zone_file)
 
 
 def generate_szone(zone: "models.SecondaryDNSZone"):
@@ -455,7 +626,7 @@ def send_reload_message(label: dnslib.DNSLabel):
 )
 def add_fzone(zone_id: str):
     try:
-        zone = models.DNSZone.objects.get(id=zone_id)
+        zone = snapshot.load_zone(zone_id)
     except models.DNSZone.DoesNotExist:
         return
 
@@ -464,6 +635,8 @@ def add_fzone(zone_id: str):
         zone_root = dnslib.DNSLabel(zone.zone_root)
         zone_file = generate_fzone(zone)
         write_zone_file(zone_file, str(zone_root))
+        mark_zone_published(zone)
+        compact_zone_journal(zone)
         update_catalog.delay()
 
 
@@ -473,7 +646,7 @@ def add_fzone(zone_id: str):
 )
 def update_fzone(zone_id: str):
     try:
-        zone = models.DNSZone.objects.get(id=zone_id)
+        zone = snapshot.load_zone(zone_id)
     except models.DNSZone.DoesNotExist:
         return
 
@@ -481,17 +654,46 @@ def update_fzone(zone_id: str):
     if pattern.match(zone.zone_root):
         zone_root = dnslib.DNSLabel(zone.zone_root)
         zone_file = generate_fzone(zone)
+        if not zone_changed(zone):
+            return
         write_zone_file(zone_file, str(zone_root))
+        mark_zone_published(zone)
+        compact_zone_journal(zone)
         send_reload_message(zone_root)
 
 
+def schedule_fzone_update(zone_id: str):
+    """
+    Rebuild the zone once at the end of the rebuild window, however many changes come in before then. A
+    schedule that's long overdue is assumed lost and replaced.
+    """
+    now = timezone.now()
+    window = settings.ZONE_REBUILD_WINDOW
+    if models.DNSZone.objects.filter(id=zone_id).filter(
+            Q(rebuild_scheduled__isnull=True) | Q(rebuild_scheduled__lt=now - (window * 5))
+    ).update(rebuild_scheduled=now):
+        transaction.on_commit(
+            lambda: update_fzone_coalesced.apply_async((zone_id,), countdown=window.total_seconds())
+        )
+
+
+@shared_task(
+    autoretry_for=(Exception,), retry_backoff=1, retry_backoff_max=60, max_retries=None, default_retry_delay=3,
+    ignore_result=True
+)
+def update_fzone_coalesced(zone_id: str):
+    # Cleared before building so changes landing during the build get a rebuild of their own
+    models.DNSZone.objects.filter(id=zone_id).update(rebuild_scheduled=None)
+    update_fzone(zone_id)
+
+
 @shared_task(
     autoretry_for=(Exception,), retry_backoff=1, retry_backoff_max=60, max_retries=None, default_retry_delay=3,
     ignore_result=True
 )
 def add_rzone(zone_id: str):
     try:
-        zone = models.ReverseDNSZone.objects.get(id=zone_id)
+        zone = snapshot.load_reverse_zone(zone_id)
     except models.ReverseDNSZone.DoesNotExist:
         return
 
@@ -501,6 +703,7 @@ def add_rzone(zone_id: str):
     )
     zone_root = network_to_apra(zone_network)
     write_zone_file(zone_file, str(zone_root))
+    mark_zone_published(zone)
     update_catalog.delay()
 
 
@@ -510,16 +713,19 @@ def add_rzone(zone_id: str):
 )
 def update_rzone(zone_id: str):
     try:
-        zone = models.ReverseDNSZone.objects.get(id=zone_id)
+        zone = snapshot.load_reverse_zone(zone_id)
     except models.ReverseDNSZone.DoesNotExist:
         return
 
     zone_file = generate_rzone(zone)
+    if not zone_changed(zone):
+        return
     zone_network = ipaddress.ip_network(
         (zone.zone_root_address, zone.zone_root_prefix)
     )
     zone_root = network_to_apra(zone_network)
     write_zone_file(zone_file, str(zone_root))
+    mark_zone_published(zone)
     send_reload_message(zone_root)
 
 
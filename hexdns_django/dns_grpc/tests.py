@@ -1,3 +1,345 @@
-from django.test import TestCase
+import hashlib
+import hmac
+from unittest import mock
+import dnslib
+from as207960_utils.api import auth
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from dnslib import CLASS, OPCODE, QTYPE
+from rest_framework.test import APIRequestFactory, force_authenticate
 
-# Create your tests here.
+from . import grpc, models, tasks, update, utils
+from .api import views as api_views
+
+
+def make_zones(*zone_roots):
+    # bulk_create skips the Keycloak resource sync done by save
+    return models.DNSZone.objects.bulk_create([
+        models.DNSZone(zone_root=zone_root, last_modified=timezone.now()) for zone_root in zone_roots
+    ])
+
+
+class ValidZoneTestCase(TestCase):
+    def test_new_zone(self):
+        make_zones("example.org")
+        self.assertIsNone(utils.valid_zone("example.com"))
+
+    def test_public_suffix(self):
+        self.assertEqual(utils.valid_zone("co.uk"), "Zone not a publicly registrable domain")
+
+    def test_same_zone(self):
+        make_zones("example.com")
+        self.assertEqual(utils.valid_zone("Example.com."), "Same or more generic zone already exists")
+
+    def test_more_generic_zone(self):
+        make_zones("example.com")
+        self.assertEqual(utils.valid_zone("www.example.com"), "Same or more generic zone already exists")
+
+    def test_more_specific_zone(self):
+        make_zones("www.example.com")
+        self.assertEqual(utils.valid_zone("example.com"), "More specific zone already exists")
+
+    def test_more_specific_secondary_zone(self):
+        models.SecondaryDNSZone.objects.bulk_create([models.SecondaryDNSZone(zone_root="a.b.example.com")])
+        self.assertEqual(utils.valid_zone("example.com"), "More specific zone already exists")
+
+    def test_same_suffix_not_a_child(self):
+        make_zones("notexample.com", "example.com.au")
+        self.assertIsNone(utils.valid_zone("example.com"))
+
+
+class TSIGSignedMessageTestCase(SimpleTestCase):
+    def make_update(self, msg_id: int) -> dnslib.DNSRecord:
+        msg = dnslib.DNSRecord(
+            dnslib.DNSHeader(id=msg_id, opcode=OPCODE.UPDATE), q=dnslib.DNSQuestion("example.com", QTYPE.SOA)
+        )
+        msg.add_auth(dnslib.RR("www.example.com", QTYPE.A, rdata=dnslib.A("192.0.2.1"), ttl=300))
+        msg.add_ar(dnslib.RR("www.example.com", QTYPE.TXT, rdata=dnslib.TXT("extra"), ttl=300))
+        return msg
+
+    def add_tsig(self, msg: dnslib.DNSRecord, mac: bytes) -> bytes:
+        msg.add_ar(dnslib.RR("key.example.com", QTYPE.TSIG, getattr(CLASS, "*"), 0, dnslib.RD(mac)))
+        return msg.pack()
+
+    def test_message_before_tsig(self):
+        msg = self.make_update(1234)
+        unsigned = msg.pack()
+        signed = self.add_tsig(msg, b"\x00" * 32)
+        self.assertEqual(b"".join(grpc.TSIG.signed_message(signed, 1234)), unsigned)
+
+    def test_original_id(self):
+        # A forwarded update has a new ID, the MAC is over the one it was signed with
+        unsigned = self.make_update(1234).pack()
+        msg = self.make_update(4321)
+        signed = self.add_tsig(msg, b"\x00" * 32)
+        self.assertEqual(b"".join(grpc.TSIG.signed_message(signed, 1234)), unsigned)
+
+    def test_mac_matches(self):
+        msg = self.make_update(1234)
+        expected = hmac.new(b"secret", msg.pack(), hashlib.sha256).digest()
+        signed = self.add_tsig(msg, expected)
+        mac = hmac.new(b"secret", digestmod=hashlib.sha256)
+        for part in grpc.TSIG.signed_message(signed, 1234):
+            mac.update(part)
+        self.assertEqual(mac.digest(), expected)
+
+
+def a_rr(name: str, address: str) -> dnslib.RR:
+    return dnslib.RR(name, QTYPE.A, rdata=dnslib.A(address), ttl=300)
+
+
+def describe_rrs(rrs) -> list:
+    return [
+        ("SOA", rr.rdata.times[0]) if rr.rtype == QTYPE.SOA else (QTYPE[rr.rtype], str(rr.rname), str(rr.rdata))
+        for rr in rrs
+    ]
+
+
+class FindIXFRRRsTestCase(TestCase):
+    def setUp(self):
+        self.zone, = make_zones("example.com")
+        # DNSSEC keys are only needed for queries, not for working out a transfer
+        self.servicer = grpc.DnsServiceServicer.__new__(grpc.DnsServiceServicer)
+
+    def journal(self, from_serial: int, serial: int, removed=(), added=(), complete=True):
+        models.DNSZoneJournal.objects.create(
+            zone=self.zone, from_serial=from_serial, serial=serial, complete=complete,
+            removed=models.DNSZoneJournal.pack_rrs(removed), added=models.DNSZoneJournal.pack_rrs(added),
+        )
+
+    def ixfr_request(self, client_serial: int) -> dnslib.DNSRecord:
+        dns_req = dnslib.DNSRecord(q=dnslib.DNSQuestion("example.com", QTYPE.IXFR))
+        dns_req.add_auth(tasks.zone_soa_rr(self.zone, dnslib.DNSLabel("example.com"), client_serial))
+        return dns_req
+
+    def test_versions(self):
+        self.journal(1, 2, added=[a_rr("www.example.com", "192.0.2.1")])
+        self.journal(
+            2, 3, removed=[a_rr("www.example.com", "192.0.2.1")], added=[a_rr("www.example.com", "192.0.2.2")]
+        )
+
+        rrs = self.servicer.find_ixfr_rrs(self.ixfr_request(1), self.zone, 3)
+        self.assertEqual(describe_rrs(rrs), [
+            ("SOA", 3),
+            ("SOA", 1), ("SOA", 2), ("A", "www.example.com.", "192.0.2.1"),
+            ("SOA", 2), ("A", "www.example.com.", "192.0.2.1"),
+            ("SOA", 3), ("A", "www.example.com.", "192.0.2.2"),
+            ("SOA", 3),
+        ])
+
+    def test_entries_of_a_version_are_merged(self):
+        self.journal(1, 2, added=[a_rr("www.example.com", "192.0.2.1")])
+        self.journal(
+            1, 2, removed=[a_rr("www.example.com", "192.0.2.1")], added=[a_rr("mail.example.com", "192.0.2.3")]
+        )
+
+        rrs = self.servicer.find_ixfr_rrs(self.ixfr_request(1), self.zone, 2)
+        self.assertEqual(describe_rrs(rrs), [
+            ("SOA", 2), ("SOA", 1), ("SOA", 2), ("A", "mail.example.com.", "192.0.2.3"), ("SOA", 2),
+        ])
+
+    def test_client_up_to_date(self):
+        self.journal(1, 2, added=[a_rr("www.example.com", "192.0.2.1")])
+        rrs = self.servicer.find_ixfr_rrs(self.ixfr_request(2), self.zone, 2)
+        self.assertEqual(describe_rrs(rrs), [("SOA", 2)])
+
+    def test_serial_wraps(self):
+        self.journal(2 ** 32 - 1, 1, added=[a_rr("www.example.com", "192.0.2.1")])
+        rrs = self.servicer.find_ixfr_rrs(self.ixfr_request(2 ** 32 - 1), self.zone, 1)
+        self.assertEqual(describe_rrs(rrs), [
+            ("SOA", 1), ("SOA", 2 ** 32 - 1), ("SOA", 1), ("A", "www.example.com.", "192.0.2.1"), ("SOA", 1),
+        ])
+
+    def test_unknown_client_serial(self):
+        self.journal(1, 2, added=[a_rr("www.example.com", "192.0.2.1")])
+        self.assertIsNone(self.servicer.find_ixfr_rrs(self.ixfr_request(5), self.zone, 2))
+
+    def test_incomplete_entry(self):
+        self.journal(1, 2, added=[a_rr("www.example.com", "192.0.2.1")])
+        self.journal(2, 3, complete=False)
+        self.assertIsNone(self.servicer.find_ixfr_rrs(self.ixfr_request(1), self.zone, 3))
+
+    def test_gap_in_versions(self):
+        self.journal(1, 2, added=[a_rr("www.example.com", "192.0.2.1")])
+        self.journal(3, 4, added=[a_rr("mail.example.com", "192.0.2.3")])
+        self.assertIsNone(self.servicer.find_ixfr_rrs(self.ixfr_request(1), self.zone, 4))
+
+    def test_no_client_soa(self):
+        dns_req = dnslib.DNSRecord(q=dnslib.DNSQuestion("example.com", QTYPE.IXFR))
+        self.assertIsNone(self.servicer.find_ixfr_rrs(dns_req, self.zone, 2))
+
+
+class TransferMessagesTestCase(SimpleTestCase):
+    def test_split(self):
+        dns_req = dnslib.DNSRecord(dnslib.DNSHeader(id=1234), q=dnslib.DNSQuestion("example.com", QTYPE.AXFR))
+        rrs = [a_rr(f"host{i}.example.com", "192.0.2.1") for i in range(grpc.TRANSFER_MESSAGE_RRS * 2 + 1)]
+
+        messages = list(grpc.DnsServiceServicer.transfer_messages(dns_req, rrs))
+        self.assertEqual([len(m.rr) for m in messages], [grpc.TRANSFER_MESSAGE_RRS, grpc.TRANSFER_MESSAGE_RRS, 1])
+        self.assertEqual([rr for m in messages for rr in m.rr], rrs)
+        for message in messages:
+            self.assertEqual(message.header.id, 1234)
+            self.assertEqual(message.q.qname, dns_req.q.qname)
+
+    def test_exact_multiple(self):
+        dns_req = dnslib.DNSRecord(q=dnslib.DNSQuestion("example.com", QTYPE.AXFR))
+        rrs = [a_rr(f"host{i}.example.com", "192.0.2.1") for i in range(grpc.TRANSFER_MESSAGE_RRS)]
+        self.assertEqual(len(list(grpc.DnsServiceServicer.transfer_messages(dns_req, rrs))), 1)
+
+
+def journal_rrs(data) -> list:
+    return describe_rrs(map(models.DNSZoneJournal.parse_rr, models.DNSZoneJournal.split_rrs(data)))
+
+
+class RecordChangesTestCase(TestCase):
+    def setUp(self):
+        self.zone, = make_zones("example.com")
+
+    def make_record(self, model, **kwargs):
+        record = model(zone=self.zone, ttl=300, **kwargs)
+        record.normalise()
+        model.objects.bulk_create([record])
+        return record
+
+    def test_commit(self):
+        www = self.make_record(models.AddressRecord, record_name="www", address="192.0.2.1")
+        mail = self.make_record(models.AddressRecord, record_name="mail", address="192.0.2.3")
+
+        changes = update.RecordChanges(self.zone)
+        changes.modify(www)
+        www.address = "192.0.2.2"
+        changes.remove(mail)
+        changes.create(models.AddressRecord(zone=self.zone, record_name="FTP", address="192.0.2.4", ttl=300))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(changes.commit())
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            sorted(models.AddressRecord.objects.filter(zone=self.zone).values_list("record_name", "address")),
+            [("ftp", "192.0.2.4"), ("www", "192.0.2.2")]
+        )
+        self.assertEqual(
+            models.AddressRecord.objects.get(record_name="ftp").record_idna, "ftp"
+        )
+
+        entry, = models.DNSZoneJournal.objects.filter(zone=self.zone)
+        self.assertTrue(entry.complete)
+        self.assertEqual(journal_rrs(entry.removed), [
+            ("A", "mail.example.com.", "192.0.2.3"), ("A", "www.example.com.", "192.0.2.1"),
+        ])
+        self.assertEqual(journal_rrs(entry.added), [
+            ("A", "www.example.com.", "192.0.2.2"), ("A", "ftp.example.com.", "192.0.2.4"),
+        ])
+
+    def test_no_changes(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertFalse(update.RecordChanges(self.zone).commit())
+        self.assertEqual(len(callbacks), 0)
+        self.assertFalse(models.DNSZoneJournal.objects.filter(zone=self.zone).exists())
+
+    def test_without_rebuild(self):
+        changes = update.RecordChanges(self.zone)
+        changes.create(models.AddressRecord(zone=self.zone, record_name="www", address="192.0.2.1", ttl=300))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(changes.commit(rebuild=False))
+        self.assertEqual(len(callbacks), 0)
+
+    def test_zone_with_anames(self):
+        # ANAMEs copy the zone's addresses, so the change can't be journalled from the records alone
+        self.make_record(models.ANAMERecord, record_name="alias", alias="www.example.com")
+        changes = update.RecordChanges(self.zone)
+        changes.create(models.AddressRecord(zone=self.zone, record_name="www", address="192.0.2.1", ttl=300))
+        changes.commit()
+
+        entry, = models.DNSZoneJournal.objects.filter(zone=self.zone)
+        self.assertFalse(entry.complete)
+
+
+class BulkRecordsTestCase(TestCase):
+    def setUp(self):
+        self.zone, = make_zones("example.com")
+        self.user = get_user_model().objects.create(username="test")
+        # Keycloak isn't asked, the token can edit the zone unless a test says otherwise
+        has_scope = mock.patch.object(models.DNSZone, "has_scope", return_value=True)
+        self.has_scope = has_scope.start()
+        self.addCleanup(has_scope.stop)
+        self.view = api_views.DNSZoneViewSet.as_view({"post": "bulk_records"}, permission_classes=[])
+
+    def post(self, operations: list):
+        request = APIRequestFactory().post(
+            f"/api/dns_zones/{self.zone.id}/bulk_records/", {"operations": operations}, format="json"
+        )
+        force_authenticate(request, user=self.user, token=mock.Mock(spec=auth.OAuthToken, token="token"))
+        return self.view(request, pk=str(self.zone.id))
+
+    def make_record(self, model, **kwargs):
+        record = model(zone=self.zone, ttl=300, **kwargs)
+        record.normalise()
+        model.objects.bulk_create([record])
+        return record
+
+    def test_operations(self):
+        www = self.make_record(models.AddressRecord, record_name="www", address="192.0.2.1")
+        txt = self.make_record(models.TXTRecord, record_name="@", data="old")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.post([
+                {"operation": "create", "type": "address", "data": {
+                    "record_name": "mail", "address": "192.0.2.3", "ttl": 300,
+                }},
+                {"operation": "update", "type": "address", "id": str(www.id), "data": {"address": "192.0.2.2"}},
+                {"operation": "delete", "type": "txt", "id": str(txt.id)},
+            ])
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual(results[0]["record_name"], "mail")
+        self.assertEqual(results[1]["address"], "192.0.2.2")
+        self.assertEqual(results[2], {"id": str(txt.id), "deleted": True})
+
+        self.assertEqual(
+            sorted(models.AddressRecord.objects.filter(zone=self.zone).values_list("record_name", "address")),
+            [("mail", "192.0.2.3"), ("www", "192.0.2.2")]
+        )
+        self.assertFalse(models.TXTRecord.objects.filter(zone=self.zone).exists())
+        # One journal entry and one rebuild for the whole request
+        self.assertEqual(models.DNSZoneJournal.objects.filter(zone=self.zone).count(), 1)
+        self.assertEqual(len(callbacks), 1)
+        self.has_scope.assert_called_once_with("token", "edit")
+
+    def test_invalid_operation_writes_nothing(self):
+        response = self.post([
+            {"operation": "create", "type": "address", "data": {
+                "record_name": "mail", "address": "192.0.2.3", "ttl": 300,
+            }},
+            {"operation": "update", "type": "address", "id": "hexdns_zoneaddressrecord_missing", "data": {
+                "address": "192.0.2.2",
+            }},
+            {"operation": "create", "type": "address", "data": {
+                "record_name": "ftp", "address": "not an address", "ttl": 300,
+            }},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.data["operations"]
+        self.assertFalse(errors[0])
+        self.assertIn("id", errors[1])
+        self.assertIn("address", errors[2])
+        self.assertFalse(models.AddressRecord.objects.filter(zone=self.zone).exists())
+        self.assertFalse(models.DNSZoneJournal.objects.filter(zone=self.zone).exists())
+
+    def test_deleted_record_not_updated(self):
+        www = self.make_record(models.AddressRecord, record_name="www", address="192.0.2.1")
+        response = self.post([
+            {"operation": "delete", "type": "address", "id": str(www.id)},
+            {"operation": "update", "type": "address", "id": str(www.id), "data": {"address": "192.0.2.2"}},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(models.AddressRecord.objects.filter(id=www.id).exists())
+
+    def test_without_edit_scope(self):
+        self.has_scope.return_value = False
+        response = self.post([{"operation": "delete", "type": "address", "id": "hexdns_zoneaddressrecord_x"}])
+        self.assertEqual(response.status_code, 403)
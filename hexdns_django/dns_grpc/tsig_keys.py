@@ -0,0 +1,67 @@
+import hmac
+import typing
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import metrics, models, ttl_cache
+
+
+class TSIGKey:
+    """
+    A zone update secret with its HMACs keyed once per algorithm. Each message gets a copy of the
+    keyed template, so the key schedule isn't redone for every packet.
+    """
+
+    def __init__(self, key: models.DNSZoneUpdateSecrets):
+        self.key = key
+        self.templates = {}
+
+    def hmac(self, digestmod: str):
+        template = self.templates.get(digestmod)
+        if template is None:
+            template = hmac.new(bytes(self.key.secret), digestmod=digestmod)
+            self.templates[digestmod] = template
+        return template.copy()
+
+
+def tsig_key_marker():
+    # Changes on any key, including deletes, move either the count or the latest modification
+    return tuple(
+        models.DNSZoneUpdateSecrets.objects.aggregate(count=Count("id"), last=Max("last_modified")).values()
+    )
+
+
+class TSIGKeyCache(ttl_cache.TTLCache):
+    """
+    Update secrets by key ID for the gRPC server. Saves in this process clear it straight away, changes
+    made elsewhere are noticed by polling a cheap change marker every few seconds. Unknown key IDs aren't
+    cached, they're answered with BADKEY and don't deserve a slot.
+    """
+
+    def lookup(self, key_id: str) -> typing.Optional[TSIGKey]:
+        self.check_stale()
+        value = self.get(key_id)
+        metrics.record_cache("tsig_key", bool(value))
+        if value:
+            return value
+        key = models.DNSZoneUpdateSecrets.objects.filter(id=key_id).first()
+        if not key:
+            return None
+        value = TSIGKey(key)
+        self.put(key_id, value)
+        return value
+
+
+tsig_key_cache = TSIGKeyCache(
+    ttl=settings.TSIG_KEY_CACHE_TTL,
+    max_size=settings.TSIG_KEY_CACHE_SIZE,
+    marker=tsig_key_marker,
+    check_interval=settings.TSIG_KEY_CACHE_CHECK_INTERVAL,
+)
+
+
+@receiver(post_save, sender=models.DNSZoneUpdateSecrets)
+@receiver(post_delete, sender=models.DNSZoneUpdateSecrets)
+def invalidate_tsig_key_cache(sender, **kwargs):
+    tsig_key_cache.clear()
@@ -0,0 +1,66 @@
+import collections
+import threading
+import time
+import typing
+
+
+class TTLCache:
+    """
+    In process map whose entries expire after a TTL, dropping the least recently used once it's full.
+    Given a marker function, check_stale clears it whenever the marker changes, calling it at most once
+    per check interval, so changes made by other processes are noticed without asking on every lookup.
+    """
+
+    def __init__(
+            self, ttl: int, max_size: int, marker: typing.Optional[typing.Callable[[], typing.Any]] = None,
+            check_interval: int = 0
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.marker_func = marker
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.marker = None
+        self.next_check = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return default
+            expires, value = entry
+            if expires < now:
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl: typing.Optional[int] = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def check_stale(self):
+        if not self.marker_func:
+            return
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+        marker = self.marker_func()
+        if marker != self.marker:
+            self.clear()
+            self.marker = marker
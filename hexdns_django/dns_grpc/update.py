@@ -0,0 +1,183 @@
+import collections
+import copy
+import itertools
+import typing
+import dnslib
+from django.db import transaction
+from dnslib import QTYPE
+from . import models, tasks, grpc
+
+UPDATE_MODELS = {
+    QTYPE.A: models.AddressRecord,
+    QTYPE.AAAA: models.AddressRecord,
+    QTYPE.MX: models.MXRecord,
+    QTYPE.NS: models.NSRecord,
+    QTYPE.TXT: models.TXTRecord,
+    QTYPE.SRV: models.SRVRecord,
+    QTYPE.CAA: models.CAARecord,
+    QTYPE.NAPTR: models.NAPTRRecord,
+    QTYPE.DS: models.DSRecord,
+    QTYPE.LOC: models.LOCRecord,
+    QTYPE.HINFO: models.HINFORecord,
+    QTYPE.RP: models.RPRecord,
+    QTYPE.DHCID: models.DHCIDRecord,
+    QTYPE.CNAME: models.CNAMERecord,
+}
+# Deleted in this order for an ANY RRset delete
+DELETE_ANY_MODELS = (
+    models.AddressRecord, models.MXRecord, models.NSRecord, models.TXTRecord, models.SRVRecord,
+    models.CAARecord, models.NAPTRRecord, models.DSRecord, models.LOCRecord, models.HINFORecord,
+    models.RPRecord, models.CNAMERecord, models.DHCIDRecord,
+)
+# Can't be changed by an update, but still own their names for the CNAME checks
+OTHER_MODELS = (
+    models.DynamicAddressRecord, models.RedirectRecord, models.SSHFPRecord, models.ANAMERecord,
+)
+
+
+def wildcard_name(record_name: str) -> str:
+    labels = record_name.split(".")
+    labels[0] = "*"
+    return ".".join(labels)
+
+
+class RecordChanges:
+    """
+    Creates, updates and deletes of one zone's records, made in memory until commit(), which writes them in
+    a single transaction, journals them as one change and schedules one rebuild of the zone.
+    """
+
+    def __init__(self, zone: models.DNSZone):
+        self.zone = zone
+        self.created = []
+        self.updated = {}
+        self.deleted = {}
+        self.originals = {}
+
+    def create(self, record: models.DNSZoneRecord):
+        self.created.append(record)
+
+    def modify(self, record: models.DNSZoneRecord):
+        # Called before the record is changed, so the journal has what it was
+        if record._state.adding:
+            return
+        if record.pk not in self.originals:
+            self.originals[record.pk] = copy.copy(record)
+        self.updated[record.pk] = record
+
+    def remove(self, record: models.DNSZoneRecord):
+        if record._state.adding:
+            self.created.remove(record)
+            return
+        self.updated.pop(record.pk, None)
+        self.deleted[record.pk] = self.originals.get(record.pk, record)
+
+    def journal_changes(self) -> list:
+        return [(old, None) for old in self.deleted.values()] + \
+               [(self.originals[pk], record) for pk, record in self.updated.items()] + \
+               [(None, record) for record in self.created]
+
+    @staticmethod
+    def by_model(records) -> dict:
+        out = collections.defaultdict(list)
+        for record in records:
+            out[type(record)].append(record)
+        return out
+
+    def commit(self, rebuild: bool = True) -> bool:
+        """
+        Writes the changes, returning whether there were any. Without rebuild the caller is left to
+        schedule the zone build, for changes committed in several parts.
+        """
+        if not (self.created or self.updated or self.deleted):
+            return False
+
+        for record in itertools.chain(self.created, self.updated.values()):
+            record.normalise()
+
+        zone_id = self.zone.id
+        with transaction.atomic():
+            for model, records in self.by_model(self.deleted.values()).items():
+                model.objects.filter(pk__in=[r.pk for r in records]).delete()
+            for model, records in self.by_model(self.updated.values()).items():
+                fields = [f.name for f in model._meta.concrete_fields if not f.primary_key and f.name != "zone"]
+                model.objects.bulk_update(records, fields)
+            for model, records in self.by_model(self.created).items():
+                model.objects.bulk_create(records)
+            models.DNSZoneJournal.record_changes(self.zone, self.journal_changes())
+            if rebuild:
+                transaction.on_commit(lambda: tasks.update_fzone.delay(zone_id))
+
+        return True
+
+
+class ZoneUpdate(RecordChanges):
+    """
+    The update section of an RFC 2136 message, run against one snapshot of the names it touches. Nothing
+    is written until commit(), so a refused update leaves nothing behind.
+    """
+
+    def __init__(self, zone: models.DNSZone, record_names: typing.Iterable[str]):
+        super().__init__(zone)
+        names = set()
+        for record_name in record_names:
+            names.add(record_name)
+            names.add(wildcard_name(record_name))
+
+        self.records = {}
+        for model in set(UPDATE_MODELS.values()) | set(OTHER_MODELS):
+            records = list(model.objects.filter(zone=zone, record_name__in=names))
+            for record in records:
+                record.zone = zone
+            self.records[model] = records
+
+        self.https_names = {}
+
+    def find(self, model: typing.Type[models.DNSZoneRecord], record_name: str) -> list:
+        # Same lookup as DnsServiceServicer.find_records, exact name first and then the wildcard
+        records = [r for r in self.records[model] if r.record_name == record_name]
+        if records:
+            return records
+        search_name = wildcard_name(record_name)
+        return [r for r in self.records[model] if r.record_name == search_name]
+
+    def has_https(self, record_name: str) -> bool:
+        if record_name not in self.https_names:
+            self.https_names[record_name] = grpc.DnsServiceServicer.any_https_records(
+                dnslib.DNSLabel(record_name), self.zone
+            )
+        return self.https_names[record_name]
+
+    def any_records(self, record_name: str, include_cname: bool = True) -> bool:
+        for model, records in self.records.items():
+            if not include_cname and model == models.CNAMERecord:
+                continue
+            if self.find(model, record_name):
+                return True
+        return self.has_https(record_name)
+
+    def has_cname(self, record_name: str) -> bool:
+        return any(r.record_name == record_name for r in self.records[models.CNAMERecord])
+
+    def remove(self, record: models.DNSZoneRecord):
+        self.records[type(record)].remove(record)
+        super().remove(record)
+
+    def add(self, rr: dnslib.RR, record_name: str):
+        # RFC 2136 § 3.4.2.2
+        if rr.rtype == QTYPE.CNAME:
+            if self.any_records(record_name, include_cname=False):
+                return
+        elif self.has_cname(record_name):
+            return
+
+        model = UPDATE_MODELS[rr.rtype]
+        for record in self.find(model, record_name):
+            if record.to_rr(rr.rname).rdata == rr.rdata:
+                self.modify(record)
+                record.update_from_rr(rr)
+                return
+
+        record = model.from_rr(rr, self.zone)
+        self.records[model].append(record)
+        self.create(record)
@@ -9,6 +9,7 @@ urlpatterns = [
     path("setup_domain_zone_list/", views.fzone.create_domain_zone_list, name="create_domain_zone_list"),
     path("zone/<str:zone_id>/", views.fzone.edit_zone, name="edit_zone"),
     path("zone/<str:zone_id>/import_zone_file/", views.fzone.import_zone_file, name="import_zone_file"),
+    path("zone/<str:zone_id>/import_zone_file/<str:job_id>/", views.fzone.zone_import_job, name="zone_import_job"),
     path("zone/<str:zone_id>/export_zone_file/", views.fzone.export_zone_file, name="export_zone_file"),
     path("zone/<str:zone_id>/generate_dmarc/", views.fzone.generate_dmarc, name="generate_dmarc"),
     path("zone/<str:zone_id>/create_blank_spf/", views.fzone.create_blank_spf, name="create_blank_spf"),
@@ -8,6 +8,7 @@ from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat
 from dns_grpc import models, tasks
 from django.conf import settings
+from django.db.models.functions import Reverse
 
 psl = publicsuffixlist.PublicSuffixList()
 
@@ -38,6 +39,14 @@ def get_feedback_url(description: str, reference: str):
     return data["public_url"]
 
 
+def get_owned_resources(user) -> list:
+    """
+    IDs of every Keycloak resource the user owns, in one call rather than looking up each resource's owner.
+    """
+    client_token = django_keycloak_auth.clients.get_access_token()
+    return django_keycloak_auth.clients.get_uma_client().resource_set_list(client_token, owner=user.username)
+
+
 def log_usage(user, extra=0, can_reject=True, off_session=True, redirect_uri=None):
     client_token = django_keycloak_auth.clients.get_access_token()
     resources = django_keycloak_auth.clients.get_uma_client().resource_set_list(client_token, owner=user.username)
@@ -108,12 +117,28 @@ def make_zone_digest(zone_name: str):
 
 
 def valid_zone(zone_root_txt):
-    zone_root = dnslib.DNSLabel(zone_root_txt)
-    other_zones = list(models.DNSZone.objects.all()) + list(models.SecondaryDNSZone.objects.all())
+    """
+    Checks a new zone against the public suffix list and against existing zones. A zone can't be created
+    under or over an existing one; both are looked up by index, one query for the zone and each of its
+    parents and one for any zone below it, so the check doesn't grow with the number of zones.
+    """
+    zone_root_txt = models.normalise_zone_root(zone_root_txt)
     if not psl.is_private(zone_root_txt):
         return "Zone not a publicly registrable domain"
-    else:
-        for zone in other_zones:
-            other_zone_root = dnslib.DNSLabel(zone.zone_root.lower())
-            if zone_root.matchSuffix(other_zone_root):
-                return "Same or more generic zone already exists"
+
+    # Compared as stored, see models.normalise_zone_root
+    labels = [label.decode().lower() for label in dnslib.DNSLabel(zone_root_txt).label]
+    zone_root = ".".join(labels)
+    parent_roots = [".".join(labels[i:]) for i in range(len(labels))]
+    # Names below the zone end with ".zone_root", i.e. their reversed name starts with it reversed. That's
+    # asked as a range rather than with startswith, as LIKE can't use a plain expression index under every
+    # collation. The prefix ends in a dot, so the range ends just before the next character, a slash.
+    child_prefix = f".{zone_root}"[::-1]
+    child_prefix_end = f"{child_prefix[:-1]}/"
+
+    for model in (models.DNSZone, models.SecondaryDNSZone):
+        if model.objects.filter(zone_root__in=parent_roots).exists():
+            return "Same or more generic zone already exists"
+        if model.objects.annotate(zone_root_reversed=Reverse("zone_root")) \
+                .filter(zone_root_reversed__gte=child_prefix, zone_root_reversed__lt=child_prefix_end).exists():
+            return "More specific zone already exists"
@@ -1,11 +1,15 @@
 import ipaddress
 import base64
+import copy
+import hmac
+import typing
 import uuid
+from django.db import transaction
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.views.decorators.csrf import csrf_exempt
-from .. import models
+from .. import models, tasks
 
 
 def get_ip(request):
@@ -38,6 +42,46 @@ def check_ip(request):
     return HttpResponse(get_ip(request), content_type="text/plain")
 
 
+def current_state(record_id: str) -> typing.Optional[dict]:
+    """
+    The record's addresses, password, name and zone in one query, without loading the zone itself.
+    """
+    return models.DynamicAddressRecord.objects.filter(id=record_id).values(
+        "current_ipv4", "current_ipv6", "password", "record_name", "zone_id", "zone__zone_root"
+    ).first()
+
+
+def check_password(stored_password: str, password: str) -> bool:
+    return hmac.compare_digest(stored_password.encode(), password.encode())
+
+
+def set_address(dyn_obj, client_ip):
+    """
+    Writes the new address without going through the model save hooks, so the zone's Keycloak resource
+    isn't resynced and the rebuild is batched with any other changes to the zone.
+    """
+    old_obj = copy.copy(dyn_obj)
+    if isinstance(client_ip, ipaddress.IPv4Address):
+        dyn_obj.current_ipv4 = str(client_ip)
+        update = {"current_ipv4": dyn_obj.current_ipv4}
+    else:
+        dyn_obj.current_ipv6 = str(client_ip)
+        update = {"current_ipv6": dyn_obj.current_ipv6}
+
+    with transaction.atomic():
+        models.DynamicAddressRecord.objects.filter(id=dyn_obj.id).update(**update)
+        models.DNSZoneJournal.record_change(dyn_obj.zone, old_obj, dyn_obj)
+        models.DNSZone.objects.filter(id=dyn_obj.zone_id).update(last_modified=timezone.now())
+        tasks.schedule_fzone_update(dyn_obj.zone_id)
+
+
+def address_field(client_ip) -> str:
+    if isinstance(client_ip, ipaddress.IPv4Address):
+        return "current_ipv4"
+    else:
+        return "current_ipv6"
+
+
 @csrf_exempt
 def update_ip(request):
     auth = get_header_auth(request)
@@ -46,11 +90,11 @@ def update_ip(request):
 
     username, password = auth
 
-    dyn_obj = models.DynamicAddressRecord.objects.filter(id=username).first()
-    if not dyn_obj:
+    state = current_state(username)
+    if not state:
         return HttpResponseBadRequest("nohost")
 
-    if dyn_obj.password != password:
+    if not check_password(state["password"], password):
         return HttpResponseForbidden("badauth")
 
     if request.method == "POST":
@@ -61,8 +105,9 @@ def update_ip(request):
     hostname = data.get("hostname")
     myip = data.get("myip")
 
-    if hostname != f"{dyn_obj.record_name}.{dyn_obj.zone.zone_root}":
-        if not (dyn_obj.record_name == "@" and hostname == dyn_obj.zone.zone_root):
+    zone_root = state["zone__zone_root"]
+    if hostname != f"{state['record_name']}.{zone_root}":
+        if not (state["record_name"] == "@" and hostname == zone_root):
             return HttpResponseBadRequest("nohost")
 
     client_ip = get_ip(request)
@@ -72,17 +117,12 @@ def update_ip(request):
         except ValueError:
             return HttpResponseBadRequest()
 
-    if isinstance(client_ip, ipaddress.IPv4Address):
-        if str(client_ip) == dyn_obj.current_ipv4:
-            return HttpResponse(f"nochg {dyn_obj.current_ipv4}")
-        dyn_obj.current_ipv4 = str(client_ip)
-    elif isinstance(client_ip, ipaddress.IPv6Address):
-        if str(client_ip) == dyn_obj.current_ipv6:
-            return HttpResponse(f"nochg {dyn_obj.current_ipv6}")
-        dyn_obj.current_ipv6 = str(client_ip)
+    if str(client_ip) == state[address_field(client_ip)]:
+        return HttpResponse(f"nochg {client_ip}")
 
-    dyn_obj.zone.last_modified = timezone.now()
-    dyn_obj.save()
-    dyn_obj.zone.save()
+    dyn_obj = models.DynamicAddressRecord.objects.select_related("zone").filter(id=username).first()
+    if not dyn_obj:
+        return HttpResponseBadRequest("nohost")
+    set_address(dyn_obj, client_ip)
 
     return HttpResponse(f"good {client_ip}")
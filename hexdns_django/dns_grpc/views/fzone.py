@@ -5,15 +5,14 @@ import secrets
 import requests
 import dnslib
 import django_keycloak_auth.clients
-from django.http import HttpResponse
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404, redirect, render, reverse
 from django.utils import timezone
 
-from .. import forms, models, tasks, utils
-from . import zone_checks
+from .. import forms, models, tasks, utils, zone_export, zone_import
+from . import zone_overview
 
 
 @login_required
@@ -227,8 +226,7 @@ def edit_zone(request, zone_id):
             "notice": request.session.pop("zone_notice", None),
             "dnskey": dnskey,
             "dnskey_key": base64.b64encode(dnskey.key).decode(),
-            "spf_status": zone_checks.check_spf(user_zone),
-            "dmarc_status": zone_checks.check_dmarc(user_zone),
+            **zone_overview.load_zone_overview(user_zone, request.GET),
         },
     )
 
@@ -1614,6 +1612,7 @@ def disable_zone_cds(request, zone_id):
         user_zone.cds_disable = True
         user_zone.last_modified = timezone.now()
         user_zone.save()
+        models.DNSZoneJournal.invalidate(user_zone)
         return redirect('edit_zone_cds', user_zone.id)
 
     return render(
@@ -1636,6 +1635,7 @@ def enable_zone_cds(request, zone_id):
     user_zone.cds_disable = False
     user_zone.last_modified = timezone.now()
     user_zone.save()
+    models.DNSZoneJournal.invalidate(user_zone)
     return redirect('edit_zone_cds', user_zone.id)
 
 
@@ -2120,18 +2120,6 @@ def delete_zone_custom_ns_record(request, record_id):
     )
 
 
-def long_txt_from_zone(rd, _origin=None):
-    parts = list(map(lambda d: d.encode(), rd))
-    out = []
-    for p in parts:
-        out.extend([p[n:n+255] for n in range(0, len(p), 255)])
-
-    return dnslib.TXT(out)
-
-
-dnslib.TXT.fromZone = long_txt_from_zone
-
-
 @login_required
 def import_zone_file(request, zone_id):
     access_token = django_keycloak_auth.clients.get_active_access_token(oidc_profile=request.user.oidc_profile)
@@ -2143,13 +2131,10 @@ def import_zone_file(request, zone_id):
     if request.method == "POST":
         import_form = forms.ZoneImportForm(request.POST)
         if import_form.is_valid():
-            zone_data = import_form.cleaned_data["zone_data"]
-            try:
-                zone_obj.import_zone_file(zone_data, overwrite=import_form.cleaned_data['overwrite'])
-            except ValueError as e:
-                import_form.errors["zone_data"] = (str(e),)
-            else:
-                return redirect('edit_zone', zone_id)
+            job = zone_import.create_job(
+                zone_obj, import_form.cleaned_data["zone_data"], overwrite=import_form.cleaned_data['overwrite']
+            )
+            return redirect('zone_import_job', zone_id, job.id)
     else:
         import_form = forms.ZoneImportForm()
 
@@ -2160,6 +2145,19 @@ def import_zone_file(request, zone_id):
     )
 
 
+@login_required
+def zone_import_job(request, zone_id, job_id):
+    access_token = django_keycloak_auth.clients.get_active_access_token(oidc_profile=request.user.oidc_profile)
+    job = get_object_or_404(models.DNSZoneImportJob.objects.select_related("zone"), id=job_id, zone_id=zone_id)
+
+    if not job.zone.has_scope(access_token, 'view'):
+        raise PermissionDenied
+
+    return render(request, "dns_grpc/fzone/zone_import.html", {
+        "job": job,
+    })
+
+
 @login_required
 def export_zone_file(request, zone_id):
     access_token = django_keycloak_auth.clients.get_active_access_token(oidc_profile=request.user.oidc_profile)
@@ -2168,40 +2166,7 @@ def export_zone_file(request, zone_id):
     if not zone_obj.has_scope(access_token, 'view'):
         raise PermissionDenied
 
-    zone_out = [
-        f"$ORIGIN {zone_obj.zone_root}"
-    ]
-
-    for ns in zone_obj.custom_ns.all():
-        zone_out.append(dnslib.RR("@", dnslib.QTYPE.NS, rdata=dnslib.NS(ns.nameserver), ttl=86400).toZone())
-
-    for record in zone_obj.dynamicaddressrecord_set.all():
-        v4_rr = record.to_rr_v4(record.dns_label)
-        v6_rr = record.to_rr_v4(record.dns_label)
-        if v4_rr:
-            zone_out.append(v4_rr.toZone())
-        if v6_rr:
-            zone_out.append(v6_rr.toZone())
-
-    for record_type in (
-            zone_obj.addressrecord_set, zone_obj.cnamerecord_set, zone_obj.mxrecord_set, zone_obj.nsrecord_set,
-            zone_obj.txtrecord_set, zone_obj.srvrecord_set, zone_obj.caarecord_set, zone_obj.naptrrecord_set,
-            zone_obj.dsrecord_set, zone_obj.locrecord_set, zone_obj.hinforecord_set, zone_obj.rprecord_set,
-            zone_obj.httpsrecord_set,
-    ):
-        for record in record_type.all():
-            zone_out.append(record.to_rr(record.dns_label).toZone())
-
-    for record in zone_obj.sshfprecord_set.all():
-        zone_out.extend(map(lambda r: r.toZone(), record.to_rrs(record.dns_label)))
-
-    for record in zone_obj.githubpagesrecord_set.all():
-        zone_out.extend(map(lambda r: r.toZone(), record.to_rrs_v4(record.dns_label)))
-        zone_out.extend(map(lambda r: r.toZone(), record.to_rrs_v6(record.dns_label)))
-
-    resp = HttpResponse("\n".join(zone_out), status=200, content_type="text/dns")
-    resp["Content-Disposition"] = f'attachment; filename="{zone_obj.zone_root}.txt'
-    return resp
+    return zone_export.export_response(zone_obj, compress=request.GET.get("compress") == "gzip")
 
 
 @login_required
@@ -1,5 +1,6 @@
 import enum
 import ipaddress
+import typing
 from .. import models
 
 
@@ -26,9 +27,15 @@ class DMARCStatus(enum.Enum):
 
 
 def check_spf(zone: models.DNSZone) -> SPFStatus:
-    records = zone.txtrecord_set.filter(record_name="@")
+    return spf_status(zone.txtrecord_set.filter(record_name="@"))
+
+
+def spf_status(records: typing.Iterable[models.TXTRecord]) -> SPFStatus:
+    """
+    SPF status of the zone from its TXT records, any not at the zone root are ignored.
+    """
     records = list(filter(
-        lambda r: r.data.startswith("v=spf1 ") or r.data == "v=spf1", records
+        lambda r: r.record_name == "@" and (r.data.startswith("v=spf1 ") or r.data == "v=spf1"), records
     ))
     if len(records) == 0:
         return SPFStatus.NotPresent
@@ -92,7 +99,14 @@ def check_spf(zone: models.DNSZone) -> SPFStatus:
 
 
 def check_dmarc(zone: models.DNSZone) -> DMARCStatus:
-    records = list(zone.txtrecord_set.filter(record_name="_dmarc"))
+    return dmarc_status(zone.txtrecord_set.filter(record_name="_dmarc"))
+
+
+def dmarc_status(records: typing.Iterable[models.TXTRecord]) -> DMARCStatus:
+    """
+    DMARC status of the zone from its TXT records, any not at _dmarc are ignored.
+    """
+    records = list(filter(lambda r: r.record_name == "_dmarc", records))
     if len(records) == 0:
         return DMARCStatus.NotPresent
     elif len(records) > 1:
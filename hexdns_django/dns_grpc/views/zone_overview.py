@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.http import QueryDict
+from .. import models
+from . import zone_checks
+
+# Tables on the zone page, by the name their page number is given under
+RECORD_TABLES = (
+    ("address", "addressrecord_set"),
+    ("dynamic_address", "dynamicaddressrecord_set"),
+    ("aname", "anamerecord_set"),
+    ("redirect", "redirectrecord_set"),
+    ("github_pages", "githubpagesrecord_set"),
+    ("cname", "cnamerecord_set"),
+    ("mx", "mxrecord_set"),
+    ("ns", "nsrecord_set"),
+    ("txt", "txtrecord_set"),
+    ("https", "httpsrecord_set"),
+    ("srv", "srvrecord_set"),
+    ("caa", "caarecord_set"),
+    ("naptr", "naptrrecord_set"),
+    ("sshfp", "sshfprecord_set"),
+    ("ds", "dsrecord_set"),
+    ("dnskey", "dnskeyrecord_set"),
+    ("loc", "locrecord_set"),
+    ("hinfo", "hinforecord_set"),
+    ("rp", "rprecord_set"),
+    ("dhcid", "dhcidrecord_set"),
+)
+
+
+class RecordTable:
+    """
+    One page of one record type. A row past the end of the page is fetched to tell whether there's
+    another, so each table is a single query with no count.
+    """
+
+    def __init__(self, name: str, records: list, page: int, page_size: int, query: QueryDict):
+        self.name = name
+        self.records = records[:page_size]
+        self.page = page
+        self.has_next = len(records) > page_size
+        self.has_previous = page > 1
+        self.query = query
+
+    @property
+    def complete(self) -> bool:
+        # Every record of the type is on this page
+        return self.page == 1 and not self.has_next
+
+    def page_url(self, page: int) -> str:
+        query = self.query.copy()
+        query[f"{self.name}_page"] = page
+        return f"?{query.urlencode()}"
+
+    @property
+    def next_url(self) -> str:
+        return self.page_url(self.page + 1)
+
+    @property
+    def previous_url(self) -> str:
+        return self.page_url(self.page - 1)
+
+
+def page_number(query: QueryDict, name: str) -> int:
+    try:
+        return max(1, int(query.get(f"{name}_page", 1)))
+    except ValueError:
+        return 1
+
+
+def load_zone_overview(zone: models.DNSZone, query: QueryDict) -> dict:
+    """
+    Everything the zone page shows: a page of each record type, one query per type, and the SPF and DMARC
+    status worked out from the TXT records.
+    """
+    page_size = settings.ZONE_PAGE_SIZE
+    tables = {}
+    for name, record_set in RECORD_TABLES:
+        page = page_number(query, name)
+        offset = (page - 1) * page_size
+        records = getattr(zone, record_set).order_by("record_name", "pk")[offset:offset + page_size + 1]
+        tables[name] = RecordTable(name, list(records), page, page_size, query)
+
+    if tables["txt"].complete:
+        txt_records = tables["txt"].records
+    else:
+        txt_records = list(zone.txtrecord_set.filter(record_name__in=("@", "_dmarc")))
+
+    return {
+        "records": tables,
+        "spf_status": zone_checks.spf_status(txt_records),
+        "dmarc_status": zone_checks.dmarc_status(txt_records),
+    }
@@ -0,0 +1,202 @@
+import base64
+import binascii
+import collections
+import typing
+import dnslib
+from dnslib import QTYPE
+from . import models, zone_import
+
+# Written by generate_zone_header from zone settings rather than records, so there's nothing to compare
+# them against
+HEADER_TYPES = (QTYPE.SOA, QTYPE.NS, QTYPE.CDS, QTYPE.CDNSKEY)
+
+RRSetKey = typing.Tuple[str, int]
+RRSets = typing.Dict[RRSetKey, typing.Set[typing.Tuple[int, bytes]]]
+
+
+class CanonicalBuffer(dnslib.DNSBuffer):
+    """
+    Packs names in full, so the same rdata gives the same bytes whatever was packed before it.
+    """
+
+    def encode_name(self, name):
+        self.encode_name_nocompress(name)
+
+
+def rdata_bytes(rr: dnslib.RR) -> bytes:
+    buffer = CanonicalBuffer()
+    rr.rdata.pack(buffer)
+    return bytes(buffer.data)
+
+
+def rrset_key(rr: dnslib.RR) -> RRSetKey:
+    return str(rr.rname).lower(), rr.rtype
+
+
+def format_key(key: RRSetKey) -> str:
+    return f"{key[0]} {QTYPE.get(key[1])}"
+
+
+def rrsets_from_rrs(rrs: typing.Iterable[dnslib.RR]) -> RRSets:
+    rrsets = collections.defaultdict(set)
+    for rr in rrs:
+        rrsets[rrset_key(rr)].add((rr.ttl, rdata_bytes(rr)))
+    return dict(rrsets)
+
+
+def owner_name(name: str, origin: dnslib.DNSLabel) -> dnslib.DNSLabel:
+    if name == "@":
+        return origin
+    elif name.endswith("."):
+        return dnslib.DNSLabel(name)
+    return origin.add(name)
+
+
+def parse_line(line: str, origin: dnslib.DNSLabel) -> dnslib.RR:
+    """
+    Parses one "name ttl class type rdata" line. dnslib.ZoneParser handles the types it knows, the
+    RFC 3597 generic form and the types it has no presentation format for (HINFO, DHCID) are done here.
+    TXT strings are split as an import would, see zone_import.ZoneParser.
+    """
+    parts = line.split(None, 4)
+    if len(parts) != 5:
+        raise ValueError("expected owner, TTL, class, type and rdata")
+    name, ttl, rclass, rtype, rdata = parts
+    if rtype.upper().startswith("TYPE"):
+        rtype_num = int(rtype[4:])
+    else:
+        rtype_num = getattr(QTYPE, rtype.upper())
+
+    if rdata.startswith("\\#"):
+        generic = rdata.split()
+        data = bytes.fromhex("".join(generic[2:]))
+        if len(data) != int(generic[1]):
+            raise ValueError(f"generic rdata is {len(data)} bytes, not the {generic[1]} given")
+        return dnslib.RR(owner_name(name, origin), rtype_num, ttl=int(ttl), rdata=dnslib.RD(data))
+    elif rtype_num == QTYPE.DHCID:
+        return dnslib.RR(
+            owner_name(name, origin), rtype_num, ttl=int(ttl),
+            rdata=dnslib.RD(base64.b64decode("".join(rdata.split()), validate=True))
+        )
+    elif rtype_num == QTYPE.HINFO:
+        # Two character-strings, the same wire format as a TXT with two strings
+        rr = next(iter(zone_import.ZoneParser(f"{name} {ttl} {rclass} TXT {rdata}", origin=origin)))
+        rr.rtype = QTYPE.HINFO
+        return rr
+
+    return next(iter(zone_import.ZoneParser(line, origin=origin)))
+
+
+def parse_zone_file(zone_file: str, origin: dnslib.DNSLabel):
+    """
+    Parses a zone file line by line, so one bad record is reported without losing the rest of the file.
+    Returns the RRs that parsed and (line number, line, error) for those that didn't.
+    """
+    rrs = []
+    errors = []
+    for i, line in enumerate(zone_file.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith(";"):
+            continue
+        if line.startswith("$ORIGIN"):
+            origin = dnslib.DNSLabel(line.split()[1])
+            continue
+        try:
+            rrs.append(parse_line(line, origin))
+        except (dnslib.DNSError, ValueError, IndexError, AttributeError, StopIteration, binascii.Error) as e:
+            errors.append((i, line, f"{type(e).__name__}: {e}"))
+    return rrs, errors
+
+
+def import_zone_file(zone_file: str, zone_root: str) -> typing.Tuple[typing.List[dnslib.RR], typing.List[str]]:
+    """
+    The RRs of the records a zone file import would make of the file, worked out without the database.
+    Returns them along with the errors the import would report.
+    """
+    zone = models.DNSZone(zone_root=zone_root.rstrip("."))
+    rrs = []
+    errors = []
+    try:
+        parsed = list(zone_import.parse_records(zone_file, dnslib.DNSLabel(zone_root)))
+    except ValueError as e:
+        return rrs, [str(e)]
+
+    for rr in parsed:
+        try:
+            record = zone_import.record_from_rr(rr, zone)
+        except (dnslib.DNSError, ValueError, TypeError) as e:
+            errors.append(f"{rr.toZone()}: {e}")
+            continue
+        if record is not None:
+            rrs.extend(record.zone_rrs())
+    return rrs, errors
+
+
+def importable(rrsets: RRSets) -> RRSets:
+    return {key: value for key, value in rrsets.items() if key[1] in zone_import.IMPORT_MODELS}
+
+
+def find_duplicates(rrs: typing.List[dnslib.RR]) -> typing.List[str]:
+    seen = collections.Counter((rrset_key(rr), rdata_bytes(rr)) for rr in rrs)
+    return sorted(
+        f"{format_key(key)} {data.hex()} (x{count})" for (key, data), count in seen.items() if count > 1
+    )
+
+
+def compare_rrsets(actual: RRSets, expected: RRSets, skip_names: typing.Collection[str] = ()) -> dict:
+    """
+    Differences between two sets of RRsets, ignoring the zone header and owners in skip_names.
+    """
+    missing = []
+    unexpected = []
+    different = []
+    for key in sorted(set(actual) | set(expected)):
+        if key[1] in HEADER_TYPES or key[0] in skip_names:
+            continue
+        if key not in actual:
+            missing.append(format_key(key))
+        elif key not in expected:
+            unexpected.append(format_key(key))
+        elif actual[key] != expected[key]:
+            different.append(format_key(key))
+    return {"missing": missing, "unexpected": unexpected, "different": different}
+
+
+def check_zone(
+        zone_root: str, generated: str, exported: str, expected: RRSets, expected_export: RRSets,
+        skip_names: typing.Collection[str]
+) -> dict:
+    """
+    Checks one zone, run in the worker processes so it mustn't touch the database. The generated zone file
+    and the export are each compared with the RRsets the records say they make, the export only with the
+    record types it covers. The export is also imported again, and the records that would make compared
+    with those of the types the import takes.
+    """
+    origin = dnslib.DNSLabel(zone_root)
+
+    generated_rrs, generated_errors = parse_zone_file(generated, origin)
+    exported_rrs, exported_errors = parse_zone_file(exported, origin)
+    imported_rrs, import_errors = import_zone_file(exported, zone_root)
+
+    result = {
+        "zone": zone_root,
+        "records": len(generated_rrs),
+        "parse_errors": [f"line {i}: {error}: {line}" for i, line, error in generated_errors],
+        "duplicates": find_duplicates(generated_rrs),
+        "export_parse_errors": [f"line {i}: {error}: {line}" for i, line, error in exported_errors],
+    }
+    result.update(compare_rrsets(rrsets_from_rrs(generated_rrs), expected, skip_names))
+    result.update({
+        f"export_{k}": v for k, v in
+        compare_rrsets(rrsets_from_rrs(exported_rrs), expected_export, skip_names).items()
+    })
+    result["import_errors"] = import_errors
+    result.update({
+        f"import_{k}": v for k, v in
+        compare_rrsets(rrsets_from_rrs(imported_rrs), importable(expected_export), skip_names).items()
+    })
+    return result
+
+
+def has_problems(result: dict) -> bool:
+    return any(v for k, v in result.items() if isinstance(v, list))
@@ -0,0 +1,43 @@
+import typing
+import zlib
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from . import models
+
+
+def export_chunks(zone: models.DNSZone) -> typing.Iterator[bytes]:
+    """
+    The exported zone file in pieces of about ZONE_EXPORT_CHUNK_SIZE bytes, so the first records go out
+    while later ones are still being read.
+    """
+    lines = []
+    size = 0
+    for line in zone.export_lines(batch_size=settings.ZONE_EXPORT_BATCH_SIZE):
+        data = f"{line}\n".encode()
+        lines.append(data)
+        size += len(data)
+        if size >= settings.ZONE_EXPORT_CHUNK_SIZE:
+            yield b"".join(lines)
+            lines = []
+            size = 0
+    if lines:
+        yield b"".join(lines)
+
+
+def gzip_chunks(chunks: typing.Iterable[bytes]) -> typing.Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        # Flushed each chunk, so compression doesn't hold back what's been read
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def export_response(zone: models.DNSZone, compress: bool = False) -> StreamingHttpResponse:
+    filename = f"{zone.zone_root}.txt"
+    if compress:
+        resp = StreamingHttpResponse(gzip_chunks(export_chunks(zone)), content_type="application/gzip")
+        filename += ".gz"
+    else:
+        resp = StreamingHttpResponse(export_chunks(zone), content_type="text/dns")
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
@@ -0,0 +1,276 @@
+import io
+import logging
+import typing
+import dnslib
+from celery import shared_task
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from dnslib import QTYPE
+from . import models, tasks, update
+
+logger = logging.getLogger(__name__)
+
+# Record types a zone file import creates, anything else in the file is skipped
+IMPORT_MODELS = {
+    QTYPE.A: models.AddressRecord,
+    QTYPE.AAAA: models.AddressRecord,
+    QTYPE.CNAME: models.CNAMERecord,
+    QTYPE.MX: models.MXRecord,
+    QTYPE.NS: models.NSRecord,
+    QTYPE.TXT: models.TXTRecord,
+    QTYPE.SRV: models.SRVRecord,
+    QTYPE.CAA: models.CAARecord,
+    QTYPE.NAPTR: models.NAPTRRecord,
+    QTYPE.DNSKEY: models.DNSKEYRecord,
+}
+# Emptied before an overwriting import
+OVERWRITE_MODELS = (
+    models.AddressRecord, models.CNAMERecord, models.MXRecord, models.NSRecord, models.TXTRecord,
+    models.SRVRecord, models.CAARecord, models.NAPTRRecord, models.DNSKEYRecord,
+)
+
+
+def long_txt_from_zone(rd, _origin=None):
+    parts = list(map(lambda d: d.encode(), rd))
+    out = []
+    for p in parts:
+        out.extend([p[n:n+255] for n in range(0, len(p), 255)])
+
+    return dnslib.TXT(out)
+
+
+class ZoneParser(dnslib.ZoneParser):
+    """
+    Zone files may hold TXT strings longer than one character-string, imports split them rather than
+    refusing the file.
+    """
+
+    def parse_rr(self, rr):
+        label = self.parse_label(rr.pop(0))
+        ttl = int(rr.pop(0)) if rr[0].isdigit() else self.ttl
+        rclass = rr.pop(0) if rr[0] in ('IN', 'CH', 'HS') else 'IN'
+        rtype = rr.pop(0)
+        if rtype == "TXT":
+            rdata = long_txt_from_zone(rr)
+        else:
+            rdata = dnslib.RDMAP.get(rtype, dnslib.RD).fromZone(rr, self.origin)
+        return dnslib.RR(
+            rname=label, ttl=ttl, rclass=getattr(dnslib.CLASS, rclass), rtype=getattr(QTYPE, rtype), rdata=rdata
+        )
+
+
+def parse_records(
+        zone_data: typing.Union[str, typing.TextIO], origin: dnslib.DNSLabel
+) -> typing.Iterator[dnslib.RR]:
+    """
+    Records of the zone file as they're parsed, rather than all at once. Given a file, it's read as it's
+    parsed too.
+    """
+    try:
+        yield from ZoneParser(zone_data, origin=origin)
+    except (dnslib.DNSError, ValueError, IndexError) as e:
+        raise ValueError(f"Invalid zone file: {str(e)}")
+
+
+def record_from_rr(rr: dnslib.RR, zone: models.DNSZone) -> typing.Optional[models.DNSZoneRecord]:
+    """
+    The record an import makes of the RR, None for types it doesn't import. Raises if the RR doesn't fit
+    the record.
+    """
+    model = IMPORT_MODELS.get(rr.rtype) if rr.rclass == dnslib.CLASS.IN else None
+    if model is None:
+        return None
+    record = model.from_rr(rr, zone)
+    if record.ttl <= 1:
+        record.ttl = 3600
+    return record
+
+
+def create_job(zone: models.DNSZone, zone_data: str, overwrite: bool) -> models.DNSZoneImportJob:
+    job = models.DNSZoneImportJob(zone=zone, overwrite=overwrite)
+    # Kept in object storage rather than the job's row, uploads can run to megabytes
+    job.zone_file.save("upload.zone", ContentFile(zone_data.encode()), save=False)
+    job.save()
+    transaction.on_commit(lambda: run_import_job.delay(job.id))
+    return job
+
+
+class ZoneImport:
+    """
+    Runs an import job. The file is parsed through once before anything is written, so a file that doesn't
+    parse changes nothing, then again to write the records in batches of ZONE_IMPORT_BATCH_SIZE. Batches
+    adding to the zone are their own transactions and save the job's progress. An overwriting import is all
+    or nothing, its delete and every batch are one transaction, so a failure leaves the old records in place.
+    The zone is rebuilt once at the end.
+    """
+
+    def __init__(self, job: models.DNSZoneImportJob):
+        self.job = job
+        self.zone = job.zone
+        self.origin = dnslib.DNSLabel(self.zone.zone_root)
+        self.overwrite_pending = job.overwrite
+
+    def save_progress(self, *fields):
+        self.job.save(update_fields=["last_modified", *fields])
+
+    def add_error(self, rr: typing.Optional[dnslib.RR], error: str):
+        if len(self.job.errors) < settings.ZONE_IMPORT_MAX_ERRORS:
+            self.job.errors.append({"record": rr.toZone() if rr else None, "error": error})
+
+    def records(self) -> typing.Iterator[dnslib.RR]:
+        # Decoded and parsed as it's read from storage, so the upload is never held in memory whole
+        with self.job.zone_file.storage.open(self.job.zone_file.name, "rb") as f:
+            yield from parse_records(io.TextIOWrapper(f, encoding="utf-8"), self.origin)
+
+    def finish(self, state: str):
+        self.job.state = state
+        if self.job.zone_file:
+            self.job.zone_file.delete(save=False)
+        self.save_progress(
+            "state", "zone_file", "records_total", "records_parsed", "records_imported", "records_skipped",
+            "errors"
+        )
+
+    def check(self) -> bool:
+        count = 0
+        try:
+            for _ in self.records():
+                count += 1
+                if count % settings.ZONE_IMPORT_BATCH_SIZE == 0:
+                    self.job.records_parsed = count
+                    self.save_progress("records_parsed")
+        except OSError as e:
+            self.add_error(None, f"Uploaded zone file can't be read: {type(e).__name__}")
+            return False
+        except ValueError as e:
+            self.job.records_parsed = count
+            self.add_error(None, f"{e} (after {count} records)")
+            return False
+
+        self.job.records_parsed = self.job.records_total = count
+        self.save_progress("records_parsed", "records_total")
+        return True
+
+    def make_record(self, rr: dnslib.RR) -> typing.Optional[models.DNSZoneRecord]:
+        try:
+            return record_from_rr(rr, self.zone)
+        except (dnslib.DNSError, ValueError, TypeError) as e:
+            self.add_error(rr, str(e))
+            return None
+
+    def write_batch(self, rrs: typing.List[dnslib.RR]):
+        changes = update.RecordChanges(self.zone)
+        cnames = {}
+        for rr in rrs:
+            record = self.make_record(rr)
+            if record is None:
+                continue
+            # A name has one CNAME, the last one in the file wins
+            if isinstance(record, models.CNAMERecord):
+                record_name = record.record_name.lower()
+                if record_name in cnames:
+                    changes.remove(cnames[record_name])
+                cnames[record_name] = record
+            changes.create(record)
+
+        with transaction.atomic():
+            if self.overwrite_pending:
+                for model in OVERWRITE_MODELS:
+                    model.objects.filter(zone=self.zone).delete()
+                models.DNSZoneJournal.invalidate(self.zone)
+                self.overwrite_pending = False
+            for record in models.CNAMERecord.objects.filter(zone=self.zone, record_name__in=list(cnames)):
+                record.zone = self.zone
+                changes.remove(record)
+            changes.commit(rebuild=False)
+
+        self.job.records_imported += len(changes.created)
+        self.job.records_skipped += len(rrs) - len(changes.created)
+        # Progress written inside an overwrite's transaction wouldn't be seen until it's over, and would hold
+        # the job's row against the status page polling it
+        if not self.job.overwrite:
+            self.save_progress("records_imported", "records_skipped", "errors")
+
+    def write_records(self):
+        batch = []
+        for rr in self.records():
+            batch.append(rr)
+            if len(batch) >= settings.ZONE_IMPORT_BATCH_SIZE:
+                self.write_batch(batch)
+                batch = []
+        if batch or self.overwrite_pending:
+            self.write_batch(batch)
+
+    def run(self):
+        if not self.check():
+            self.finish(models.DNSZoneImportJob.STATE_FAILED)
+            return
+
+        try:
+            if self.job.overwrite:
+                with transaction.atomic():
+                    self.write_records()
+            else:
+                self.write_records()
+        except Exception as e:
+            logger.exception("Zone import %s failed", self.job.id)
+            if self.job.overwrite:
+                # Rolled back, the zone is as it was
+                self.job.records_imported = 0
+                self.job.records_skipped = 0
+                self.add_error(None, f"Import stopped, no records were changed: {type(e).__name__}")
+            else:
+                self.add_error(
+                    None, f"Import stopped after {self.job.records_imported} records: {type(e).__name__}"
+                )
+            self.finish(models.DNSZoneImportJob.STATE_FAILED)
+        else:
+            self.finish(models.DNSZoneImportJob.STATE_COMPLETE)
+
+        # A failed overwrite was rolled back, so there's nothing to publish
+        overwritten = self.job.overwrite and self.job.state == models.DNSZoneImportJob.STATE_COMPLETE
+        if self.job.records_imported or overwritten:
+            models.DNSZone.objects.filter(id=self.zone.id).update(last_modified=timezone.now())
+            tasks.update_fzone.delay(self.zone.id)
+
+
+# Not retried, a failed import reports its error on the job instead
+@shared_task(ignore_result=True)
+def run_import_job(job_id: str):
+    # Claimed by moving it out of pending, so a redelivered task doesn't import the file twice
+    if not models.DNSZoneImportJob.objects.filter(
+            id=job_id, state=models.DNSZoneImportJob.STATE_PENDING
+    ).update(state=models.DNSZoneImportJob.STATE_RUNNING):
+        return
+    job = models.DNSZoneImportJob.objects.select_related("zone").get(id=job_id)
+    ZoneImport(job).run()
+
+
+def fail_stale_jobs() -> int:
+    """
+    Fails running jobs nothing has been heard from for ZONE_IMPORT_STALE_AFTER, left behind by a worker
+    that died, so their status pages stop waiting. Returns how many there were.
+    """
+    stale_jobs = models.DNSZoneImportJob.objects.select_related("zone").filter(
+        state=models.DNSZoneImportJob.STATE_RUNNING,
+        last_modified__lt=timezone.now() - settings.ZONE_IMPORT_STALE_AFTER,
+    )
+    count = 0
+    for job in stale_jobs:
+        importer = ZoneImport(job)
+        if job.overwrite:
+            # Its transaction went with the worker
+            job.records_imported = 0
+            job.records_skipped = 0
+            importer.add_error(None, "Import stopped, no records were changed")
+        else:
+            importer.add_error(None, f"Import stopped after {job.records_imported} records")
+        importer.finish(models.DNSZoneImportJob.STATE_FAILED)
+        if job.records_imported:
+            # Batches are committed without rebuilding, the rebuild at the end never came
+            models.DNSZone.objects.filter(id=job.zone_id).update(last_modified=timezone.now())
+            tasks.update_fzone.delay(job.zone_id)
+        count += 1
+    return count
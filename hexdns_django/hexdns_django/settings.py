@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import datetime
 import json
 import logging
 import sentry_sdk
@@ -68,6 +69,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django_keycloak_auth.middleware.OIDCMiddleware",
+    "dns_grpc.keycloak_cache.RequestMemoMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -103,8 +105,12 @@ GRPCSERVER = {
         "dns_grpc.grpc.grpc_hook",
         "dns_grpc.axfr.grpc_hook",
     ],
+    "interceptors": [
+        "dns_grpc.metrics.MetricsInterceptor",
+    ],
     "maximum_concurrent_rpcs": None,
 }
+GRPC_METRICS_PORT = int(os.getenv("GRPC_METRICS_PORT", 9090))
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
@@ -167,6 +173,36 @@ AWS_S3_ADDRESSING_STYLE = "virtual"
 AWS_S3_SIGNATURE_VERSION = "s3v4"
 
 ZONE_STORAGE_BUCKET = os.getenv("S3_ZONE_BUCKET", "")
+ZONE_IMPORT_STORAGE_BUCKET = os.getenv("S3_ZONE_IMPORT_BUCKET", "")
+
+ZONE_JOURNAL_MAX_VERSIONS = int(os.getenv("ZONE_JOURNAL_MAX_VERSIONS", 100))
+ZONE_JOURNAL_MAX_AGE = datetime.timedelta(days=int(os.getenv("ZONE_JOURNAL_MAX_AGE_DAYS", 14)))
+
+ZONE_REBUILD_WINDOW = datetime.timedelta(seconds=int(os.getenv("ZONE_REBUILD_WINDOW", 30)))
+
+REDIRECT_CACHE_TTL = int(os.getenv("REDIRECT_CACHE_TTL", 300))
+REDIRECT_CACHE_NEGATIVE_TTL = int(os.getenv("REDIRECT_CACHE_NEGATIVE_TTL", 60))
+REDIRECT_CACHE_SIZE = int(os.getenv("REDIRECT_CACHE_SIZE", 100000))
+REDIRECT_CACHE_CHECK_INTERVAL = int(os.getenv("REDIRECT_CACHE_CHECK_INTERVAL", 5))
+
+TSIG_KEY_CACHE_TTL = int(os.getenv("TSIG_KEY_CACHE_TTL", 300))
+TSIG_KEY_CACHE_SIZE = int(os.getenv("TSIG_KEY_CACHE_SIZE", 10000))
+TSIG_KEY_CACHE_CHECK_INTERVAL = int(os.getenv("TSIG_KEY_CACHE_CHECK_INTERVAL", 5))
+
+BULK_RECORD_MAX_OPERATIONS = int(os.getenv("BULK_RECORD_MAX_OPERATIONS", 10000))
+
+ZONE_EXPORT_BATCH_SIZE = int(os.getenv("ZONE_EXPORT_BATCH_SIZE", 1000))
+ZONE_EXPORT_CHUNK_SIZE = int(os.getenv("ZONE_EXPORT_CHUNK_SIZE", 65536))
+ZONE_IMPORT_BATCH_SIZE = int(os.getenv("ZONE_IMPORT_BATCH_SIZE", 1000))
+ZONE_IMPORT_MAX_ERRORS = int(os.getenv("ZONE_IMPORT_MAX_ERRORS", 100))
+ZONE_IMPORT_STALE_AFTER = datetime.timedelta(minutes=int(os.getenv("ZONE_IMPORT_STALE_AFTER_MINUTES", 60)))
+ZONE_PAGE_SIZE = int(os.getenv("ZONE_PAGE_SIZE", 100))
+
+API_RECORD_PAGE_SIZE = int(os.getenv("API_RECORD_PAGE_SIZE", 100))
+API_RECORD_MAX_PAGE_SIZE = int(os.getenv("API_RECORD_MAX_PAGE_SIZE", 1000))
+
+KEYCLOAK_CACHE_TTL = int(os.getenv("KEYCLOAK_CACHE_TTL", 30))
+KEYCLOAK_CACHE_SIZE = int(os.getenv("KEYCLOAK_CACHE_SIZE", 100000))
 
 STORAGES = {
     "default": {"BACKEND": "storages.backends.s3boto3.S3Boto3Storage"},
@@ -242,6 +278,8 @@ CELERY_RESULT_BACKEND = "rpc://"
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 CELERY_TASK_SERIALIZER = "json"
 CELERY_ACCEPT_CONTENT = ["json"]
+# Task modules other than tasks.py, which autodiscovery finds on its own
+CELERY_IMPORTS = ["dns_grpc.zone_import"]
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [